@@ -0,0 +1,94 @@
+"""
+Shared driver for backfill commands that walk a table in primary-key order.
+
+A command subclasses ``PkBatchCommand``, returns the rows to walk from
+``get_queryset`` and applies its change to one batch in ``update_batch``.
+The base class owns the ``--batch-size``/``--dry-run`` options, the
+``last_pk`` cursor, the progress line and the dry-run branch.
+"""
+import time
+from abc import ABCMeta, abstractmethod
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class PkBatchCommand(BaseCommand, metaclass=ABCMeta):
+    default_batch_size = 2000
+    batch_size_flags = ('--batch-size',)
+    batch_size_help = 'Rows handled per batch'
+    dry_run_help = 'Only count rows that would be changed'
+    # Printed instead of calling ``finish`` when there is nothing to walk;
+    # set to None when ``finish`` has work of its own to do regardless.
+    empty_message = 'Nothing to backfill.'
+    progress_verb = 'changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            *self.batch_size_flags,
+            dest='batch_size',
+            type=int,
+            default=self.default_batch_size,
+            help=self.batch_size_help,
+        )
+        parser.add_argument('--dry-run', action='store_true', help=self.dry_run_help)
+
+    @abstractmethod
+    def get_queryset(self, opts):
+        """Rows to walk; batches are taken from it in primary-key order."""
+
+    @abstractmethod
+    def update_batch(self, batch, opts):
+        """Apply the change to the ``batch`` queryset and return the rows changed."""
+
+    def count_batch(self, batch, opts):
+        """Rows ``update_batch`` would change; used by ``--dry-run``."""
+        return batch.count()
+
+    def validate(self, opts):
+        """Hook for command-specific option checks."""
+
+    def finish(self, changed, opts):
+        """Report the result once every batch has been handled."""
+        if opts['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {changed} row(s) would be {self.progress_verb}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{changed} row(s) {self.progress_verb}.'))
+
+    def handle(self, *args, **opts):
+        batch_size = opts['batch_size']
+        if batch_size <= 0:
+            raise CommandError(f'{self.batch_size_flags[0]} must be positive.')
+        self.validate(opts)
+
+        self.started = time.monotonic()
+        queryset = self.get_queryset(opts).order_by()
+        total = queryset.count()
+        if not total and self.empty_message:
+            self.stdout.write(self.style.SUCCESS(self.empty_message))
+            return
+
+        scanned = changed = 0
+        last_pk = None
+        while True:
+            remaining = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            pks = list(remaining.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            batch = remaining.filter(pk__lte=pks[-1])
+            if opts['dry_run']:
+                changed += self.count_batch(batch, opts)
+            else:
+                changed += self.update_batch(batch, opts)
+
+            scanned += len(pks)
+            last_pk = pks[-1]
+            if opts['verbosity'] > 1 or len(pks) < batch_size or scanned >= total:
+                elapsed = max(time.monotonic() - self.started, 1e-6)
+                self.stdout.write(
+                    f'pks {pks[0]}-{last_pk}: {scanned}/{total} row(s) scanned, '
+                    f'{changed} {self.progress_verb}, {scanned / elapsed:.0f} rows/s'
+                )
+            if len(pks) < batch_size:
+                break
+
+        self.finish(changed, opts)
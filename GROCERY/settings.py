@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 from decouple import config
 from django.contrib.messages import constants as message_constants
@@ -223,3 +224,53 @@ LEAFLET_PDF_RENDERER = os.getenv("LEAFLET_PDF_RENDERER", "auto").lower()
 # Allow large management forms (e.g. product category matrix)
 # Default Django limit is 1000; this can be overridden via env var.
 DATA_UPLOAD_MAX_NUMBER_FIELDS = int(os.getenv("DATA_UPLOAD_MAX_NUMBER_FIELDS", "20000"))
+
+# Visit tracking: enqueue pageviews and write them in batches from a
+# background thread. Disabled under `manage.py test`, where rows must be
+# visible inside the test transaction.
+VISIT_TRACKING_BUFFERED = _env_bool("VISIT_TRACKING_BUFFERED", "test" not in sys.argv[1:2])
+# Crawler pageviews: "count" (daily counters per bot, no rows), "drop"
+# (one daily counter) or "track" (stored like any visitor).
+VISIT_BOT_POLICY = os.getenv("VISIT_BOT_POLICY", "count")
+# Store pageviews of only 1 in N visits under a path prefix, e.g.
+# {"/product/": 4}; stored rows carry N so dashboard totals scale back up.
+VISIT_PAGEVIEW_SAMPLING = {}
+# One cache shared by every web worker and dyno, so "active now" presence
+# buckets, analytics responses and their refresh locks see all workers. The
+# table comes from `createcachetable` in the release phase; CACHE_BACKEND=locmem
+# keeps a per-process cache (tests and local runs without the table).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem" if "test" in sys.argv[1:2] else "db")
+CACHES = {
+    "default": (
+        {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "django_cache"}
+        if CACHE_BACKEND == "db"
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    ),
+}
+# "Active now": each worker copies its per-minute presence buckets to the
+# cache this often. Counts span workers only with a shared cache backend.
+VISIT_PRESENCE_FLUSH_SECONDS = int(os.getenv("VISIT_PRESENCE_FLUSH_SECONDS", "10"))
+# Whether the default cache is shared between workers. None detects it from
+# the backend (LocMem is not); without one "active now" counts Visit rows.
+VISIT_PRESENCE_SHARED_CACHE = None
+
+# Analytics JSON endpoints: cache responses per window and filters. Windows
+# that include an open day stay fresh for ANALYTICS_CACHE_LIVE_SECONDS, fully
+# rolled-up windows for ANALYTICS_CACHE_CLOSED_SECONDS; stale entries are
+# served while a background thread recomputes them. Disabled under
+# `manage.py test` so each test sees its own rows.
+ANALYTICS_RESPONSE_CACHE = _env_bool("ANALYTICS_RESPONSE_CACHE", "test" not in sys.argv[1:2])
+ANALYTICS_CACHE_LIVE_SECONDS = int(os.getenv("ANALYTICS_CACHE_LIVE_SECONDS", "60"))
+ANALYTICS_CACHE_CLOSED_SECONDS = int(os.getenv("ANALYTICS_CACHE_CLOSED_SECONDS", str(6 * 60 * 60)))
+ANALYTICS_CACHE_STALE_SECONDS = int(os.getenv("ANALYTICS_CACHE_STALE_SECONDS", str(15 * 60)))
+
+# Raw analytics retention: archive_analytics moves visits, pageviews and
+# events older than this many whole months to gzip NDJSON files. There is no
+# default directory: the dyno filesystem is wiped on restart, so the archive
+# must point at durable storage before anything is deleted.
+ANALYTICS_RETENTION_MONTHS = int(os.getenv("ANALYTICS_RETENTION_MONTHS", "13"))
+ANALYTICS_ARCHIVE_DIR = os.getenv("ANALYTICS_ARCHIVE_DIR", "")
+
+# Bestway scrapers: fetched pages with their ETag/Last-Modified validators, so
+# re-runs send conditional requests (and --offline can replay them).
+SCRAPER_CACHE_DIR = os.getenv("SCRAPER_CACHE_DIR", str(BASE_DIR / "scrape_cache"))
@@ -1,10 +1,129 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import (
+    AnalyticsAnnotation,
+    AnalyticsEvent,
+    AnalyticsSavedView,
+    IngestionCounter,
+    Visit,
+    VisitDailyRollup,
+    VisitPageview,
+)
+
+
+ESTIMATE_ABOVE_ROWS = 100_000
+EVENT_TYPES_CACHE_KEY = '_analytics:admin:event_types'
+BROWSER_FAMILIES_CACHE_KEY = '_analytics:admin:browser_families'
+
+
+def estimated_row_count(model):
+    """
+    Planner estimate of ``model``'s row count from ``pg_class.reltuples``,
+    summed over partitions; None when unavailable (other databases, or a
+    table that was never analysed).
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT SUM(reltuples)::bigint, MIN(reltuples) FROM pg_class WHERE oid = to_regclass(%s) '
+            'OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))',
+            [table, table],
+        )
+        total, lowest = cursor.fetchone()
+    if total is None or lowest < 0:
+        return None
+    return max(int(total), 0)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator for append-only tables with millions of rows. The
+    unfiltered list uses the planner's estimate once the table is large;
+    filtered lists count at most ``max_pages`` pages worth of rows, so a broad
+    filter never turns into a full COUNT(*).
+    """
+
+    max_pages = 200
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate > ESTIMATE_ABOVE_ROWS:
+                return estimate
+        if query is None:
+            return super().count
+        return self.object_list.order_by()[:self.per_page * self.max_pages].count()
+
+
+class BrowserFamilyFilter(admin.SimpleListFilter):
+    """
+    Browsers seen in the daily rollups plus visits of the last 30 days (index
+    range scan), instead of SELECT DISTINCT over every visit; cached for an hour.
+    """
+
+    title = 'browser family'
+    parameter_name = 'browser_family'
 
-from .models import AnalyticsAnnotation, AnalyticsEvent, AnalyticsSavedView, Visit, VisitPageview
+    def lookups(self, request, model_admin):
+        def known_families():
+            rolled_up = VisitDailyRollup.objects.exclude(browser_family='').values_list('browser_family', flat=True)
+            recent = (
+                Visit.objects.filter(started_at__gte=timezone.now() - timedelta(days=30))
+                .exclude(browser_family='')
+                .order_by()
+                .values_list('browser_family', flat=True)
+            )
+            return sorted(set(rolled_up.order_by().distinct()) | set(recent.distinct()))
+
+        return [(family, family) for family in cache.get_or_set(BROWSER_FAMILIES_CACHE_KEY, known_families, 60 * 60)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(browser_family=self.value())
+        return queryset
+
+
+class EventTypeFilter(admin.SimpleListFilter):
+    """Event types from the last 30 days (index range scan, cached for an hour)."""
+
+    title = 'event type'
+    parameter_name = 'event_type'
+
+    def lookups(self, request, model_admin):
+        def recent_types():
+            return list(
+                AnalyticsEvent.objects.filter(created_at__gte=timezone.now() - timedelta(days=30))
+                .order_by('event_type')
+                .values_list('event_type', flat=True)
+                .distinct()
+            )
+
+        return [(event_type, event_type) for event_type in cache.get_or_set(EVENT_TYPES_CACHE_KEY, recent_types, 60 * 60)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(event_type=self.value())
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Visit)
-class VisitAdmin(admin.ModelAdmin):
+class VisitAdmin(LargeTableAdmin):
     list_display = (
         'id',
         'started_at',
@@ -15,7 +134,8 @@ class VisitAdmin(admin.ModelAdmin):
         'device_type',
         'browser_family',
     )
-    list_filter = ('started_at', 'traffic_source', 'device_type', 'browser_family', 'is_authenticated')
+    list_filter = ('started_at', 'traffic_source', 'device_type', BrowserFamilyFilter, 'is_authenticated')
+    list_select_related = ('user',)
     search_fields = ('session_key', 'user__email', 'landing_path', 'referrer', 'utm_campaign', 'utm_source')
     readonly_fields = (
         'session_key',
@@ -41,9 +161,10 @@ class VisitAdmin(admin.ModelAdmin):
 
 
 @admin.register(VisitPageview)
-class VisitPageviewAdmin(admin.ModelAdmin):
+class VisitPageviewAdmin(LargeTableAdmin):
     list_display = ('id', 'viewed_at', 'path', 'visit', 'duration_seconds', 'sequence_index')
     list_filter = ('viewed_at', 'is_authenticated')
+    list_select_related = ('visit',)
     search_fields = ('path', 'query', 'session_key', 'visit__landing_path')
     readonly_fields = (
         'visit',
@@ -56,14 +177,16 @@ class VisitPageviewAdmin(admin.ModelAdmin):
         'duration_seconds',
         'sequence_index',
         'is_authenticated',
+        'sample_weight',
     )
     ordering = ('-viewed_at',)
 
 
 @admin.register(AnalyticsEvent)
-class AnalyticsEventAdmin(admin.ModelAdmin):
+class AnalyticsEventAdmin(LargeTableAdmin):
     list_display = ('id', 'created_at', 'event_type', 'path', 'user', 'value')
-    list_filter = ('event_type', 'created_at')
+    list_filter = (EventTypeFilter, 'created_at')
+    list_select_related = ('user',)
     search_fields = ('event_type', 'path', 'label', 'session_key', 'user__email')
     readonly_fields = (
         'visit',
@@ -94,3 +217,12 @@ class AnalyticsSavedViewAdmin(admin.ModelAdmin):
     list_filter = ('is_default', 'updated_at')
     search_fields = ('name', 'user__email', 'user__username')
     ordering = ('user', 'name')
+
+
+@admin.register(IngestionCounter)
+class IngestionCounterAdmin(admin.ModelAdmin):
+    list_display = ('day', 'kind', 'key', 'count')
+    list_filter = ('kind', 'day')
+    search_fields = ('key',)
+    readonly_fields = ('day', 'kind', 'key', 'count')
+    ordering = ('-day', 'kind', 'key')
@@ -5,3 +5,6 @@ class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = '_analytics'
 
+    def ready(self):
+        # Registers the paid-order receiver that maintains customer cohorts.
+        import _analytics.signals
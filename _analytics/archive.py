@@ -0,0 +1,172 @@
+"""
+Retention for raw analytics rows: whole months are exported to gzip-compressed
+NDJSON files (one per table and month) and then removed from the database,
+dropping the month's partition where the table is partitioned. Archives can
+be loaded back for ad-hoc analysis with ``load_archive``.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from . import partitions
+from .models import AnalyticsEvent, GoogleAdsLandingArrival, OrderAttribution, Visit, VisitConversion, VisitPageview
+
+
+# Children first: rows are deleted in this order and loaded in reverse. Rows
+# hanging off a visit are archived with the month their visit is archived in,
+# so deleting the visit never cascades away rows that were not exported.
+ARCHIVED_MODELS = {
+    OrderAttribution: 'visit__last_seen_at',
+    AnalyticsEvent: 'created_at',
+    VisitPageview: 'viewed_at',
+    VisitConversion: 'visit__last_seen_at',
+    GoogleAdsLandingArrival: 'visit__last_seen_at',
+    Visit: 'last_seen_at',
+}
+# Attributions belong to orders and stay in the database; only their links to
+# the archived visit and arrival are cleared, and loading the archive restores them.
+LINKED_MODELS = {
+    OrderAttribution: ('visit', 'arrival'),
+}
+ARCHIVE_SUFFIX = '.ndjson.gz'
+
+
+def archive_dir() -> Path:
+    directory = getattr(settings, 'ANALYTICS_ARCHIVE_DIR', '')
+    if not directory:
+        raise ImproperlyConfigured(
+            'ANALYTICS_ARCHIVE_DIR is not set; point it at durable storage before archiving analytics rows.'
+        )
+    return Path(directory)
+
+
+def archive_path(model, month: date, directory=None) -> Path:
+    return Path(directory or archive_dir()) / model._meta.db_table / f'{month:%Y-%m}{ARCHIVE_SUFFIX}'
+
+
+def month_rows(model, month: date):
+    lower, upper = partitions.month_bounds(month)
+    column = ARCHIVED_MODELS[model]
+    return model.objects.filter(**{f'{column}__gte': lower, f'{column}__lt': upper})
+
+
+def export_month(model, month: date, directory=None, *, chunk_size=2000) -> int:
+    """Write every row of ``model`` for ``month`` to its archive file; returns the row count."""
+    path = archive_path(model, month, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    columns = [field.attname for field in model._meta.concrete_fields]
+    tmp_path = path.with_name(path.name + '.tmp')
+    written = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as handle:
+        for row in month_rows(model, month).order_by('pk').values(*columns).iterator(chunk_size=chunk_size):
+            handle.write(json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')))
+            handle.write('\n')
+            written += 1
+    os.replace(tmp_path, path)
+    return written
+
+
+def delete_month(model, month: date, *, chunk_size=2000) -> bool:
+    """
+    Remove ``model``'s rows for ``month``: a single DROP when the month has its
+    own partition (returns True), otherwise ORM deletes in primary-key chunks
+    so related rows are cascaded or nulled as usual. Rows of ``LINKED_MODELS``
+    are kept (returns False).
+    """
+    if model in LINKED_MODELS:
+        return False
+    if model in partitions.PARTITIONED_MODELS and partitions.drop_month_partition(model, month):
+        return True
+    rows = month_rows(model, month)
+    while True:
+        ids = list(rows.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return False
+        with transaction.atomic():
+            model.objects.filter(pk__in=ids).delete()
+
+
+def _resolve_foreign_keys(model, batch):
+    """
+    Constrained foreign keys must point at existing rows: dangling nullable
+    keys are cleared and rows with a dangling required key are dropped.
+    """
+    for field in model._meta.concrete_fields:
+        if not field.is_relation or not field.db_constraint:
+            continue
+        wanted = {getattr(obj, field.attname) for obj in batch} - {None}
+        existing = set(
+            field.related_model._default_manager.filter(pk__in=wanted).values_list('pk', flat=True)
+        )
+        kept = []
+        for obj in batch:
+            if getattr(obj, field.attname) in existing or getattr(obj, field.attname) is None:
+                kept.append(obj)
+            elif field.null:
+                setattr(obj, field.attname, None)
+                kept.append(obj)
+        batch = kept
+    return batch
+
+
+def _insert(model, batch):
+    batch = _resolve_foreign_keys(model, batch)
+    if model in LINKED_MODELS:
+        model.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=list(LINKED_MODELS[model]),
+        )
+    else:
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+    return len(batch)
+
+
+@contextmanager
+def _archived_timestamps(model):
+    # auto_now_add would stamp restored rows with the load time.
+    fields = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def load_archive(model, path, *, batch_size=1000) -> int:
+    """
+    Insert rows from an archive file, skipping ids that already exist (rows of
+    ``LINKED_MODELS`` get their links restored instead). Returns the number of
+    rows offered to the database.
+    """
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    loaded = 0
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as handle, _archived_timestamps(model):
+        for line in handle:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            batch.append(
+                model(**{name: fields[name].to_python(value) for name, value in row.items() if name in fields})
+            )
+            if len(batch) >= batch_size:
+                loaded += _insert(model, batch)
+                batch = []
+        if batch:
+            loaded += _insert(model, batch)
+    return loaded
+
@@ -0,0 +1,228 @@
+"""
+Campaign attribution. Landing arrivals and campaign sessions are counted
+when they are tracked, and each paid order is credited once to the
+customer's last campaign visit (UTM campaign or Google Ads landing arrival)
+within ``ATTRIBUTION_WINDOW_DAYS``. All three feed ``CampaignDailyStats``, so
+campaign reports read one small table.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cohorts import order_paid_at
+from .models import CampaignDailyStats, GoogleAdsLandingArrival, OrderAttribution, Visit
+
+
+ATTRIBUTION_WINDOW_DAYS = 30
+COUNTER_FIELDS = ('arrivals', 'sessions', 'orders', 'revenue')
+
+
+def add_campaign_counts(counts) -> None:
+    """Add ``{(day, utm_source, utm_campaign): {field: n}}`` to the daily counters."""
+    if not counts:
+        return
+    CampaignDailyStats.objects.bulk_create(
+        [CampaignDailyStats(day=day, utm_source=source, utm_campaign=campaign) for day, source, campaign in counts],
+        ignore_conflicts=True,
+    )
+    for (day, source, campaign), values in counts.items():
+        CampaignDailyStats.objects.filter(day=day, utm_source=source, utm_campaign=campaign).update(
+            **{field: F(field) + amount for field, amount in values.items()}
+        )
+
+
+def _campaign_key(day, row):
+    return (day, (row.utm_source or '').strip(), (row.utm_campaign or '').strip())
+
+
+def record_campaign_session(visit) -> None:
+    if (visit.utm_campaign or '').strip():
+        add_campaign_counts({_campaign_key(timezone.localdate(visit.started_at), visit): {'sessions': 1}})
+
+
+def record_arrival(arrival) -> None:
+    add_campaign_counts({_campaign_key(timezone.localdate(arrival.arrived_at), arrival): {'arrivals': 1}})
+
+
+def credited_visit(user_id, paid_at):
+    """The user's most recent campaign visit in the attribution window, or None."""
+    return (
+        Visit.objects.filter(
+            user_id=user_id,
+            started_at__lte=paid_at,
+            started_at__gte=paid_at - timedelta(days=ATTRIBUTION_WINDOW_DAYS),
+        )
+        .filter(Q(utm_campaign__gt='') | Q(google_ads_arrival__isnull=False))
+        .select_related('google_ads_arrival')
+        .order_by('-started_at', '-pk')
+        .first()
+    )
+
+
+def _attribution_for(order, paid_at):
+    visit = credited_visit(order.user_id, paid_at) if order.user_id else None
+    return OrderAttribution(
+        order_id=order.pk,
+        visit=visit,
+        arrival=getattr(visit, 'google_ads_arrival', None) if visit else None,
+        utm_source=(visit.utm_source or '').strip() if visit else '',
+        utm_campaign=(visit.utm_campaign or '').strip() if visit else '',
+        day=timezone.localdate(paid_at),
+        revenue=order.total or Decimal('0.00'),
+    )
+
+
+def _order_counts(attributions):
+    """Counter increments for stored attributions; orders without a campaign visit are not counted."""
+    counts = defaultdict(lambda: {'orders': 0, 'revenue': Decimal('0.00')})
+    for attribution in attributions:
+        if attribution.visit_id:
+            key = (attribution.day, attribution.utm_source, attribution.utm_campaign)
+            counts[key]['orders'] += 1
+            counts[key]['revenue'] += attribution.revenue
+    return counts
+
+
+def record_order_attribution(order, *, paid_at=None):
+    """
+    Credit a paid order to its campaign visit and count it. Safe to call
+    repeatedly; returns the new attribution, or None when the order was
+    already attributed. Orders without a campaign visit are stored too, so
+    they are not looked up again. ``paid_at`` defaults to ``order_paid_at``,
+    the rule ``attribute_orders`` uses as well.
+    """
+    if not order.pk or OrderAttribution.objects.filter(order_id=order.pk).exists():
+        return None
+    attribution = _attribution_for(order, paid_at or order_paid_at(order))
+    try:
+        with transaction.atomic():
+            attribution.save(force_insert=True)
+            add_campaign_counts(_order_counts([attribution]))
+    except IntegrityError:
+        # Another worker attributed the same order first.
+        return None
+    return attribution
+
+
+def _save_attributions(batch) -> int:
+    """Store ``batch`` and count it; falls back to one row at a time if another worker raced us."""
+    try:
+        with transaction.atomic():
+            OrderAttribution.objects.bulk_create(batch)
+            add_campaign_counts(_order_counts(batch))
+        return len(batch)
+    except IntegrityError:
+        pass
+    saved = 0
+    for attribution in batch:
+        try:
+            with transaction.atomic():
+                attribution.save(force_insert=True)
+                add_campaign_counts(_order_counts([attribution]))
+        except IntegrityError:
+            continue
+        saved += 1
+    return saved
+
+
+def attribute_orders(orders_qs, *, batch_size=500) -> int:
+    """
+    Attribute paid orders that have none yet, paid at ``order_paid_at``, and
+    add them to the daily counters. Returns the count.
+    """
+    attributed = 0
+    batch = []
+    pending = orders_qs.exclude(pk__in=OrderAttribution.objects.values('order_id')).order_by('pk')
+    for order in pending.iterator(chunk_size=batch_size):
+        batch.append(_attribution_for(order, order_paid_at(order)))
+        if len(batch) >= batch_size:
+            attributed += _save_attributions(batch)
+            batch = []
+    if batch:
+        attributed += _save_attributions(batch)
+    return attributed
+
+
+def rebuild_campaign_stats(start_date, end_date) -> int:
+    """
+    Recompute the daily counters for ``start_date``..``end_date`` from
+    arrivals, visits and stored order attributions. Returns the rows written.
+    """
+    tz = timezone.get_current_timezone()
+    start_dt = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end_dt = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    counts = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+
+    arrivals = (
+        GoogleAdsLandingArrival.objects.filter(arrived_at__gte=start_dt, arrived_at__lt=end_dt)
+        .annotate(day=TruncDate('arrived_at', tzinfo=tz))
+        .values('day', 'utm_source', 'utm_campaign')
+        .annotate(n=Count('pk'))
+    )
+    for row in arrivals:
+        counts[(row['day'], row['utm_source'], row['utm_campaign'])]['arrivals'] += row['n']
+
+    sessions = (
+        Visit.objects.filter(started_at__gte=start_dt, started_at__lt=end_dt, utm_campaign__gt='')
+        .annotate(day=TruncDate('started_at', tzinfo=tz))
+        .values('day', 'utm_source', 'utm_campaign')
+        .annotate(n=Count('pk'))
+    )
+    for row in sessions:
+        counts[(row['day'], row['utm_source'], row['utm_campaign'])]['sessions'] += row['n']
+
+    orders = (
+        OrderAttribution.objects.filter(day__gte=start_date, day__lte=end_date, visit__isnull=False)
+        .values('day', 'utm_source', 'utm_campaign')
+        .annotate(n=Count('pk'), total=Sum('revenue'))
+    )
+    for row in orders:
+        key = (row['day'], row['utm_source'], row['utm_campaign'])
+        counts[key]['orders'] += row['n']
+        counts[key]['revenue'] += row['total'] or Decimal('0')
+
+    with transaction.atomic():
+        CampaignDailyStats.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        CampaignDailyStats.objects.bulk_create(
+            [
+                CampaignDailyStats(day=day, utm_source=source, utm_campaign=campaign, **values)
+                for (day, source, campaign), values in sorted(counts.items())
+            ],
+            batch_size=1000,
+        )
+    return len(counts)
+
+
+def campaign_report(start_date, end_date, *, campaign='', limit=20) -> list[dict]:
+    """Window totals per campaign, busiest first, with orders per session as conversion rate."""
+    qs = CampaignDailyStats.objects.filter(day__gte=start_date, day__lte=end_date)
+    if campaign:
+        qs = qs.filter(utm_campaign=campaign)
+    rows = (
+        qs.values('utm_campaign')
+        .annotate(
+            arrivals=Sum('arrivals'),
+            sessions=Sum('sessions'),
+            orders=Sum('orders'),
+            revenue=Sum('revenue'),
+        )
+        .order_by('-sessions', '-arrivals', 'utm_campaign')
+    )
+    report = []
+    for row in rows[:limit]:
+        report.append({
+            'label': row['utm_campaign'] or '(no campaign)',
+            'arrivals': row['arrivals'] or 0,
+            'sessions': row['sessions'] or 0,
+            'orders': row['orders'] or 0,
+            'conversion_rate': round(100 * (row['orders'] or 0) / row['sessions'], 2) if row['sessions'] else 0.0,
+            'revenue': str((row['revenue'] or Decimal('0')).quantize(Decimal('0.01'))),
+        })
+    return report
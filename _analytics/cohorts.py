@@ -0,0 +1,200 @@
+"""
+Acquisition-week cohorts of paying customers. Each customer belongs to the
+week their first order was paid; the retention matrix counts, per cohort and
+weeks since acquisition, how many of them paid again, how many orders and
+how much revenue (order subtotal). Rows are maintained as orders become paid,
+so reports read a few cells instead of scanning orders.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import CohortOrder, CohortRetentionCell, CustomerCohort
+
+
+PAID_ORDER_STATUSES = ('paid', 'processed', 'delivered')
+
+
+def order_paid_at(order):
+    """
+    When ``order`` counts as paid. Orders carry no payment timestamp, so the
+    creation time stands in for it, live and in every backfill alike.
+    """
+    return order.created_at
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def week_offset(cohort_week: date, week: date) -> int:
+    return max(0, (week - cohort_week).days // 7)
+
+
+def _move_member(user_id, old_week: date, new_week: date) -> None:
+    """
+    Move a customer's counted orders from the ``old_week`` cohort to the
+    earlier ``new_week`` one, recomputing each order's week offset.
+    """
+    deltas = defaultdict(lambda: {'active_buyers': 0, 'orders': 0, 'revenue': Decimal('0.00')})
+    weeks = set()
+    for week, revenue in CohortOrder.objects.filter(user_id=user_id).values_list('week', 'revenue'):
+        for cohort_week, sign in ((old_week, -1), (new_week, 1)):
+            delta = deltas[(cohort_week, week_offset(cohort_week, week))]
+            delta['orders'] += sign
+            delta['revenue'] += sign * revenue
+            if week not in weeks:
+                delta['active_buyers'] += sign
+        weeks.add(week)
+    for (cohort_week, offset), delta in deltas.items():
+        cell, _ = CohortRetentionCell.objects.get_or_create(cohort_week=cohort_week, week_offset=offset)
+        CohortRetentionCell.objects.filter(pk=cell.pk).update(
+            active_buyers=F('active_buyers') + delta['active_buyers'],
+            orders=F('orders') + delta['orders'],
+            revenue=F('revenue') + delta['revenue'],
+        )
+    CohortRetentionCell.objects.filter(cohort_week=old_week, orders=0).delete()
+
+
+def record_paid_order(order, *, paid_at=None) -> bool:
+    """
+    Count a paid order in its customer's cohort. Safe to call repeatedly for
+    the same order; returns True only the first time.
+    """
+    if not order.pk or not order.user_id:
+        return False
+    if CohortOrder.objects.filter(order_id=order.pk).exists():
+        # Later status changes (processed, delivered) save the order again.
+        return False
+    paid_at = paid_at or order_paid_at(order)
+    week = week_start(timezone.localdate(paid_at))
+    revenue = order.total or Decimal('0.00')
+
+    with transaction.atomic():
+        CustomerCohort.objects.get_or_create(
+            user_id=order.user_id,
+            defaults={'cohort_week': week, 'first_paid_at': paid_at},
+        )
+        # The member row serialises concurrent orders of the same customer.
+        member = CustomerCohort.objects.select_for_update().get(pk=order.user_id)
+        if paid_at < member.first_paid_at:
+            # An older order arrived late (e.g. its payment was confirmed after a
+            # newer one): the customer joins the earlier cohort, as in rebuild_cohorts.
+            if week < member.cohort_week:
+                _move_member(order.user_id, member.cohort_week, week)
+                member.cohort_week = week
+            member.first_paid_at = paid_at
+            CustomerCohort.objects.filter(pk=member.pk).update(cohort_week=member.cohort_week, first_paid_at=paid_at)
+        _, created = CohortOrder.objects.get_or_create(
+            order_id=order.pk,
+            defaults={'user_id': order.user_id, 'week': week, 'revenue': revenue},
+        )
+        if not created:
+            return False
+        new_buyer = not CohortOrder.objects.filter(user_id=order.user_id, week=week).exclude(order_id=order.pk).exists()
+
+        CustomerCohort.objects.filter(pk=member.pk).update(paid_orders=F('paid_orders') + 1)
+        cell, _ = CohortRetentionCell.objects.get_or_create(
+            cohort_week=member.cohort_week,
+            week_offset=week_offset(member.cohort_week, week),
+        )
+        CohortRetentionCell.objects.filter(pk=cell.pk).update(
+            active_buyers=F('active_buyers') + int(new_buyer),
+            orders=F('orders') + 1,
+            revenue=F('revenue') + revenue,
+        )
+    return True
+
+
+def rebuild_cohorts(orders_qs, *, batch_size=2000) -> int:
+    """
+    Replace all cohort tables with a replay of ``orders_qs`` (paid orders) in
+    creation order, each paid at its creation time (``order_paid_at``).
+    Returns the number of orders counted.
+    """
+    members = {}
+    seen_weeks = set()
+    ledger = []
+    cells = defaultdict(lambda: {'active_buyers': 0, 'orders': 0, 'revenue': Decimal('0.00')})
+
+    rows = orders_qs.exclude(user__isnull=True).order_by('created_at', 'pk').values_list('pk', 'user_id', 'created_at', 'total')
+    for order_id, user_id, created_at, total in rows.iterator(chunk_size=batch_size):
+        week = week_start(timezone.localdate(created_at))
+        revenue = total or Decimal('0.00')
+        member = members.setdefault(user_id, {'cohort_week': week, 'first_paid_at': created_at, 'paid_orders': 0})
+        member['paid_orders'] += 1
+        cell = cells[(member['cohort_week'], week_offset(member['cohort_week'], week))]
+        if (user_id, week) not in seen_weeks:
+            seen_weeks.add((user_id, week))
+            cell['active_buyers'] += 1
+        cell['orders'] += 1
+        cell['revenue'] += revenue
+        ledger.append(CohortOrder(order_id=order_id, user_id=user_id, week=week, revenue=revenue))
+
+    with transaction.atomic():
+        CohortRetentionCell.objects.all().delete()
+        CohortOrder.objects.all().delete()
+        CustomerCohort.objects.all().delete()
+        CustomerCohort.objects.bulk_create(
+            [CustomerCohort(user_id=user_id, **values) for user_id, values in members.items()],
+            batch_size=batch_size,
+        )
+        CohortOrder.objects.bulk_create(ledger, batch_size=batch_size)
+        CohortRetentionCell.objects.bulk_create(
+            [
+                CohortRetentionCell(cohort_week=cohort_week, week_offset=offset, **values)
+                for (cohort_week, offset), values in sorted(cells.items())
+            ],
+            batch_size=batch_size,
+        )
+    return len(ledger)
+
+
+def retention_matrix(*, weeks=12, today=None) -> dict:
+    """
+    The last ``weeks`` acquisition cohorts, newest first, with one cell per
+    elapsed week. Retention is active buyers over cohort size; the repeat rate
+    is the share of the cohort with more than one paid order so far.
+    """
+    current = week_start(today or timezone.localdate())
+    first = current - timedelta(weeks=weeks - 1)
+    cells = defaultdict(dict)
+    for cell in CohortRetentionCell.objects.filter(cohort_week__gte=first, cohort_week__lte=current):
+        cells[cell.cohort_week][cell.week_offset] = cell
+    repeaters = dict(
+        CustomerCohort.objects
+        .filter(cohort_week__gte=first, cohort_week__lte=current)
+        .values('cohort_week')
+        .annotate(repeat=Count('pk', filter=Q(paid_orders__gt=1)))
+        .values_list('cohort_week', 'repeat')
+    )
+
+    cohorts = []
+    for index in range(weeks):
+        cohort_week = current - timedelta(weeks=index)
+        row = cells.get(cohort_week, {})
+        size = row[0].active_buyers if 0 in row else 0
+        offsets = []
+        for offset in range(index + 1):
+            cell = row.get(offset)
+            buyers = cell.active_buyers if cell else 0
+            offsets.append({
+                'week_offset': offset,
+                'active_buyers': buyers,
+                'retention': round(buyers / size, 4) if size else 0.0,
+                'orders': cell.orders if cell else 0,
+                'revenue': str((cell.revenue if cell else Decimal('0')).quantize(Decimal('0.01'))),
+            })
+        cohorts.append({
+            'cohort_week': cohort_week.isoformat(),
+            'customers': size,
+            'repeat_rate': round(repeaters.get(cohort_week, 0) / size, 4) if size else 0.0,
+            'weeks': offsets,
+        })
+    return {'weeks': weeks, 'cohorts': cohorts}
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import AnalyticsEvent, VisitConversion, VisitPageview
+
+
+PRODUCT_PATH_PREFIX = '/product/'
+FLAG_BY_EVENT_TYPE = {
+    'add_to_cart': 'added_to_cart',
+    'checkout_started': 'started_checkout',
+    'paid_order': 'paid',
+}
+REVENUE_EVENT_TYPE = 'paid_order'
+
+
+def _ensure_rows(visit_ids):
+    VisitConversion.objects.bulk_create(
+        [VisitConversion(visit_id=visit_id) for visit_id in sorted(visit_ids)],
+        ignore_conflicts=True,
+    )
+
+
+def mark_product_views(visit_ids):
+    """Flag visits that viewed a product page."""
+    visit_ids = {visit_id for visit_id in visit_ids if visit_id}
+    if not visit_ids:
+        return
+    _ensure_rows(visit_ids)
+    VisitConversion.objects.filter(visit_id__in=visit_ids, viewed_product=False).update(viewed_product=True)
+
+
+def record_events(events):
+    """Set funnel flags and add paid revenue for freshly written events."""
+    flagged = defaultdict(set)
+    revenue = defaultdict(Decimal)
+    for event in events:
+        visit_id = getattr(event, 'visit_id', None)
+        flag = FLAG_BY_EVENT_TYPE.get(getattr(event, 'event_type', None))
+        if not visit_id or not flag:
+            continue
+        flagged[flag].add(visit_id)
+        if event.event_type == REVENUE_EVENT_TYPE and event.value:
+            revenue[visit_id] += event.value
+    if not flagged:
+        return
+
+    _ensure_rows(set().union(*flagged.values()))
+    for flag, visit_ids in flagged.items():
+        VisitConversion.objects.filter(visit_id__in=visit_ids, **{flag: False}).update(**{flag: True})
+    for visit_id, amount in revenue.items():
+        VisitConversion.objects.filter(visit_id=visit_id).update(revenue=F('revenue') + amount)
+
+
+def rebuild_visit_conversions(visits_qs, *, batch_size=1000):
+    """Recompute conversion rows from raw pageviews and events for the given visits."""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid_revenue = (
+        AnalyticsEvent.objects.filter(visit=OuterRef('pk'), event_type=REVENUE_EVENT_TYPE)
+        .order_by()
+        .values('visit')
+        .annotate(total=Sum('value'))
+        .values('total')
+    )
+    annotations = {
+        'viewed_product': Exists(
+            VisitPageview.objects.filter(visit=OuterRef('pk'), path__startswith=PRODUCT_PATH_PREFIX)
+        ),
+        'revenue_total': Coalesce(Subquery(paid_revenue, output_field=money), Value(Decimal('0')), output_field=money),
+    }
+    for event_type, flag in FLAG_BY_EVENT_TYPE.items():
+        annotations[flag] = Exists(AnalyticsEvent.objects.filter(visit=OuterRef('pk'), event_type=event_type))
+
+    flags = ('viewed_product', *FLAG_BY_EVENT_TYPE.values())
+    rows = visits_qs.order_by().annotate(**annotations).values_list('pk', 'revenue_total', *flags)
+    written = 0
+    batch = []
+    for pk, revenue_total, *flag_values in rows.iterator(chunk_size=batch_size):
+        batch.append(VisitConversion(visit_id=pk, revenue=revenue_total, **dict(zip(flags, flag_values))))
+        if len(batch) >= batch_size:
+            written += _write_rebuilt(batch, flags)
+            batch = []
+    if batch:
+        written += _write_rebuilt(batch, flags)
+    return written
+
+
+def _write_rebuilt(batch, flags):
+    VisitConversion.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['visit'],
+        update_fields=[*flags, 'revenue'],
+    )
+    return len(batch)
+
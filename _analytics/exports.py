@@ -0,0 +1,125 @@
+"""
+Streaming exports of raw analytics rows as CSV or NDJSON, optionally gzipped.
+Rows are read with ``.iterator(chunk_size=...)`` (a server-side cursor on
+PostgreSQL) and encoded a block at a time, so memory stays flat no matter
+how many rows the window holds.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import AnalyticsEvent, Visit, VisitPageview
+from .rollups import FILTER_DIMENSIONS, window_bounds
+
+
+# Dataset name -> (model, column that places a row in the window).
+EXPORT_DATASETS = {
+    'visits': (Visit, 'started_at'),
+    'pageviews': (VisitPageview, 'viewed_at'),
+    'events': (AnalyticsEvent, 'created_at'),
+}
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+GZIP_CONTENT_TYPE = 'application/gzip'
+# The session key is the visitor's live tracking cookie value; rows join on
+# ``id``/``visit_id`` instead.
+EXCLUDED_COLUMNS = frozenset({'session_key'})
+ROWS_PER_BLOCK = 500
+
+
+def export_queryset(dataset, start_date, end_date, filters):
+    """
+    Rows of ``dataset`` placed in ``start_date``..``end_date`` (local days),
+    narrowed by the dashboard filters; pageviews and events filter on their
+    visit. Shared by the download endpoint and ``export_analytics``.
+    """
+    model, column = EXPORT_DATASETS[dataset]
+    start_dt, end_dt = window_bounds(start_date, end_date)
+    qs = model.objects.filter(**{f'{column}__gte': start_dt, f'{column}__lt': end_dt})
+    prefix = '' if model is Visit else 'visit__'
+    for filter_name, dimension in FILTER_DIMENSIONS.items():
+        if filters.get(filter_name):
+            qs = qs.filter(**{f'{prefix}{dimension}': filters[filter_name]})
+    if filters.get('user_scope') == 'authenticated':
+        qs = qs.filter(**{f'{prefix}is_authenticated': True})
+    elif filters.get('user_scope') == 'anonymous':
+        qs = qs.filter(**{f'{prefix}is_authenticated': False})
+    return qs
+
+
+def export_columns(model) -> list[str]:
+    return [field.attname for field in model._meta.concrete_fields if field.attname not in EXCLUDED_COLUMNS]
+
+
+def export_filename(dataset, start_date, end_date, fmt, *, compress=False) -> str:
+    return f'analytics-{dataset}-{start_date:%Y%m%d}-{end_date:%Y%m%d}.{fmt}' + ('.gz' if compress else '')
+
+
+def content_type(fmt, *, compress=False) -> str:
+    return GZIP_CONTENT_TYPE if compress else EXPORT_FORMATS[fmt]
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return value
+
+
+def _csv_blocks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 1
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        pending += 1
+        if pending >= ROWS_PER_BLOCK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def _ndjson_blocks(rows, columns):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, separators=(',', ':')))
+        if len(lines) >= ROWS_PER_BLOCK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def _gzipped(blocks):
+    # wbits=31 writes a gzip header and trailer, so the output is a regular .gz file.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, fmt, *, compress=False, chunk_size=2000):
+    """
+    Yield the encoded export of ``queryset`` in primary-key order: CSV with a
+    header row, or one JSON object per line. JSON columns are embedded as
+    compact JSON strings in CSV.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+    columns = export_columns(queryset.model)
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+    blocks = _csv_blocks(rows, columns) if fmt == 'csv' else _ndjson_blocks(rows, columns)
+    encoded = (block.encode('utf-8') for block in blocks)
+    return _gzipped(encoded) if compress else encoded
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import hashlib
+import math
+
+
+DEFAULT_PRECISION = 10
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch over a 64-bit blake2b hash.
+
+    With ``precision`` p the sketch keeps 2**p one-byte registers (1 KiB at the
+    default p=10) and estimates distinct counts with a relative standard error
+    of about 1.04 / sqrt(2**p), roughly 3.3% at p=10; about 95% of estimates
+    fall within twice that. Small cardinalities use linear counting, which is
+    close to exact. Sketches with the same precision merge losslessly by
+    taking the register-wise maximum, so per-day sketches combine into any
+    window without rereading raw rows.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: bytes | None = None):
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must be between 4 and 16')
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        else:
+            if len(registers) != self.size:
+                raise ValueError('register count does not match precision')
+            self.registers = bytearray(registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        data = bytes(data)
+        precision = max(4, len(data).bit_length() - 1)
+        return cls(precision, data)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    def add(self, value: str) -> None:
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        remaining_bits = 64 - self.precision
+        index = hashed >> remaining_bits
+        rest = hashed & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError('cannot merge sketches with different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
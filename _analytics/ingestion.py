@@ -0,0 +1,395 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import DatabaseError, DataError, IntegrityError, connection, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .conversions import PRODUCT_PATH_PREFIX, mark_product_views
+from .models import AnalyticsEvent, IngestionCounter, Visit, VisitPageview
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PageviewRecord:
+    visit_id: int
+    user_id: int | None
+    session_key: str
+    path: str
+    query: str
+    referrer: str
+    viewed_at: datetime
+    sequence_index: int
+    is_authenticated: bool
+    # Sequence index and time of the visit's previous pageview, whose
+    # duration becomes known once this pageview is written.
+    previous_sequence_index: int | None = None
+    previous_viewed_at: datetime | None = None
+    sample_weight: int = 1
+
+
+@dataclass(frozen=True)
+class VisitTouchRecord:
+    visit_id: int
+    last_seen_at: datetime
+    user_id: int | None
+    is_authenticated: bool
+
+
+@dataclass(frozen=True)
+class PageviewDurationRecord:
+    # Duration of an already buffered pageview whose successor was not stored.
+    visit_id: int
+    sequence_index: int
+    duration_seconds: int
+
+
+@dataclass(frozen=True)
+class ProductViewRecord:
+    # Product page view that was sampled out but still sets the conversion flag.
+    visit_id: int
+
+
+@dataclass(frozen=True)
+class SampledPageviewRecord:
+    # Pageview that was sampled out; only advances the visit's pageview count.
+    visit_id: int
+    sequence_index: int
+
+
+@dataclass(frozen=True)
+class EventPageviewLinkRecord:
+    # Events stored while their pageview was still buffered; linked once it is written.
+    event_ids: tuple
+    visit_id: int
+    sequence_index: int
+
+
+@dataclass(frozen=True)
+class CounterRecord:
+    day: date
+    kind: str
+    key: str = ''
+
+
+def write_counters(counts) -> None:
+    """Add ``{(day, kind, key): n}`` to the ingestion counters: one insert plus one UPDATE per key."""
+    if not counts:
+        return
+    IngestionCounter.objects.bulk_create(
+        [IngestionCounter(day=day, kind=kind, key=key) for day, kind, key in counts],
+        ignore_conflicts=True,
+    )
+    for (day, kind, key), count in counts.items():
+        IngestionCounter.objects.filter(day=day, kind=kind, key=key).update(count=F('count') + count)
+
+
+def _pageview_from_record(record: PageviewRecord) -> VisitPageview:
+    return VisitPageview(
+        visit_id=record.visit_id,
+        user_id=record.user_id,
+        session_key=record.session_key,
+        path=record.path,
+        query=record.query,
+        referrer=record.referrer,
+        viewed_at=record.viewed_at,
+        sequence_index=record.sequence_index,
+        is_authenticated=record.is_authenticated,
+        sample_weight=record.sample_weight,
+    )
+
+
+def _duration_seconds(start, end) -> int:
+    return max(0, int((end - start).total_seconds()))
+
+
+def link_event_pageviews(links) -> None:
+    """Point events at their pageview, found by (visit, sequence index), with one lookup and one UPDATE."""
+    if not links:
+        return
+    keys = {(link.visit_id, link.sequence_index) for link in links}
+    pageview_ids = {
+        (visit_id, sequence_index): pk
+        for visit_id, sequence_index, pk in VisitPageview.objects.filter(
+            reduce(or_, [Q(visit_id=visit_id, sequence_index=index) for visit_id, index in keys])
+        ).values_list('visit_id', 'sequence_index', 'pk')
+    }
+    targets = {}
+    for link in links:
+        pageview_id = pageview_ids.get((link.visit_id, link.sequence_index))
+        if pageview_id is not None:
+            targets.update(dict.fromkeys(link.event_ids, pageview_id))
+    if targets:
+        AnalyticsEvent.objects.filter(pk__in=targets.keys(), pageview__isnull=True).update(
+            pageview_id=Case(
+                *[When(pk=event_id, then=Value(pageview_id)) for event_id, pageview_id in targets.items()],
+                output_field=models.BigIntegerField(),
+            )
+        )
+
+
+def write_records(records) -> int:
+    """
+    Persist a batch of buffered records: one bulk insert for pageviews (plus
+    product-view conversion flags), one UPDATE for durations of pageviews
+    written by earlier batches, one UPDATE for visit last-seen state and
+    pageview counts (sampled-out pageviews included), the
+    pageview links of events tracked meanwhile and the summed ingestion
+    counters. Returns the number of pageviews written.
+    """
+    pageview_records = [record for record in records if isinstance(record, PageviewRecord)]
+    counters = Counter(
+        (record.day, record.kind, record.key) for record in records if isinstance(record, CounterRecord)
+    )
+    touches = {}
+    for record in records:
+        if isinstance(record, VisitTouchRecord):
+            current = touches.get(record.visit_id)
+            if current is None or record.last_seen_at >= current.last_seen_at:
+                touches[record.visit_id] = record
+
+    pageviews = {}
+    pageview_counts = {}
+    for record in pageview_records:
+        pageviews[(record.visit_id, record.sequence_index)] = _pageview_from_record(record)
+    for record in records:
+        if isinstance(record, (PageviewRecord, SampledPageviewRecord)):
+            pageview_counts[record.visit_id] = max(pageview_counts.get(record.visit_id, 0), record.sequence_index)
+
+    pending_durations = {}
+    for record in pageview_records:
+        if record.previous_sequence_index is None or record.previous_viewed_at is None:
+            continue
+        key = (record.visit_id, record.previous_sequence_index)
+        duration = _duration_seconds(record.previous_viewed_at, record.viewed_at)
+        if key in pageviews:
+            pageviews[key].duration_seconds = duration
+        else:
+            pending_durations[key] = duration
+    for record in records:
+        if isinstance(record, PageviewDurationRecord):
+            key = (record.visit_id, record.sequence_index)
+            if key in pageviews:
+                pageviews[key].duration_seconds = record.duration_seconds
+            else:
+                pending_durations[key] = record.duration_seconds
+
+    with transaction.atomic():
+        if pageviews:
+            VisitPageview.objects.bulk_create(list(pageviews.values()))
+        mark_product_views(
+            [record.visit_id for record in pageview_records if record.path.startswith(PRODUCT_PATH_PREFIX)]
+            + [record.visit_id for record in records if isinstance(record, ProductViewRecord)]
+        )
+
+        if pending_durations:
+            conditions = [
+                Q(visit_id=visit_id, sequence_index=sequence_index)
+                for visit_id, sequence_index in pending_durations
+            ]
+            VisitPageview.objects.filter(reduce(or_, conditions), duration_seconds__isnull=True).update(
+                duration_seconds=Case(
+                    *[
+                        When(condition, then=Value(duration))
+                        for condition, duration in zip(conditions, pending_durations.values())
+                    ],
+                    output_field=models.PositiveIntegerField(),
+                )
+            )
+
+        visit_updates = {}
+        if touches:
+            whens = list(touches.values())
+            visit_updates.update(
+                last_seen_at=Case(
+                    *[When(pk=touch.visit_id, then=Value(touch.last_seen_at)) for touch in whens],
+                    default=F('last_seen_at'),
+                    output_field=models.DateTimeField(),
+                ),
+                user_id=Case(
+                    *[When(pk=touch.visit_id, then=Value(touch.user_id)) for touch in whens],
+                    default=F('user_id'),
+                    output_field=models.BigIntegerField(null=True),
+                ),
+                is_authenticated=Case(
+                    *[When(pk=touch.visit_id, then=Value(touch.is_authenticated)) for touch in whens],
+                    default=F('is_authenticated'),
+                    output_field=models.BooleanField(),
+                ),
+            )
+        if pageview_counts:
+            visit_updates['pageview_count'] = Greatest(
+                'pageview_count',
+                Case(
+                    *[When(pk=visit_id, then=Value(count)) for visit_id, count in pageview_counts.items()],
+                    default=Value(0),
+                    output_field=models.PositiveIntegerField(),
+                ),
+            )
+        if visit_updates:
+            Visit.objects.filter(pk__in=touches.keys() | pageview_counts.keys()).update(**visit_updates)
+
+        link_event_pageviews([record for record in records if isinstance(record, EventPageviewLinkRecord)])
+        write_counters(counters)
+    return len(pageviews)
+
+
+class AnalyticsBuffer:
+    """
+    Bounded in-process queue of tracking records. Requests only append to it;
+    a daemon thread drains it in batches every ``flush_seconds`` or as soon as
+    ``batch_size`` records are waiting. When full, the oldest records are
+    dropped and counted rather than blocking the request. A batch rejected
+    for its data (``IntegrityError``/``DataError``) is split in halves until
+    the bad records are isolated; only those are dropped (counted in
+    ``failed``). Any other database error means the database is unavailable:
+    the unwritten records go back to the front of the queue, still bounded by
+    ``max_records``, and the flush stops until the next cycle.
+    """
+
+    def __init__(self, *, max_records=10000, batch_size=500, flush_seconds=2.0, autostart=True):
+        self.max_records = max(1, int(max_records))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = float(flush_seconds)
+        self.autostart = autostart
+        self.dropped = 0
+        self.failed = 0
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    def enqueue(self, record):
+        with self._lock:
+            if len(self._records) >= self.max_records:
+                self._records.popleft()
+                self.dropped += 1
+            self._records.append(record)
+            should_wake = len(self._records) >= self.batch_size
+        if self.autostart:
+            self._ensure_thread()
+        if should_wake:
+            self._wakeup.set()
+
+    def _drain(self):
+        with self._lock:
+            batch = []
+            while self._records and len(batch) < self.batch_size:
+                batch.append(self._records.popleft())
+            return batch
+
+    def _requeue(self, records):
+        with self._lock:
+            self._records.extendleft(reversed(records))
+            while len(self._records) > self.max_records:
+                self._records.popleft()
+                self.dropped += 1
+
+    def flush(self) -> int:
+        """Write everything currently buffered. Safe to call from any thread."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                try:
+                    written += self._write_isolating(batch)
+                except DatabaseError:
+                    logger.warning(
+                        'Analytics database unavailable; keeping %s record(s) buffered',
+                        len(self),
+                        exc_info=True,
+                    )
+                    connection.close_if_unusable_or_obsolete()
+                    break
+        return written
+
+    def _write_isolating(self, batch) -> int:
+        written = 0
+        # Parts are written in order, so durations and event links still find
+        # pageviews written by an earlier part.
+        parts = [batch]
+        while parts:
+            part = parts.pop(0)
+            try:
+                written += write_records(part)
+            except (IntegrityError, DataError):
+                if len(part) == 1:
+                    self.failed += 1
+                    logger.exception('Dropping buffered analytics record %r', part[0])
+                    continue
+                middle = len(part) // 2
+                parts[:0] = [part[:middle], part[middle:]]
+            except DatabaseError:
+                self._requeue([record for pending in (part, *parts) for record in pending])
+                raise
+        return written
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Analytics buffer flush failed')
+            finally:
+                connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> AnalyticsBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AnalyticsBuffer(
+                    max_records=getattr(settings, 'VISIT_BUFFER_MAX_RECORDS', 10000),
+                    batch_size=getattr(settings, 'VISIT_BUFFER_BATCH_SIZE', 500),
+                    flush_seconds=getattr(settings, 'VISIT_BUFFER_FLUSH_SECONDS', 2.0),
+                )
+                atexit.register(flush_buffer)
+    return _buffer
+
+
+def enqueue(record):
+    get_buffer().enqueue(record)
+
+
+def flush_buffer() -> int:
+    if _buffer is None:
+        return 0
+    try:
+        return _buffer.flush()
+    except Exception:
+        logger.exception('Analytics buffer flush failed')
+        return 0
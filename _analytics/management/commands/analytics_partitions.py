@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from _analytics.partitions import (
+    PARTITIONED_MODELS,
+    PartitioningUnsupported,
+    convert_to_partitioned,
+    default_partition_name,
+    ensure_default_partition,
+    ensure_month_partitions,
+    is_partitioned,
+    list_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Manage monthly PostgreSQL partitions of the pageview and event tables. '
+        'Run with --convert once (in a quiet period) to partition the existing tables, '
+        'then regularly to create partitions ahead of time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert unpartitioned tables in place')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Monthly partitions to keep created ahead')
+
+    def handle(self, *args, **opts):
+        months_ahead = opts['months_ahead']
+        if months_ahead <= 0:
+            raise CommandError('--months-ahead must be positive.')
+
+        try:
+            for model in PARTITIONED_MODELS:
+                table = model._meta.db_table
+                if not is_partitioned(model):
+                    if not opts['convert']:
+                        self.stdout.write(self.style.WARNING(f'{table} is not partitioned; run with --convert.'))
+                        continue
+                    legacy = convert_to_partitioned(model, months_ahead=months_ahead)
+                    self.stdout.write(f'{table}: existing rows kept in partition {legacy}.')
+                created = ensure_month_partitions(model, timezone.localdate(), months_ahead + 1)
+                if ensure_default_partition(model):
+                    created.append(default_partition_name(model))
+                for name in created:
+                    self.stdout.write(f'{table}: created {name}.')
+                if opts['verbosity'] > 1:
+                    for name, lower, upper in list_partitions(model):
+                        self.stdout.write(f'  {name}: {lower or "MINVALUE"} .. {upper or "MAXVALUE"}')
+        except PartitioningUnsupported as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS('Analytics partitions are up to date.'))
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from _analytics.archive import ARCHIVED_MODELS, archive_dir, archive_path, delete_month, export_month, month_rows
+from _analytics.partitions import add_months, month_start
+from _analytics.models import Visit
+from _analytics.rollups import final_rollup_days
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive raw visits, pageviews and events older than the retention window to '
+        'gzip-compressed NDJSON files, one per table and month, then remove them from '
+        'the database. Months whose daily rollups are not final yet are skipped. '
+        'Needs --archive-dir or ANALYTICS_ARCHIVE_DIR pointing at durable storage.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months',
+            type=int,
+            default=getattr(settings, 'ANALYTICS_RETENTION_MONTHS', 13),
+            help='Whole months of raw rows to keep, not counting the current month',
+        )
+        parser.add_argument('--archive-dir', default='', help='Directory for archive files (default: ANALYTICS_ARCHIVE_DIR)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the months that would be archived')
+
+    def handle(self, *args, **opts):
+        keep_months = opts['keep_months']
+        if keep_months < 1:
+            raise CommandError('--keep-months must be at least 1.')
+        directory = opts['archive_dir']
+        if not directory and not opts['dry_run']:
+            # Rows are deleted once exported, so never fall back to an implicit
+            # (possibly ephemeral) location.
+            try:
+                directory = archive_dir()
+            except ImproperlyConfigured as exc:
+                raise CommandError(f'{exc} Or pass --archive-dir.')
+
+        cutoff = add_months(month_start(timezone.localdate()), -keep_months)
+        oldest = Visit.objects.aggregate(oldest=Min('started_at'))['oldest']
+        if oldest is None or timezone.localdate(oldest) >= cutoff:
+            self.stdout.write(self.style.SUCCESS(f'Nothing older than {cutoff} to archive.'))
+            return
+
+        archived = 0
+        month = month_start(timezone.localdate(oldest))
+        while month < cutoff:
+            next_month = add_months(month, 1)
+            days = (next_month - month).days
+            if len(final_rollup_days(month, next_month - timedelta(days=1))) < days:
+                self.stdout.write(self.style.WARNING(f'{month:%Y-%m}: rollups are not final, skipped.'))
+                month = next_month
+                continue
+
+            counts = {model: month_rows(model, month).count() for model in ARCHIVED_MODELS}
+            summary = ', '.join(f'{counts[model]} {model._meta.verbose_name_plural}' for model in ARCHIVED_MODELS)
+            if opts['dry_run']:
+                self.stdout.write(f'{month:%Y-%m}: would archive {summary}.')
+                month = next_month
+                continue
+
+            started = datetime.now()
+            for model in ARCHIVED_MODELS:
+                export_month(model, month, directory)
+            dropped = [model._meta.db_table for model in ARCHIVED_MODELS if delete_month(model, month)]
+            elapsed = (datetime.now() - started).total_seconds()
+            note = f' (dropped partitions: {", ".join(dropped)})' if dropped else ''
+            self.stdout.write(
+                f'{month:%Y-%m}: archived {summary} to '
+                f'{archive_path(Visit, month, directory).parent.parent} in {elapsed:.1f}s{note}.'
+            )
+            archived += 1
+            month = next_month
+
+        if opts['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: nothing archived (cutoff {cutoff}).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} month(s) older than {cutoff}.'))
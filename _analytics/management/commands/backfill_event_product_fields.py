@@ -0,0 +1,47 @@
+from django.db import transaction
+
+from GROCERY.batching import PkBatchCommand
+from _analytics.models import AnalyticsEvent
+from _analytics.tracking import product_event_fields
+
+
+PRODUCT_FIELDS = ('product', 'quantity', 'revenue', 'main_category', 'sub_category')
+
+
+class Command(PkBatchCommand):
+    help = (
+        'Copy product_id, quantity, line_total and categories from AnalyticsEvent.properties '
+        'into the typed product columns, one batch of events at a time.'
+    )
+    batch_size_help = 'Events handled per batch'
+    dry_run_help = 'Only count events that would be updated'
+    empty_message = 'No events to backfill.'
+    progress_verb = 'updated'
+
+    def get_queryset(self, opts):
+        return AnalyticsEvent.objects.filter(product__isnull=True, properties__has_key='product_id')
+
+    def _filled_events(self, batch):
+        events = []
+        for event in batch.only('pk', 'properties'):
+            fields = product_event_fields(event.properties)
+            if fields['product_id'] is None:
+                continue
+            for name, value in fields.items():
+                setattr(event, name, value)
+            events.append(event)
+        return events
+
+    def count_batch(self, batch, opts):
+        return len(self._filled_events(batch))
+
+    def update_batch(self, batch, opts):
+        events = self._filled_events(batch)
+        if events:
+            with transaction.atomic():
+                AnalyticsEvent.objects.bulk_update(events, PRODUCT_FIELDS)
+        return len(events)
+
+    def finish(self, changed, opts):
+        verb = 'Would update' if opts['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} product columns for {changed} event(s).'))
@@ -0,0 +1,24 @@
+from GROCERY.batching import PkBatchCommand
+from _analytics.conversions import rebuild_visit_conversions
+from _analytics.models import Visit
+
+
+class Command(PkBatchCommand):
+    help = (
+        'Rebuild per-visit conversion flags (product view, add to cart, checkout, paid) '
+        'and paid revenue from raw pageviews and events, one batch of visits at a time.'
+    )
+    batch_size_help = 'Visits handled per batch'
+    dry_run_help = 'Only count visits that would be rebuilt'
+    empty_message = 'No visits to backfill.'
+    progress_verb = 'rebuilt'
+
+    def get_queryset(self, opts):
+        return Visit.objects.all()
+
+    def update_batch(self, batch, opts):
+        return rebuild_visit_conversions(batch, batch_size=opts['batch_size'])
+
+    def finish(self, changed, opts):
+        verb = 'Would rebuild' if opts['dry_run'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'{verb} conversion flags for {changed} visit(s).'))
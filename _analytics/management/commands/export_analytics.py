@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from _analytics.exports import EXPORT_DATASETS, EXPORT_FORMATS, export_filename, export_queryset, stream_export
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD).')
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream raw visits, pageviews or events for a date window to a CSV or NDJSON '
+        'file, optionally gzipped, with the same filters as the visits dashboard.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORT_DATASETS))
+        parser.add_argument('--days', type=int, default=30, help='Days up to today, when --start/--end are not given')
+        parser.add_argument('--start', default='', help='First day (YYYY-MM-DD)')
+        parser.add_argument('--end', default='', help='Last day (YYYY-MM-DD)')
+        parser.add_argument('--format', dest='fmt', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--output', default='', help='Output file (default: analytics-<dataset>-<window>.<format>)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+        parser.add_argument('--device', default='')
+        parser.add_argument('--browser', default='')
+        parser.add_argument('--source', default='')
+        parser.add_argument('--campaign', default='')
+        parser.add_argument('--user-scope', choices=['all', 'authenticated', 'anonymous'], default='all')
+
+    def handle(self, *args, **opts):
+        if opts['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive.')
+        if bool(opts['start']) != bool(opts['end']):
+            raise CommandError('--start and --end must be given together.')
+        if opts['start']:
+            start_date, end_date = _parse_date(opts['start']), _parse_date(opts['end'])
+            if start_date > end_date:
+                raise CommandError('--start must not be after --end.')
+        else:
+            if opts['days'] < 1:
+                raise CommandError('--days must be at least 1.')
+            end_date = timezone.localdate()
+            start_date = end_date - timedelta(days=opts['days'] - 1)
+
+        filters = {
+            'device': opts['device'],
+            'browser': opts['browser'],
+            'user_scope': opts['user_scope'],
+            'source': opts['source'],
+            'campaign': opts['campaign'],
+        }
+        qs = export_queryset(opts['dataset'], start_date, end_date, filters)
+        output = opts['output'] or export_filename(
+            opts['dataset'], start_date, end_date, opts['fmt'], compress=opts['gzip']
+        )
+
+        started = time.monotonic()
+        written = 0
+        with open(output, 'wb') as handle:
+            for block in stream_export(qs, opts['fmt'], compress=opts['gzip'], chunk_size=opts['chunk_size']):
+                handle.write(block)
+                written += len(block)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {opts["dataset"]} {start_date}..{end_date} to {output} '
+            f'({written / 1024:.1f} KiB in {elapsed:.1f}s).'
+        ))
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from _analytics.archive import ARCHIVED_MODELS, archive_dir, archive_path, load_archive
+from _analytics.partitions import PARTITIONED_MODELS, PartitioningUnsupported, ensure_month_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'Load archived visits, pageviews and events for one or more months (YYYY-MM) '
+        'back into the database for ad-hoc analysis. Rows already present are skipped; '
+        'the next archive_analytics run archives them again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='+', help='Months to load, as YYYY-MM')
+        parser.add_argument('--archive-dir', default='', help='Directory holding the archive files (default: ANALYTICS_ARCHIVE_DIR)')
+
+    def handle(self, *args, **opts):
+        try:
+            months = sorted({datetime.strptime(value, '%Y-%m').date() for value in opts['months']})
+        except ValueError:
+            raise CommandError('Months must be given as YYYY-MM.')
+
+        directory = opts['archive_dir']
+        if not directory:
+            try:
+                directory = archive_dir()
+            except ImproperlyConfigured as exc:
+                raise CommandError(f'{exc} Or pass --archive-dir.')
+        # Parents first so pageviews and events find their visits.
+        for model in reversed(list(ARCHIVED_MODELS)):
+            for month in months:
+                path = archive_path(model, month, directory)
+                if not path.exists():
+                    self.stdout.write(self.style.WARNING(f'{path} not found, skipped.'))
+                    continue
+                if model in PARTITIONED_MODELS and is_partitioned(model):
+                    try:
+                        ensure_month_partitions(model, month, 1)
+                    except PartitioningUnsupported as exc:
+                        raise CommandError(str(exc))
+                loaded = load_archive(model, path)
+                self.stdout.write(f'{model._meta.db_table} {month:%Y-%m}: {loaded} row(s) loaded.')
+
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(months)} archived month(s).'))
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from _analytics.rollups import first_open_day, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Build daily visit rollups for the dashboard. Processes every day after '
+        'the last final rollup up to and including today. Dashboard reads also '
+        'roll up finished days on first use; run this to backfill or to keep '
+        'that work off the request path.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default='', help='Rebuild from this date (YYYY-MM-DD) instead of the first open day')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days aggregated per pass')
+
+    def handle(self, *args, **opts):
+        chunk_days = opts['chunk_days']
+        if chunk_days <= 0:
+            raise CommandError('--chunk-days must be positive.')
+
+        today = timezone.localdate()
+        if opts['since']:
+            try:
+                start = datetime.strptime(opts['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format.')
+        else:
+            start = first_open_day()
+        if start is None or start > today:
+            self.stdout.write(self.style.SUCCESS('Visit rollups are up to date.'))
+            return
+
+        now = timezone.now()
+        written = 0
+        chunk_start = start
+        while chunk_start <= today:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), today)
+            rows = rebuild_rollups(chunk_start, chunk_end, now=now)
+            written += rows
+            if opts['verbosity'] > 1:
+                self.stdout.write(f'{chunk_start}..{chunk_end}: {rows} row(s)')
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup row(s) for {start}..{today}.'))
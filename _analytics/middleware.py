@@ -1,4 +1,4 @@
-from .tracking import track_request
+from .tracking import save_visit_state, track_request
 
 
 class VisitTrackingMiddleware:
@@ -9,6 +9,7 @@ class VisitTrackingMiddleware:
         response = self.get_response(request)
         try:
             track_request(request, response)
+            save_visit_state(request, response)
         except Exception:
             pass
         return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0005_googleadslandingarrival'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visitpageview',
+            index=models.Index(fields=['visit', 'sequence_index'], name='Danalytics__visit_i_2bbe57_idx'),
+        ),
+    ]
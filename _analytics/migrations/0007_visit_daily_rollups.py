@@ -0,0 +1,58 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0006_visitpageview_visit_sequence_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitDailyRollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ('-day',),
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('traffic_source', models.CharField(blank=True, max_length=20)),
+                ('device_type', models.CharField(blank=True, max_length=20)),
+                ('browser_family', models.CharField(blank=True, max_length=50)),
+                ('utm_campaign', models.CharField(blank=True, max_length=255)),
+                ('referrer_host', models.CharField(blank=True, max_length=255)),
+                ('is_authenticated', models.BooleanField(default=False)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('bounced_sessions', models.PositiveIntegerField(default=0)),
+                ('session_seconds', models.PositiveBigIntegerField(default=0)),
+                ('pageviews', models.PositiveIntegerField(default=0)),
+                ('dwell_seconds', models.PositiveBigIntegerField(default=0)),
+                ('dwell_samples', models.PositiveIntegerField(default=0)),
+                ('product_view_sessions', models.PositiveIntegerField(default=0)),
+                ('google_ads_arrivals', models.PositiveIntegerField(default=0)),
+                ('signup_started', models.PositiveIntegerField(default=0)),
+                ('signup_completed', models.PositiveIntegerField(default=0)),
+                ('add_to_cart', models.PositiveIntegerField(default=0)),
+                ('checkout_started', models.PositiveIntegerField(default=0)),
+                ('paid_order', models.PositiveIntegerField(default=0)),
+                ('order_item_paid', models.PositiveIntegerField(default=0)),
+                ('add_to_cart_sessions', models.PositiveIntegerField(default=0)),
+                ('checkout_sessions', models.PositiveIntegerField(default=0)),
+                ('paid_sessions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-day',),
+                'indexes': [models.Index(fields=['day', 'traffic_source'], name='Danalytics__day_9f7430_idx'), models.Index(fields=['day', 'utm_campaign'], name='Danalytics__day_3adc4a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0007_visit_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitDailySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('dimension', models.CharField(blank=True, max_length=32)),
+                ('value', models.CharField(blank=True, max_length=255)),
+                ('registers', models.BinaryField()),
+            ],
+            options={
+                'ordering': ('-day',),
+                'unique_together': {('day', 'dimension', 'value')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0008_visitdailysketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageTransitionDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('from_path', models.CharField(max_length=2048)),
+                ('to_path', models.CharField(max_length=2048)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-day', '-count'),
+                'indexes': [models.Index(fields=['from_path', 'day'], name='Danalytics__from_pa_2ccef4_idx'), models.Index(fields=['day'], name='Danalytics__day_d6c916_idx')],
+            },
+        ),
+    ]
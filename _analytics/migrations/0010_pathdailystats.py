@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0009_pagetransitiondaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PathDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('path', models.CharField(max_length=2048)),
+                ('pageviews', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('dwell_seconds', models.PositiveBigIntegerField(default=0)),
+                ('dwell_samples', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-day', 'path'),
+                'indexes': [models.Index(fields=['day', 'path'], name='Danalytics__day_6c6780_idx'), models.Index(fields=['path'], name='pathdailystats_path_prefix', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+    ]
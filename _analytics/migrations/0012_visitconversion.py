@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0011_analyticsevent_product_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitConversion',
+            fields=[
+                ('visit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='conversion', serialize=False, to='_analytics.visit')),
+                ('viewed_product', models.BooleanField(default=False)),
+                ('added_to_cart', models.BooleanField(default=False)),
+                ('started_checkout', models.BooleanField(default=False)),
+                ('paid', models.BooleanField(default=False)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='visitdailyrollup',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0013_analyticsevent_pageview_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitpageview',
+            name='sample_weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='IngestionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('bot_pageview', 'Bot pageview (count only)'), ('bot_dropped', 'Bot pageview (dropped)'), ('sampled_out', 'Sampled-out pageview')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=100)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-day', 'kind', 'key'),
+                'unique_together': {('day', 'kind', 'key')},
+            },
+        ),
+    ]
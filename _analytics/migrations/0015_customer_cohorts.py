@@ -0,0 +1,54 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_accounts', '0012_alter_user_referral_code'),
+        ('_analytics', '0014_ingestioncounter_sample_weight'),
+        ('_orders', '0003_orderitem_purchase_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCohort',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='analytics_cohort', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('cohort_week', models.DateField(db_index=True)),
+                ('first_paid_at', models.DateTimeField()),
+                ('paid_orders', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CohortRetentionCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort_week', models.DateField()),
+                ('week_offset', models.PositiveSmallIntegerField()),
+                ('active_buyers', models.PositiveIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ('-cohort_week', 'week_offset'),
+                'unique_together': {('cohort_week', 'week_offset')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CohortOrder',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='_orders.order')),
+                ('week', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'week'], name='Danalytics__user_id_d63dce_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0015_customer_cohorts'),
+        ('_orders', '0003_orderitem_purchase_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('utm_source', models.CharField(blank=True, max_length=255)),
+                ('utm_campaign', models.CharField(blank=True, max_length=255)),
+                ('arrivals', models.PositiveIntegerField(default=0)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ('-day', 'utm_campaign', 'utm_source'),
+                'unique_together': {('day', 'utm_source', 'utm_campaign')},
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderAttribution',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='_orders.order')),
+                ('utm_source', models.CharField(blank=True, max_length=255)),
+                ('utm_campaign', models.CharField(blank=True, max_length=255)),
+                ('day', models.DateField(db_index=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('arrival', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='_analytics.googleadslandingarrival')),
+                ('visit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='_analytics.visit')),
+            ],
+        ),
+    ]
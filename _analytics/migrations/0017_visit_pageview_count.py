@@ -0,0 +1,42 @@
+# Generated by Django 5.1.2 on 2026-10-19 05:09
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+BATCH_SIZE = 5000
+
+
+def backfill_pageview_counts(apps, schema_editor):
+    Visit = apps.get_model('_analytics', 'Visit')
+    VisitPageview = apps.get_model('_analytics', 'VisitPageview')
+    # Row count covers pageviews stored before sequence indexes were tracked.
+    counts = (
+        VisitPageview.objects.filter(visit=OuterRef('pk'))
+        .order_by()
+        .values('visit')
+        .annotate(count=Greatest(Count('id'), Max('sequence_index'), output_field=IntegerField()))
+        .values('count')
+    )
+    last_pk = Visit.objects.aggregate(last=Max('pk'))['last'] or 0
+    for lower in range(0, last_pk + 1, BATCH_SIZE):
+        Visit.objects.filter(pk__gte=lower, pk__lt=lower + BATCH_SIZE).update(
+            pageview_count=Coalesce(Subquery(counts), Value(0)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_analytics', '0016_campaign_attribution'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='pageview_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_pageview_counts, migrations.RunPython.noop),
+    ]
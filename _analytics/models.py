@@ -44,6 +44,9 @@ class Visit(models.Model):
     utm_campaign = models.CharField(max_length=255, blank=True, db_index=True)
     utm_term = models.CharField(max_length=255, blank=True)
     utm_content = models.CharField(max_length=255, blank=True)
+    # Highest pageview sequence index seen, so pageviews that sampling did not
+    # store still count (e.g. when deciding whether the visit bounced).
+    pageview_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ('-started_at',)
@@ -72,11 +75,14 @@ class VisitPageview(models.Model):
     duration_seconds = models.PositiveIntegerField(null=True, blank=True)
     sequence_index = models.PositiveIntegerField(default=1)
     is_authenticated = models.BooleanField(default=False, db_index=True)
+    # Pageviews stored for a "1 in N" sampled path carry N, so sums scale back up.
+    sample_weight = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ('-viewed_at',)
         indexes = [
             models.Index(fields=['visit', 'viewed_at']),
+            models.Index(fields=['visit', 'sequence_index']),
             models.Index(fields=['path', 'viewed_at']),
             models.Index(fields=['session_key', 'viewed_at']),
         ]
@@ -93,11 +99,13 @@ class AnalyticsEvent(models.Model):
         on_delete=models.SET_NULL,
         related_name='events',
     )
+    # No database constraint: a partitioned pageview table has no unique id on its own.
     pageview = models.ForeignKey(
         VisitPageview,
         null=True,
         blank=True,
         on_delete=models.SET_NULL,
+        db_constraint=False,
         related_name='events',
     )
     user = models.ForeignKey(
@@ -113,6 +121,19 @@ class AnalyticsEvent(models.Model):
     label = models.CharField(max_length=255, blank=True)
     value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     properties = models.JSONField(default=dict, blank=True)
+    # Typed copies of product properties, filled at ingest for product events.
+    product = models.ForeignKey(
+        '_catalog.All_Products',
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    quantity = models.PositiveIntegerField(null=True, blank=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    main_category = models.CharField(max_length=255, blank=True)
+    sub_category = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
@@ -120,6 +141,7 @@ class AnalyticsEvent(models.Model):
         indexes = [
             models.Index(fields=['event_type', 'created_at']),
             models.Index(fields=['session_key', 'created_at']),
+            models.Index(fields=['event_type', 'created_at', 'product']),
         ]
 
     def __str__(self):
@@ -201,3 +223,245 @@ class AnalyticsSavedView(models.Model):
 
     def __str__(self):
         return f'{self.user_id}: {self.name}'
+
+
+class VisitDailyRollup(models.Model):
+    """Per-day traffic and conversion counters for one combination of visit dimensions."""
+
+    day = models.DateField(db_index=True)
+    traffic_source = models.CharField(max_length=20, blank=True)
+    device_type = models.CharField(max_length=20, blank=True)
+    browser_family = models.CharField(max_length=50, blank=True)
+    utm_campaign = models.CharField(max_length=255, blank=True)
+    referrer_host = models.CharField(max_length=255, blank=True)
+    is_authenticated = models.BooleanField(default=False)
+
+    sessions = models.PositiveIntegerField(default=0)
+    bounced_sessions = models.PositiveIntegerField(default=0)
+    session_seconds = models.PositiveBigIntegerField(default=0)
+    pageviews = models.PositiveIntegerField(default=0)
+    dwell_seconds = models.PositiveBigIntegerField(default=0)
+    dwell_samples = models.PositiveIntegerField(default=0)
+    product_view_sessions = models.PositiveIntegerField(default=0)
+    google_ads_arrivals = models.PositiveIntegerField(default=0)
+    signup_started = models.PositiveIntegerField(default=0)
+    signup_completed = models.PositiveIntegerField(default=0)
+    add_to_cart = models.PositiveIntegerField(default=0)
+    checkout_started = models.PositiveIntegerField(default=0)
+    paid_order = models.PositiveIntegerField(default=0)
+    order_item_paid = models.PositiveIntegerField(default=0)
+    add_to_cart_sessions = models.PositiveIntegerField(default=0)
+    checkout_sessions = models.PositiveIntegerField(default=0)
+    paid_sessions = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ('-day',)
+        indexes = [
+            models.Index(fields=['day', 'traffic_source']),
+            models.Index(fields=['day', 'utm_campaign']),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.traffic_source}/{self.device_type}/{self.browser_family}'
+
+
+class VisitDailyRollupDay(models.Model):
+    """Marks a day whose rollup rows have been written and when."""
+
+    day = models.DateField(unique=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-day',)
+
+    def __str__(self):
+        return f'{self.day} (computed {self.computed_at:%Y-%m-%d %H:%M})'
+
+
+class VisitDailySketch(models.Model):
+    """
+    HyperLogLog sketch of distinct visitors for one day, either over all
+    traffic (blank dimension) or for a single dimension value.
+    """
+
+    day = models.DateField()
+    dimension = models.CharField(max_length=32, blank=True)
+    value = models.CharField(max_length=255, blank=True)
+    registers = models.BinaryField()
+
+    class Meta:
+        ordering = ('-day',)
+        unique_together = [('day', 'dimension', 'value')]
+
+    def __str__(self):
+        return f'{self.day} {self.dimension or "all"}={self.value}'
+
+
+class PageTransitionDaily(models.Model):
+    """How often visitors went from one page straight to another on a given day."""
+
+    day = models.DateField()
+    from_path = models.CharField(max_length=2048)
+    to_path = models.CharField(max_length=2048)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('-day', '-count')
+        indexes = [
+            models.Index(fields=['from_path', 'day']),
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.from_path} -> {self.to_path} ({self.count})'
+
+
+class PathDailyStats(models.Model):
+    """Per-day pageview, session and dwell counters for one path."""
+
+    day = models.DateField()
+    path = models.CharField(max_length=2048)
+    pageviews = models.PositiveIntegerField(default=0)
+    sessions = models.PositiveIntegerField(default=0)
+    dwell_seconds = models.PositiveBigIntegerField(default=0)
+    dwell_samples = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('-day', 'path')
+        indexes = [
+            models.Index(fields=['day', 'path']),
+            # varchar_pattern_ops lets PostgreSQL serve LIKE 'prefix%' from the index.
+            models.Index(fields=['path'], name='pathdailystats_path_prefix', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.path} ({self.pageviews})'
+
+
+class VisitConversion(models.Model):
+    """Funnel flags and paid revenue for one visit, kept up to date as events arrive."""
+
+    visit = models.OneToOneField(Visit, on_delete=models.CASCADE, primary_key=True, related_name='conversion')
+    viewed_product = models.BooleanField(default=False)
+    added_to_cart = models.BooleanField(default=False)
+    started_checkout = models.BooleanField(default=False)
+    paid = models.BooleanField(default=False)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'Conversion for visit #{self.visit_id}'
+
+
+class IngestionCounter(models.Model):
+    """Per-day count of tracking records that were not stored: bot traffic and sampled-out pageviews."""
+
+    KIND_BOT_PAGEVIEW = 'bot_pageview'
+    KIND_BOT_DROPPED = 'bot_dropped'
+    KIND_SAMPLED_OUT = 'sampled_out'
+    KIND_CHOICES = [
+        (KIND_BOT_PAGEVIEW, 'Bot pageview (count only)'),
+        (KIND_BOT_DROPPED, 'Bot pageview (dropped)'),
+        (KIND_SAMPLED_OUT, 'Sampled-out pageview'),
+    ]
+
+    day = models.DateField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100, blank=True)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ('-day', 'kind', 'key')
+        unique_together = [('day', 'kind', 'key')]
+
+    def __str__(self):
+        return f'{self.day} {self.kind} {self.key or "-"}: {self.count}'
+
+
+class CustomerCohort(models.Model):
+    """A customer's acquisition week: the Monday of the week their first order was paid."""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='analytics_cohort',
+    )
+    cohort_week = models.DateField(db_index=True)
+    first_paid_at = models.DateTimeField()
+    paid_orders = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'User #{self.user_id} (cohort {self.cohort_week})'
+
+
+class CohortOrder(models.Model):
+    """One row per paid order already counted in the retention matrix."""
+
+    order = models.OneToOneField('_orders.Order', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    week = models.DateField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'week'])]
+
+    def __str__(self):
+        return f'Order #{self.order_id} in week {self.week}'
+
+
+class CohortRetentionCell(models.Model):
+    """Active buyers, paid orders and revenue for one acquisition week, ``week_offset`` weeks later."""
+
+    cohort_week = models.DateField()
+    week_offset = models.PositiveSmallIntegerField()
+    active_buyers = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ('-cohort_week', 'week_offset')
+        unique_together = [('cohort_week', 'week_offset')]
+
+    def __str__(self):
+        return f'{self.cohort_week} +{self.week_offset}w: {self.active_buyers} buyers'
+
+
+class OrderAttribution(models.Model):
+    """The campaign visit a paid order is credited to (last touch), fixed once when the order is paid."""
+
+    order = models.OneToOneField('_orders.Order', on_delete=models.CASCADE, primary_key=True, related_name='+')
+    visit = models.ForeignKey(Visit, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    arrival = models.ForeignKey(
+        GoogleAdsLandingArrival,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    utm_source = models.CharField(max_length=255, blank=True)
+    utm_campaign = models.CharField(max_length=255, blank=True)
+    day = models.DateField(db_index=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'Order #{self.order_id} -> {self.utm_campaign or "unattributed"}'
+
+
+class CampaignDailyStats(models.Model):
+    """Per-day campaign counters kept current by tracking and payments, so ad reports never scan raw rows."""
+
+    day = models.DateField()
+    utm_source = models.CharField(max_length=255, blank=True)
+    utm_campaign = models.CharField(max_length=255, blank=True)
+    arrivals = models.PositiveIntegerField(default=0)
+    sessions = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ('-day', 'utm_campaign', 'utm_source')
+        unique_together = [('day', 'utm_source', 'utm_campaign')]
+
+    def __str__(self):
+        return f'{self.day} {self.utm_source}/{self.utm_campaign}'
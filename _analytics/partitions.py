@@ -0,0 +1,283 @@
+"""
+Monthly range partitioning of the raw analytics tables on PostgreSQL.
+
+``convert_to_partitioned`` turns an existing table into a partitioned parent
+without copying rows: the old table is attached as one partition covering
+everything before the next month, and each later month gets its own
+partition, so retention can drop a month with a single DDL statement. A
+DEFAULT partition catches rows beyond the last created month, so a missed
+``analytics_partitions`` run never makes inserts fail.
+Partitioned parents use ``(id, <time column>)`` as primary key, because
+PostgreSQL requires unique constraints to include the partition key.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AnalyticsEvent, VisitPageview
+
+
+PARTITIONED_MODELS = {
+    VisitPageview: 'viewed_at',
+    AnalyticsEvent: 'created_at',
+}
+LEGACY_SUFFIX = '_p_legacy'
+DEFAULT_SUFFIX = '_p_default'
+_BOUND_RE = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+
+class PartitioningUnsupported(Exception):
+    pass
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month: date):
+    """Aware datetimes for the first instant of ``month`` and of the next month."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(month_start(month), datetime.min.time()), tz),
+        timezone.make_aware(datetime.combine(add_months(month, 1), datetime.min.time()), tz),
+    )
+
+
+def partition_name(model, month: date) -> str:
+    return f'{model._meta.db_table}_p{month:%Y_%m}'
+
+
+def _require_postgres():
+    if connection.vendor != 'postgresql':
+        raise PartitioningUnsupported(f'Partitioning needs PostgreSQL, not {connection.vendor}.')
+
+
+def is_partitioned(model) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.oid = to_regclass(%s)',
+            [model._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def _parse_bound(raw):
+    if raw in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(raw.strip("'"))
+
+
+def list_partitions(model):
+    """``(name, lower, upper)`` for each partition; open bounds are None."""
+    if not is_partitioned(model):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname',
+            [model._meta.db_table],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or '')
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return partitions
+
+
+def month_partition(model, month: date):
+    """Name of the partition holding exactly ``month``, or None (e.g. still in the legacy partition)."""
+    lower, upper = month_bounds(month)
+    for name, part_lower, part_upper in list_partitions(model):
+        if part_lower == lower and part_upper == upper:
+            return name
+    return None
+
+
+def ensure_month_partitions(model, first_month: date, months: int) -> list[str]:
+    """Create missing monthly partitions from ``first_month``; returns the names created."""
+    _require_postgres()
+    if not is_partitioned(model):
+        raise PartitioningUnsupported(f'{model._meta.db_table} is not partitioned yet.')
+    covered = list_partitions(model)
+    created = []
+    for offset in range(months):
+        month = add_months(month_start(first_month), offset)
+        lower, upper = month_bounds(month)
+        if any(
+            (part_lower is None or part_lower < upper) and (part_upper is None or lower < part_upper)
+            for _, part_lower, part_upper in covered
+        ):
+            continue
+        name = partition_name(model, month)
+        _create_month_partition(model, name, lower, upper)
+        covered.append((name, lower, upper))
+        created.append(name)
+    return created
+
+
+def default_partition_name(model) -> str:
+    return f'{model._meta.db_table}{DEFAULT_SUFFIX}'
+
+
+def has_default_partition(model) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [default_partition_name(model)])
+        return cursor.fetchone()[0]
+
+
+def ensure_default_partition(model) -> bool:
+    """Create the DEFAULT partition if missing; returns True when it was created."""
+    _require_postgres()
+    if has_default_partition(model):
+        return False
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {qn(default_partition_name(model))} PARTITION OF {qn(model._meta.db_table)} DEFAULT'
+        )
+    return True
+
+
+def _create_month_partition(model, name, lower, upper):
+    """
+    PostgreSQL refuses a new range partition while the DEFAULT partition holds
+    rows in that range, so those rows are moved into it in the same transaction.
+    """
+    table = model._meta.db_table
+    column = PARTITIONED_MODELS[model]
+    qn = connection.ops.quote_name
+    default = default_partition_name(model)
+    with transaction.atomic(), connection.cursor() as cursor:
+        stranded = False
+        if has_default_partition(model):
+            cursor.execute(
+                f'SELECT EXISTS (SELECT 1 FROM {qn(default)} WHERE {qn(column)} >= %s AND {qn(column)} < %s)',
+                [lower, upper],
+            )
+            stranded = cursor.fetchone()[0]
+        if stranded:
+            cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(default)}')
+        cursor.execute(
+            f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper],
+        )
+        if stranded:
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {qn(default)} WHERE {qn(column)} >= %s AND {qn(column)} < %s RETURNING *) '
+                f'INSERT INTO {qn(name)} SELECT * FROM moved',
+                [lower, upper],
+            )
+            cursor.execute(f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(default)} DEFAULT')
+
+
+def drop_month_partition(model, month: date) -> bool:
+    """Detach and drop the partition for ``month``. Returns False when it has no own partition."""
+    name = month_partition(model, month)
+    if name is None:
+        return False
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {qn(model._meta.db_table)} DETACH PARTITION {qn(name)}')
+        cursor.execute(f'DROP TABLE {qn(name)}')
+    return True
+
+
+def convert_to_partitioned(model, *, months_ahead=2) -> str:
+    """
+    Convert ``model``'s table in place. The existing table becomes the
+    ``<table>_p_legacy`` partition for all rows before the next month; a
+    validated CHECK constraint lets PostgreSQL attach it without rescanning.
+    Indexes keep their Django names on the parent and foreign keys are
+    recreated there, so later schema migrations keep working.
+    """
+    _require_postgres()
+    if is_partitioned(model):
+        return ''
+    column = PARTITIONED_MODELS[model]
+    table = model._meta.db_table
+    legacy = f'{table}{LEGACY_SUFFIX}'
+    sequence = f'{table}_pk_seq'
+    qn = connection.ops.quote_name
+    boundary, _ = month_bounds(add_months(timezone.localdate(), 1))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ("
+            "  SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p')",
+            [table, table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+            [table],
+        )
+        primary_key = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}')
+        if primary_key:
+            cursor.execute(f'ALTER TABLE {qn(legacy)} RENAME CONSTRAINT {qn(primary_key[0])} TO {qn(legacy + "_pkey")}')
+        for index_name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {qn(index_name)} RENAME TO {qn(index_name[:50] + "_legacy")}')
+
+        # Partitioned parents cannot own identity columns before PostgreSQL 17,
+        # so ids move to a plain sequence shared by every partition.
+        cursor.execute(f'ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'CREATE SEQUENCE {qn(sequence)}')
+        cursor.execute(
+            f'SELECT setval(%s, COALESCE((SELECT MAX(id) FROM {qn(legacy)}), 0) + 1, false)',
+            [sequence],
+        )
+
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+            f'PARTITION BY RANGE ({qn(column)})'
+        )
+        cursor.execute(f'ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval(%s)', [sequence])
+        cursor.execute(f'ALTER SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id')
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, {qn(column)})')
+
+        check = f'{legacy}_range'
+        cursor.execute(
+            f'ALTER TABLE {qn(legacy)} ADD CONSTRAINT {qn(check)} '
+            f'CHECK ({qn(column)} IS NOT NULL AND {qn(column)} < %s) NOT VALID',
+            [boundary],
+        )
+        cursor.execute(f'ALTER TABLE {qn(legacy)} VALIDATE CONSTRAINT {qn(check)}')
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} FOR VALUES FROM (MINVALUE) TO (%s)',
+            [boundary],
+        )
+        cursor.execute(f'ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(check)}')
+
+        for index_name, definition in indexes:
+            # Definitions were read before the rename, so they already name the parent table.
+            cursor.execute(definition.replace(' ON ', ' ON ONLY ', 1))
+            cursor.execute(f'ALTER INDEX {qn(index_name)} ATTACH PARTITION {qn(index_name[:50] + "_legacy")}')
+
+        for constraint_name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(constraint_name)} {definition}')
+
+    ensure_month_partitions(model, boundary.date(), months_ahead)
+    ensure_default_partition(model)
+    return legacy
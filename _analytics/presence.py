@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import Visit, VisitPageview
+
+
+PRESENCE_PREFIX = '_analytics:presence'
+WORKERS_KEY = f'{PRESENCE_PREFIX}:workers'
+WINDOW_MINUTES = 5
+
+
+def path_section(path: str) -> str:
+    """First path segment as a prefix: '/product/milk/' -> '/product/', '/' -> '/'."""
+    segment = (path or '/').lstrip('/').split('/', 1)[0]
+    return f'/{segment}/' if segment else '/'
+
+
+def uses_shared_cache() -> bool:
+    """
+    Whether presence buckets can be merged across workers. Auto-detected
+    from the default cache backend unless ``VISIT_PRESENCE_SHARED_CACHE``
+    says otherwise; LocMem and dummy caches are private to one process.
+    """
+    configured = getattr(settings, 'VISIT_PRESENCE_SHARED_CACHE', None)
+    if configured is not None:
+        return bool(configured)
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+class PresenceTracker:
+    """
+    Sliding-window presence for the "active now" counter. Each worker keeps
+    the visitors it served in per-minute buckets and copies them to the
+    shared cache at most every ``flush_seconds``; readers merge the buckets
+    of every live worker for the last ``WINDOW_MINUTES`` minutes. Only used
+    when the cache backend is shared between workers (``uses_shared_cache``).
+    """
+
+    def __init__(self, *, flush_seconds=10.0, worker_id=None):
+        self.flush_seconds = float(flush_seconds)
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self._minutes = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def record(self, visitor: str, device: str, path: str, *, now=None) -> None:
+        now = time.time() if now is None else now
+        minute = int(now // 60)
+        with self._lock:
+            self._minutes.setdefault(minute, {})[visitor] = (device or 'other', path_section(path))
+            due = now - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush(now=now)
+
+    def flush(self, *, now=None) -> None:
+        now = time.time() if now is None else now
+        oldest = int(now // 60) - WINDOW_MINUTES + 1
+        with self._lock:
+            for minute in [minute for minute in self._minutes if minute < oldest]:
+                del self._minutes[minute]
+            snapshot = {minute: dict(visitors) for minute, visitors in self._minutes.items()}
+            self._last_flush = now
+        timeout = (WINDOW_MINUTES + 1) * 60
+        if snapshot:
+            cache.set_many(
+                {f'{PRESENCE_PREFIX}:{minute}:{self.worker_id}': visitors for minute, visitors in snapshot.items()},
+                timeout,
+            )
+        # Re-registering on every flush heals lost updates from concurrent writers.
+        workers = {
+            worker: seen
+            for worker, seen in (cache.get(WORKERS_KEY) or {}).items()
+            if now - seen < timeout
+        }
+        workers[self.worker_id] = now
+        cache.set(WORKERS_KEY, workers, timeout)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> PresenceTracker:
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = PresenceTracker(flush_seconds=getattr(settings, 'VISIT_PRESENCE_FLUSH_SECONDS', 10))
+    return _tracker
+
+
+def record(visitor, device, path, *, now=None):
+    if uses_shared_cache():
+        get_tracker().record(visitor, device, path, now=now)
+
+
+def active_visitors(*, now=None) -> dict:
+    """
+    ``{visitor: (device, section)}`` for everyone seen in the window; newest
+    bucket wins. Only reads the cache: buckets reach it when workers flush, so
+    counts lag by up to ``VISIT_PRESENCE_FLUSH_SECONDS``.
+    """
+    now = time.time() if now is None else now
+    current = int(now // 60)
+    workers = sorted(cache.get(WORKERS_KEY) or {})
+    keys = [
+        f'{PRESENCE_PREFIX}:{minute}:{worker}'
+        for minute in range(current - WINDOW_MINUTES + 1, current + 1)
+        for worker in workers
+    ]
+    buckets = cache.get_many(keys)
+    merged = {}
+    for key in keys:
+        merged.update(buckets.get(key) or {})
+    return merged
+
+
+def _database_visitors(now) -> dict:
+    """``{visit_id: (device, section)}`` from ``Visit.last_seen_at`` and each visit's newest pageview."""
+    since = datetime.fromtimestamp(now, tz=dt_timezone.utc) - timedelta(minutes=WINDOW_MINUTES)
+    visitors = {
+        visit_id: (device or 'other', '/')
+        for visit_id, device in Visit.objects.filter(last_seen_at__gte=since).values_list('pk', 'device_type')
+    }
+    pageviews = (
+        VisitPageview.objects.filter(visit_id__in=list(visitors), viewed_at__gte=since)
+        .order_by('viewed_at', 'pk')
+        .values_list('visit_id', 'path')
+    )
+    for visit_id, path in pageviews:
+        visitors[visit_id] = (visitors[visit_id][0], path_section(path))
+    return visitors
+
+
+def presence_summary(*, now=None, limit=8) -> dict:
+    """
+    The "active now" card. Without a shared cache each worker would only see
+    its own visitors, so the count then comes from ``Visit.last_seen_at``.
+    """
+    now = time.time() if now is None else now
+    visitors = active_visitors(now=now) if uses_shared_cache() else _database_visitors(now)
+    devices = Counter(device for device, _ in visitors.values())
+    sections = Counter(section for _, section in visitors.values())
+    return {
+        'active_users': len(visitors),
+        'window_minutes': WINDOW_MINUTES,
+        'devices': [{'label': label, 'count': count} for label, count in devices.most_common(limit)],
+        'sections': [{'label': label, 'count': count} for label, count in sections.most_common(limit)],
+    }
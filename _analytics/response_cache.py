@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = '_analytics:response'
+GENERATION_KEY = '_analytics:response:generation'
+FILTER_VALUES_KEY = '_analytics:filter_values'
+FILTER_VALUES_TIMEOUT = 60 * 60
+# Bounds how long a crashed refresh can block the next one; independent of
+# the entry TTL, which is hours for closed windows.
+REFRESH_LOCK_TIMEOUT = 60
+# How long a cold miss waits for a refresh another worker is running before
+# building the payload itself.
+REFRESH_WAIT_SECONDS = 10
+REFRESH_POLL_SECONDS = 0.2
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'ANALYTICS_RESPONSE_CACHE', True)
+
+
+def live_ttl() -> int:
+    return getattr(settings, 'ANALYTICS_CACHE_LIVE_SECONDS', 60)
+
+
+def closed_ttl() -> int:
+    return getattr(settings, 'ANALYTICS_CACHE_CLOSED_SECONDS', 6 * 60 * 60)
+
+
+def stale_seconds() -> int:
+    return getattr(settings, 'ANALYTICS_CACHE_STALE_SECONDS', 15 * 60)
+
+
+def generation() -> int:
+    return cache.get_or_set(GENERATION_KEY, 1, None)
+
+
+def invalidate_all() -> None:
+    """Retire every cached response, e.g. after finalised rollup days were rewritten."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, None)
+    cache.delete(FILTER_VALUES_KEY)
+
+
+def response_cache_key(namespace, params) -> str:
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'{CACHE_PREFIX}:{generation()}:{namespace}:{digest}'
+
+
+def _store(key, payload, ttl):
+    entry = {'payload': payload, 'fresh_until': time.time() + ttl}
+    cache.set(key, entry, ttl + stale_seconds())
+    return entry
+
+
+def _refresh(key, build, ttl, lock_key):
+    try:
+        _store(key, build(), ttl)
+    except Exception:
+        logger.exception('Analytics response refresh failed for %s', key)
+    finally:
+        cache.delete(lock_key)
+        connection.close()
+
+
+def refresh_in_background(key, build, ttl) -> bool:
+    """
+    Recompute ``key`` on a daemon thread unless another worker already is.
+    Returns False when a refresh was already in flight.
+    """
+    lock_key = f'{key}:refreshing'
+    if not cache.add(lock_key, 1, REFRESH_LOCK_TIMEOUT):
+        return False
+    threading.Thread(target=_refresh, args=(key, build, ttl, lock_key), name='analytics-refresh', daemon=True).start()
+    return True
+
+
+def _wait_for_refresh(key, lock_key):
+    deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+    while True:
+        entry = cache.get(key)
+        if entry is not None or cache.get(lock_key) is None or time.monotonic() >= deadline:
+            return entry
+        time.sleep(REFRESH_POLL_SECONDS)
+
+
+def cached_response(namespace, params, build, *, ttl):
+    """
+    Return the JSON payload for ``params``, computing it with ``build`` on a
+    miss. Entries stay fresh for ``ttl`` seconds; after that the stale payload
+    is still served for ``ANALYTICS_CACHE_STALE_SECONDS`` while a background
+    thread recomputes it, so only a cold key makes the caller wait. A miss
+    takes the same ``:refreshing`` lock as the background refresh; when the
+    lock is already held (e.g. by ``warm``), it waits for that result instead
+    of building the payload a second time.
+    """
+    if not is_enabled():
+        return build()
+    key = response_cache_key(namespace, params)
+    entry = cache.get(key)
+    if entry is None:
+        lock_key = f'{key}:refreshing'
+        if not cache.add(lock_key, 1, REFRESH_LOCK_TIMEOUT):
+            entry = _wait_for_refresh(key, lock_key)
+            if entry is not None:
+                return entry['payload']
+            # The refresh failed or is taking too long; do not keep the user waiting on it.
+            return _store(key, build(), ttl)['payload']
+        try:
+            return _store(key, build(), ttl)['payload']
+        finally:
+            cache.delete(lock_key)
+    if entry['fresh_until'] <= time.time():
+        refresh_in_background(key, build, ttl)
+    return entry['payload']
+
+
+def warm(namespace, params, build, *, ttl) -> bool:
+    """Start computing a cold key in the background, e.g. when the dashboard shell loads."""
+    if not is_enabled():
+        return False
+    key = response_cache_key(namespace, params)
+    if cache.get(key) is not None:
+        return False
+    return refresh_in_background(key, build, ttl)
+
+
+def cached_filter_values(build):
+    """Distinct dimension values for the dashboard filter dropdowns."""
+    if not is_enabled():
+        return build()
+    return cache.get_or_set(FILTER_VALUES_KEY, build, FILTER_VALUES_TIMEOUT)
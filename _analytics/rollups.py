@@ -0,0 +1,502 @@
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Q, Sum, Window
+from django.db.models.functions import Coalesce, Lag, Lead, TruncDate
+from django.utils import timezone
+
+from . import response_cache
+from .hll import HyperLogLog
+from .models import (
+    AnalyticsEvent,
+    GoogleAdsLandingArrival,
+    PageTransitionDaily,
+    PathDailyStats,
+    Visit,
+    VisitConversion,
+    VisitDailyRollup,
+    VisitDailyRollupDay,
+    VisitDailySketch,
+    VisitPageview,
+)
+from .tracking import get_visit_settings
+
+
+ROLLUP_DIMENSIONS = ('traffic_source', 'device_type', 'browser_family', 'utm_campaign', 'referrer_host', 'is_authenticated')
+CONVERSION_EVENT_TYPES = ('signup_started', 'signup_completed', 'add_to_cart', 'checkout_started', 'paid_order', 'order_item_paid')
+# VisitConversion flag -> rollup counter of visits with that flag.
+FUNNEL_SESSION_METRICS = {
+    'viewed_product': 'product_view_sessions',
+    'added_to_cart': 'add_to_cart_sessions',
+    'started_checkout': 'checkout_sessions',
+    'paid': 'paid_sessions',
+}
+ROLLUP_METRICS = (
+    'sessions',
+    'bounced_sessions',
+    'session_seconds',
+    'pageviews',
+    'dwell_seconds',
+    'dwell_samples',
+    'google_ads_arrivals',
+    *CONVERSION_EVENT_TYPES,
+    *FUNNEL_SESSION_METRICS.values(),
+    'revenue',
+)
+
+# Dimensions that get their own per-value visitor sketch; '' is all traffic.
+SKETCH_DIMENSIONS = ('traffic_source', 'device_type', 'browser_family', 'utm_campaign', 'is_authenticated')
+
+# Filter name used by the dashboard -> rollup dimension.
+FILTER_DIMENSIONS = {
+    'device': 'device_type',
+    'browser': 'browser_family',
+    'source': 'traffic_source',
+    'campaign': 'utm_campaign',
+}
+
+
+def pageview_count():
+    """Pageview total scaled back up by sample weights (a plain count when nothing is sampled)."""
+    return Coalesce(Sum('sample_weight'), 0)
+
+
+def path_session_count():
+    """Distinct visits on one path; every stored pageview of a path shares its sampling weight."""
+    return Count('visit', distinct=True) * Coalesce(Max('sample_weight'), 1)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def window_bounds(start_date, end_date):
+    """Aware ``[start, end)`` datetimes covering ``start_date``..``end_date`` in local time."""
+    return _day_start(start_date), _day_start(end_date + timedelta(days=1))
+
+
+def _dimension_key(row, prefix=''):
+    values = []
+    for dimension in ROLLUP_DIMENSIONS:
+        value = row.get(f'{prefix}{dimension}')
+        values.append(bool(value) if dimension == 'is_authenticated' else (value or ''))
+    return tuple(values)
+
+
+def compute_rollup_rows(start_date, end_date):
+    """
+    Aggregate raw visits, pageviews, events and Google Ads arrivals for
+    ``start_date``..``end_date`` (inclusive) into rollup rows keyed by day and
+    visit dimensions. Issues a fixed number of grouped queries for any range.
+    """
+    start_dt = _day_start(start_date)
+    end_dt = _day_start(end_date + timedelta(days=1))
+    visit_prefix = [f'visit__{dimension}' for dimension in ROLLUP_DIMENSIONS]
+    rows = {}
+
+    def row_for(day, key):
+        row = rows.get((day, key))
+        if row is None:
+            row = dict(zip(ROLLUP_DIMENSIONS, key), day=day, **{metric: 0 for metric in ROLLUP_METRICS})
+            rows[(day, key)] = row
+        return row
+
+    visits = Visit.objects.filter(started_at__gte=start_dt, started_at__lt=end_dt).annotate(day=TruncDate('started_at'))
+    session_length = ExpressionWrapper(F('last_seen_at') - F('started_at'), output_field=DurationField())
+    for row in visits.values('day', *ROLLUP_DIMENSIONS).annotate(sessions=Count('id'), session_length=Sum(session_length)):
+        target = row_for(row['day'], _dimension_key(row))
+        target['sessions'] += row['sessions']
+        length = row['session_length']
+        target['session_seconds'] += max(0, int(length.total_seconds())) if length else 0
+
+    # Visit.pageview_count includes sampled-out pageviews, so a visit whose
+    # first page was not stored does not count as a bounce.
+    bounced = (
+        visits.filter(pageview_count__lte=1)
+        .values('day', *ROLLUP_DIMENSIONS)
+        .annotate(bounced=Count('id'))
+    )
+    for row in bounced:
+        row_for(row['day'], _dimension_key(row))['bounced_sessions'] += row['bounced']
+
+    pageviews = (
+        VisitPageview.objects.filter(viewed_at__gte=start_dt, viewed_at__lt=end_dt)
+        .annotate(day=TruncDate('viewed_at'))
+        .values('day', *visit_prefix)
+        .annotate(
+            pageviews=pageview_count(),
+            dwell_seconds=Sum('duration_seconds'),
+            dwell_samples=Count('duration_seconds'),
+        )
+    )
+    for row in pageviews:
+        target = row_for(row['day'], _dimension_key(row, 'visit__'))
+        target['pageviews'] += row['pageviews']
+        target['dwell_seconds'] += row['dwell_seconds'] or 0
+        target['dwell_samples'] += row['dwell_samples']
+
+    events = (
+        AnalyticsEvent.objects.filter(
+            created_at__gte=start_dt,
+            created_at__lt=end_dt,
+            event_type__in=CONVERSION_EVENT_TYPES,
+        )
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'event_type', *visit_prefix)
+        .annotate(count=Count('id'))
+    )
+    for row in events:
+        row_for(row['day'], _dimension_key(row, 'visit__'))[row['event_type']] += row['count']
+
+    # Funnel counts come from the narrow per-visit conversion table,
+    # attributed to the day the visit started.
+    funnel = (
+        VisitConversion.objects.filter(visit__started_at__gte=start_dt, visit__started_at__lt=end_dt)
+        .annotate(day=TruncDate('visit__started_at'))
+        .values('day', *visit_prefix)
+        .annotate(
+            revenue_total=Sum('revenue'),
+            **{metric: Count('pk', filter=Q(**{flag: True})) for flag, metric in FUNNEL_SESSION_METRICS.items()},
+        )
+    )
+    for row in funnel:
+        target = row_for(row['day'], _dimension_key(row, 'visit__'))
+        for metric in FUNNEL_SESSION_METRICS.values():
+            target[metric] += row[metric]
+        target['revenue'] += row['revenue_total'] or 0
+
+    arrivals = (
+        GoogleAdsLandingArrival.objects.filter(arrived_at__gte=start_dt, arrived_at__lt=end_dt)
+        .filter(Q(user__isnull=True) | Q(user__is_superuser=False))
+        .annotate(day=TruncDate('arrived_at'))
+        .values('day', *ROLLUP_DIMENSIONS)
+        .annotate(arrivals=Count('id'))
+    )
+    for row in arrivals:
+        row_for(row['day'], _dimension_key(row))['google_ads_arrivals'] += row['arrivals']
+
+    return list(rows.values())
+
+
+def _sketch_value(dimension, value):
+    if dimension == 'is_authenticated':
+        return '1' if value else '0'
+    return value or ''
+
+
+def visitor_key(user_id, session_key):
+    return f'{user_id or 0}:{session_key or ""}'
+
+
+def compute_visitor_sketches(start_date, end_date, *, only=None):
+    """
+    Build visitor sketches keyed by (day, dimension, value) for visits started
+    in the range. ``only`` restricts the work to one (dimension, value) pair.
+    Streams one day range of visits; memory stays at one sketch per key.
+    """
+    visits = Visit.objects.filter(
+        started_at__gte=_day_start(start_date),
+        started_at__lt=_day_start(end_date + timedelta(days=1)),
+    )
+    if only is not None and only[0]:
+        dimension, value = only
+        if dimension == 'is_authenticated':
+            visits = visits.filter(is_authenticated=value == '1')
+        else:
+            visits = visits.filter(**{dimension: value})
+
+    sketches = {}
+    rows = (
+        visits.annotate(day=TruncDate('started_at'))
+        .values_list('day', 'user_id', 'session_key', *SKETCH_DIMENSIONS)
+        .order_by()
+        .iterator(chunk_size=2000)
+    )
+    for day, user_id, session_key, *dimension_values in rows:
+        key = visitor_key(user_id, session_key)
+        if only is not None:
+            targets = [(day, *only)]
+        else:
+            targets = [(day, '', '')] + [
+                (day, dimension, _sketch_value(dimension, value))
+                for dimension, value in zip(SKETCH_DIMENSIONS, dimension_values)
+            ]
+        for target in targets:
+            sketch = sketches.get(target)
+            if sketch is None:
+                sketch = sketches[target] = HyperLogLog()
+            sketch.add(key)
+    return sketches
+
+
+def _visit_sequence_window(expression):
+    return Window(
+        expression,
+        partition_by=[F('visit_id')],
+        order_by=[F('sequence_index').asc(), F('viewed_at').asc()],
+    )
+
+
+def compute_page_transitions(start_date, end_date):
+    """
+    Count (day, from_path, to_path) transitions for pageviews viewed in the
+    range, using LEAD(path) over each visit's sequence in a single query.
+    Pageviews up to one session timeout after the range are read so the
+    last page of the final day still gets its successor.
+    """
+    start_dt = _day_start(start_date)
+    end_dt = _day_start(end_date + timedelta(days=1))
+    grace = timedelta(seconds=get_visit_settings().session_timeout_seconds)
+    rows = (
+        VisitPageview.objects.filter(viewed_at__gte=start_dt, viewed_at__lt=end_dt + grace)
+        .annotate(day=TruncDate('viewed_at'), next_path=_visit_sequence_window(Lead('path')))
+        .values_list('day', 'viewed_at', 'path', 'next_path')
+        .order_by()
+    )
+    counts = Counter()
+    for day, viewed_at, path, next_path in rows.iterator(chunk_size=2000):
+        if next_path is not None and viewed_at < end_dt:
+            counts[(day, path or '', next_path or '')] += 1
+    return counts
+
+
+def next_page_counts(pageviews_qs, path):
+    """
+    Pages viewed directly after ``path`` within ``pageviews_qs``, in one query:
+    LAG(path) over each visit's sequence, keeping rows whose previous page is
+    ``path``. Only visits that viewed ``path`` are scanned.
+    """
+    rows = (
+        pageviews_qs.filter(visit_id__in=pageviews_qs.filter(path=path).values('visit_id'))
+        .annotate(previous_path=_visit_sequence_window(Lag('path')))
+        .filter(previous_path=path)
+        .values_list('path', flat=True)
+        .order_by()
+    )
+    return Counter(rows)
+
+
+def stored_next_page_counts(path, days):
+    counts = Counter()
+    rows = (
+        PageTransitionDaily.objects.filter(from_path=path, day__in=days)
+        .values('to_path')
+        .annotate(total=Sum('count'))
+        .order_by()
+    )
+    for row in rows:
+        counts[row['to_path']] += row['total']
+    return counts
+
+
+def compute_path_stats(start_date, end_date):
+    """Per-day, per-path pageview, session and dwell counters for the range in one grouped query."""
+    return list(
+        VisitPageview.objects.filter(
+            viewed_at__gte=_day_start(start_date),
+            viewed_at__lt=_day_start(end_date + timedelta(days=1)),
+        )
+        .annotate(day=TruncDate('viewed_at'))
+        .values('day', 'path')
+        .annotate(
+            pageviews=pageview_count(),
+            sessions=path_session_count(),
+            dwell_seconds=Coalesce(Sum('duration_seconds'), 0),
+            dwell_samples=Count('duration_seconds'),
+        )
+        .order_by()
+    )
+
+
+def rebuild_rollups(start_date, end_date, *, now=None):
+    """Replace every stored rollup table for the range and record when each day was computed."""
+    now = now or timezone.now()
+    rows = compute_rollup_rows(start_date, end_date)
+    sketches = compute_visitor_sketches(start_date, end_date)
+    transitions = compute_page_transitions(start_date, end_date)
+    path_stats = compute_path_stats(start_date, end_date)
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    rewrites_final_days = bool(final_rollup_days(start_date, end_date))
+    with transaction.atomic():
+        VisitDailyRollup.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        VisitDailyRollup.objects.bulk_create([VisitDailyRollup(**row) for row in rows], batch_size=1000)
+        VisitDailySketch.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        VisitDailySketch.objects.bulk_create(
+            [
+                VisitDailySketch(day=day, dimension=dimension, value=value, registers=sketch.to_bytes())
+                for (day, dimension, value), sketch in sketches.items()
+            ],
+            batch_size=500,
+        )
+        PageTransitionDaily.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        PageTransitionDaily.objects.bulk_create(
+            [
+                PageTransitionDaily(day=day, from_path=from_path, to_path=to_path, count=count)
+                for (day, from_path, to_path), count in transitions.items()
+            ],
+            batch_size=1000,
+        )
+        PathDailyStats.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        PathDailyStats.objects.bulk_create([PathDailyStats(**row) for row in path_stats], batch_size=1000)
+        VisitDailyRollupDay.objects.filter(day__in=days).delete()
+        VisitDailyRollupDay.objects.bulk_create([VisitDailyRollupDay(day=day, computed_at=now) for day in days])
+    # Closed windows are cached for hours, so drop them when finalised days change.
+    if rewrites_final_days:
+        response_cache.invalidate_all()
+    else:
+        cache.delete(response_cache.FILTER_VALUES_KEY)
+    return len(rows)
+
+
+def is_final(day, computed_at):
+    """
+    A day's rollup is final once it was computed after the day ended plus one
+    session timeout, so late pageviews of visits started that day are included.
+    """
+    grace = timedelta(seconds=get_visit_settings().session_timeout_seconds)
+    return computed_at >= _day_start(day + timedelta(days=1)) + grace
+
+
+def final_rollup_days(start_date, end_date):
+    return {
+        day
+        for day, computed_at in VisitDailyRollupDay.objects.filter(day__gte=start_date, day__lte=end_date).values_list(
+            'day',
+            'computed_at',
+        )
+        if is_final(day, computed_at)
+    }
+
+
+def first_open_day():
+    """Earliest day that still needs a (re)computed rollup, or None when there is no traffic."""
+    for day, computed_at in VisitDailyRollupDay.objects.order_by('-day').values_list('day', 'computed_at')[:31]:
+        if is_final(day, computed_at):
+            return day + timedelta(days=1)
+    first_visit = Visit.objects.order_by('started_at').values_list('started_at', flat=True).first()
+    return timezone.localdate(first_visit) if first_visit else None
+
+
+LAZY_ROLLUP_LOCK_KEY = 'analytics:rollups:lazy'
+LAZY_ROLLUP_LOCK_TIMEOUT = 5 * 60
+
+
+def roll_up_finished_days(start_date, end_date, *, now=None):
+    """
+    Store rollups for days in the window that have ended (plus the session
+    timeout) but were never finalised, so reads only compute the still-open
+    days from raw data even when ``rollup_visits`` is not scheduled. Returns
+    the set of final days. Another process already rolling up is not waited
+    for; this read then computes the missing days live as before.
+    """
+    now = now or timezone.now()
+    final_days = final_rollup_days(start_date, end_date)
+    finished = [
+        start_date + timedelta(days=offset)
+        for offset in range((end_date - start_date).days + 1)
+        if start_date + timedelta(days=offset) not in final_days and is_final(start_date + timedelta(days=offset), now)
+    ]
+    if not finished or not cache.add(LAZY_ROLLUP_LOCK_KEY, 1, LAZY_ROLLUP_LOCK_TIMEOUT):
+        return final_days
+    try:
+        run_start = previous = finished[0]
+        for day in finished[1:] + [None]:
+            if day is not None and day == previous + timedelta(days=1):
+                previous = day
+                continue
+            rebuild_rollups(run_start, previous, now=now)
+            final_days.update(run_start + timedelta(days=offset) for offset in range((previous - run_start).days + 1))
+            run_start = previous = day
+    finally:
+        cache.delete(LAZY_ROLLUP_LOCK_KEY)
+    return final_days
+
+
+def _filter_rows(rows, filters):
+    for filter_name, dimension in FILTER_DIMENSIONS.items():
+        if filters.get(filter_name):
+            rows = [row for row in rows if row[dimension] == filters[filter_name]]
+    if filters.get('user_scope') == 'authenticated':
+        rows = [row for row in rows if row['is_authenticated']]
+    elif filters.get('user_scope') == 'anonymous':
+        rows = [row for row in rows if not row['is_authenticated']]
+    return rows
+
+
+def load_rollup_rows(start_date, end_date, filters):
+    """
+    Rollup rows for the window: stored rows for final days, and rows computed
+    from raw data for the remaining days (normally just today). Finished days
+    without a final rollup are rolled up first.
+    """
+    final_days = roll_up_finished_days(start_date, end_date)
+    stored = VisitDailyRollup.objects.filter(day__in=final_days)
+    for filter_name, dimension in FILTER_DIMENSIONS.items():
+        if filters.get(filter_name):
+            stored = stored.filter(**{dimension: filters[filter_name]})
+    if filters.get('user_scope') == 'authenticated':
+        stored = stored.filter(is_authenticated=True)
+    elif filters.get('user_scope') == 'anonymous':
+        stored = stored.filter(is_authenticated=False)
+    rows = list(stored.values('day', *ROLLUP_DIMENSIONS, *ROLLUP_METRICS))
+
+    open_days = [
+        start_date + timedelta(days=offset)
+        for offset in range((end_date - start_date).days + 1)
+        if start_date + timedelta(days=offset) not in final_days
+    ]
+    if open_days:
+        live = compute_rollup_rows(open_days[0], open_days[-1])
+        rows.extend(row for row in _filter_rows(live, filters) if row['day'] not in final_days)
+    return rows
+
+
+def _sketch_target(filters):
+    """The single (dimension, value) sketch matching the filters, or None when filters combine."""
+    active = [
+        (dimension, filters[filter_name])
+        for filter_name, dimension in FILTER_DIMENSIONS.items()
+        if filters.get(filter_name)
+    ]
+    if filters.get('user_scope') == 'authenticated':
+        active.append(('is_authenticated', '1'))
+    elif filters.get('user_scope') == 'anonymous':
+        active.append(('is_authenticated', '0'))
+    if len(active) > 1:
+        return None
+    return active[0] if active else ('', '')
+
+
+def estimate_unique_visitors(start_date, end_date, filters):
+    """
+    Estimate distinct visitors for the window by merging per-day sketches:
+    stored ones for final days, freshly built ones for the rest. Returns
+    None when several filters are combined, since sketches cannot be
+    intersected; callers fall back to an exact count.
+    """
+    target = _sketch_target(filters)
+    if target is None:
+        return None
+    dimension, value = target
+
+    final_days = final_rollup_days(start_date, end_date)
+    merged = HyperLogLog()
+    stored = VisitDailySketch.objects.filter(day__in=final_days, dimension=dimension, value=value)
+    for registers in stored.values_list('registers', flat=True):
+        merged.merge(HyperLogLog.from_bytes(registers))
+
+    open_days = [
+        start_date + timedelta(days=offset)
+        for offset in range((end_date - start_date).days + 1)
+        if start_date + timedelta(days=offset) not in final_days
+    ]
+    if open_days:
+        live = compute_visitor_sketches(open_days[0], open_days[-1], only=target)
+        for (day, _, _), sketch in live.items():
+            if day not in final_days:
+                merged.merge(sketch)
+    return merged.count()
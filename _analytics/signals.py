@@ -0,0 +1,48 @@
+import logging
+from functools import partial
+
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from .attribution import record_order_attribution
+from .cohorts import PAID_ORDER_STATUSES, order_paid_at, record_paid_order
+
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_init, sender='_orders.Order')
+def remember_order_status(sender, instance, **kwargs):
+    # __dict__ lookup so deferred status fields are not loaded.
+    instance._analytics_status = instance.__dict__.get('status')
+
+
+def _record_paid_order(order):
+    # Analytics must never break payment; rebuild_cohorts and
+    # backfill_campaign_attribution repair gaps.
+    paid_at = order_paid_at(order)
+    try:
+        record_paid_order(order, paid_at=paid_at)
+    except DatabaseError:
+        logger.exception('Could not record order %s in its cohort', order.pk)
+    try:
+        record_order_attribution(order, paid_at=paid_at)
+    except DatabaseError:
+        logger.exception('Could not attribute order %s to a campaign', order.pk)
+
+
+@receiver(post_save, sender='_orders.Order')
+def record_paid_order_analytics(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Every path that marks an order paid saves it, so this keeps the cohort
+    retention matrix and campaign attribution current. Only the save that
+    moves an order into a paid status records it, after the payment's
+    transaction commits so a failure here cannot roll the payment back.
+    """
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    previous = None if created else getattr(instance, '_analytics_status', None)
+    instance._analytics_status = instance.status
+    if instance.status in PAID_ORDER_STATUSES and previous not in PAID_ORDER_STATUSES:
+        transaction.on_commit(partial(_record_paid_order, instance))
@@ -1,26 +1,81 @@
+import csv
+import gzip
 import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
 from datetime import timedelta
 from datetime import timezone as dt_timezone
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 from django.contrib.auth import get_user_model
-from django.db import DatabaseError
-from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 
-from _analytics.models import GoogleAdsLandingArrival, Visit
+from _analytics.admin import EstimatedCountPaginator
+from _analytics.attribution import attribute_orders, record_order_attribution
+from _analytics.cohorts import rebuild_cohorts, record_paid_order, retention_matrix, week_start
+from _analytics.conversions import rebuild_visit_conversions, record_events
+from _analytics.exports import export_queryset
+from _analytics.ingestion import (
+    AnalyticsBuffer,
+    EventPageviewLinkRecord,
+    PageviewRecord,
+    VisitTouchRecord,
+    write_records,
+)
+from _analytics.middleware import VisitTrackingMiddleware
+from _analytics.models import (
+    AnalyticsEvent,
+    CampaignDailyStats,
+    CohortOrder,
+    CohortRetentionCell,
+    CustomerCohort,
+    GoogleAdsLandingArrival,
+    IngestionCounter,
+    OrderAttribution,
+    Visit,
+    VisitConversion,
+    VisitDailyRollup,
+    VisitPageview,
+)
+from _analytics.hll import HyperLogLog
+from _orders.models import Order
+from _analytics import presence, response_cache
+from _analytics.partitions import add_months, month_bounds, month_start
+from _analytics.rollups import (
+    compute_page_transitions,
+    compute_rollup_rows,
+    estimate_unique_visitors,
+    final_rollup_days,
+    load_rollup_rows,
+    next_page_counts,
+    rebuild_rollups,
+)
 from _analytics.tracking import (
     _timestamp_to_datetime,
     classify_browser_family,
     classify_device_type,
     extract_utm_data,
     infer_traffic_source,
+    is_sampled_in,
     record_google_ads_landing_arrival,
+    save_visit_state,
     track_event,
+    track_events_bulk,
+    track_pageview,
+    track_request,
 )
-from _analytics.views import _is_safe_internal_landing_path, _parse_days, visits_page_daily, visits_summary
+from _analytics.views import _build_product_performance, _rollup_campaigns, _is_safe_internal_landing_path, _parse_days, visits_page_daily, visits_summary
 
 
 class _Session(dict):
@@ -97,6 +152,58 @@ class AnalyticsTrackingTests(SimpleTestCase):
         self.assertEqual(str(create_kwargs['value']), '12.50')
         self.assertEqual(create_kwargs['properties']['order_id'], 44)
         self.assertEqual(create_kwargs['session_key'], 'session-123')
+        self.assertIsNone(create_kwargs['product_id'])
+
+    @patch('_analytics.tracking.AnalyticsEvent')
+    @patch('_analytics.tracking.get_or_create_active_visit')
+    def test_track_event_fills_typed_product_columns(self, get_visit_mock, event_model_mock):
+        request = RequestFactory().post('/cart/')
+        request.session = _Session()
+        request.path = '/cart/'
+        request.current_pageview = SimpleNamespace(pk=9)
+        get_visit_mock.return_value = (SimpleNamespace(pk=7), False)
+
+        track_event(
+            request,
+            'order_item_paid',
+            properties={'product_id': '12', 'quantity': 3, 'line_total': '7.50', 'main_category': 'Dairy'},
+        )
+
+        create_kwargs = event_model_mock.objects.create.call_args.kwargs
+        self.assertEqual(create_kwargs['product_id'], 12)
+        self.assertEqual(create_kwargs['quantity'], 3)
+        self.assertEqual(str(create_kwargs['revenue']), '7.50')
+        self.assertEqual(create_kwargs['main_category'], 'Dairy')
+        self.assertEqual(create_kwargs['sub_category'], '')
+
+    @patch('_analytics.tracking.AnalyticsEvent')
+    @patch('_analytics.tracking.get_or_create_active_visit')
+    def test_track_events_bulk_resolves_visit_once_and_bulk_creates(self, get_visit_mock, event_model_mock):
+        request = RequestFactory().get('/payments/payment-success/')
+        request.session = _Session()
+        request.path = '/payments/payment-success/'
+        request.current_pageview = SimpleNamespace(pk=9)
+        get_visit_mock.return_value = (SimpleNamespace(pk=7), False)
+
+        track_events_bulk(
+            request,
+            [
+                {'event_type': 'paid_order', 'value': '20.00', 'properties': {'order_id': 5}},
+                {'event_type': 'order_item_paid', 'label': 'Milk', 'value': 2},
+                {'event_type': 'order_item_paid', 'label': 'Bread', 'value': 1, 'path': '/custom/'},
+                {'event_type': ''},
+            ],
+            path='/payments/payment-success/',
+        )
+
+        get_visit_mock.assert_called_once()
+        event_model_mock.objects.bulk_create.assert_called_once()
+        self.assertEqual(event_model_mock.call_count, 3)
+        kwargs_list = [call.kwargs for call in event_model_mock.call_args_list]
+        self.assertEqual(kwargs_list[0]['event_type'], 'paid_order')
+        self.assertEqual(str(kwargs_list[0]['value']), '20.00')
+        self.assertEqual(kwargs_list[1]['path'], '/payments/payment-success/')
+        self.assertEqual(kwargs_list[2]['path'], '/custom/')
 
     @patch('_analytics.tracking.get_or_create_active_visit')
     def test_record_google_ads_landing_arrival_skips_superusers(self, get_visit_mock):
@@ -108,9 +215,10 @@ class AnalyticsTrackingTests(SimpleTestCase):
         self.assertIsNone(record_google_ads_landing_arrival(request))
         get_visit_mock.assert_not_called()
 
+    @patch('_analytics.tracking.attribution')
     @patch('_analytics.tracking.GoogleAdsLandingArrival')
     @patch('_analytics.tracking.get_or_create_active_visit')
-    def test_record_google_ads_landing_arrival_creates_unique_arrival(self, get_visit_mock, arrival_model_mock):
+    def test_record_google_ads_landing_arrival_creates_unique_arrival(self, get_visit_mock, arrival_model_mock, attribution_mock):
         request = RequestFactory().get('/home-google/')
         request.session = _Session()
         request.path = '/home-google/'
@@ -138,6 +246,29 @@ class AnalyticsTrackingTests(SimpleTestCase):
         self.assertEqual(create_kwargs['defaults']['traffic_source'], 'campaign')
         self.assertEqual(create_kwargs['defaults']['utm_campaign'], 'spring-shop')
         self.assertFalse(create_kwargs['defaults']['is_authenticated'])
+        attribution_mock.record_arrival.assert_called_once()
+
+
+class HyperLogLogTests(SimpleTestCase):
+    def test_estimate_within_error_bounds_and_merge_is_union(self):
+        first = HyperLogLog()
+        second = HyperLogLog()
+        for index in range(20000):
+            first.add(f'visitor-{index}')
+        for index in range(10000, 30000):
+            second.add(f'visitor-{index}')
+
+        self.assertLess(abs(first.count() - 20000) / 20000, 0.1)
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+        self.assertLess(abs(merged.count() - 30000) / 30000, 0.1)
+        self.assertEqual(len(first.to_bytes()), 1024)
+
+    def test_small_sets_are_close_to_exact(self):
+        sketch = HyperLogLog()
+        for index in range(50):
+            sketch.add(f'visitor-{index}')
+            sketch.add(f'visitor-{index}')
+        self.assertEqual(sketch.count(), 50)
 
 
 class AnalyticsViewsTests(SimpleTestCase):
@@ -185,7 +316,7 @@ class AnalyticsViewsTests(SimpleTestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(payload, {'ok': True})
-        window_arg = summary_payload_mock.call_args.args[4]
+        window_arg = summary_payload_mock.call_args.args[2]
         self.assertEqual(window_arg['days'], 30)
 
     @patch('_analytics.views.Visit')
@@ -295,3 +426,1193 @@ class GoogleAdsArrivalSummaryTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(payload['totals']['google_ads_arrivals'], 1)
         self.assertEqual(payload['google_ads_arrivals_per_day'][-1]['arrivals'], 1)
+
+
+class AnalyticsBufferTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.visit = Visit.objects.create(
+            session_key='buffered-session',
+            started_at=self.now,
+            last_seen_at=self.now,
+        )
+
+    def _pageview(self, sequence_index, seconds, *, previous_seconds=None):
+        return PageviewRecord(
+            visit_id=self.visit.pk,
+            user_id=None,
+            session_key='buffered-session',
+            path=f'/page-{sequence_index}/',
+            query='',
+            referrer='',
+            viewed_at=self.now + timedelta(seconds=seconds),
+            sequence_index=sequence_index,
+            is_authenticated=False,
+            previous_sequence_index=sequence_index - 1 if previous_seconds is not None else None,
+            previous_viewed_at=(
+                self.now + timedelta(seconds=previous_seconds) if previous_seconds is not None else None
+            ),
+        )
+
+    def test_flush_bulk_inserts_pageviews_and_applies_durations_across_batches(self):
+        buffer = AnalyticsBuffer(batch_size=2, autostart=False)
+        buffer.enqueue(self._pageview(1, 0))
+        buffer.enqueue(self._pageview(2, 15, previous_seconds=0))
+        buffer.enqueue(self._pageview(3, 45, previous_seconds=15))
+        buffer.enqueue(VisitTouchRecord(self.visit.pk, self.now + timedelta(seconds=45), None, False))
+
+        # Per batch: insert, visit state UPDATE (+ duration UPDATE), in a savepoint.
+        with self.assertNumQueries(9):
+            self.assertEqual(buffer.flush(), 3)
+
+        durations = dict(VisitPageview.objects.values_list('sequence_index', 'duration_seconds'))
+        self.assertEqual(durations, {1: 15, 2: 30, 3: None})
+        self.visit.refresh_from_db()
+        self.assertEqual(self.visit.last_seen_at, self.now + timedelta(seconds=45))
+        self.assertEqual(self.visit.pageview_count, 3)
+        self.assertEqual(len(buffer), 0)
+
+    def test_full_buffer_drops_oldest_records(self):
+        buffer = AnalyticsBuffer(max_records=2, autostart=False)
+        for sequence_index in (1, 2, 3):
+            buffer.enqueue(self._pageview(sequence_index, sequence_index))
+
+        self.assertEqual(buffer.dropped, 1)
+        buffer.flush()
+        self.assertEqual(
+            sorted(VisitPageview.objects.values_list('sequence_index', flat=True)),
+            [2, 3],
+        )
+
+    def test_failing_record_is_isolated_instead_of_dropping_the_batch(self):
+        buffer = AnalyticsBuffer(autostart=False)
+        for sequence_index in range(1, 6):
+            buffer.enqueue(self._pageview(sequence_index, sequence_index))
+
+        def write_unless_poisoned(batch):
+            if any(getattr(record, 'sequence_index', None) == 4 for record in batch):
+                raise IntegrityError('bad row')
+            return write_records(batch)
+
+        with patch('_analytics.ingestion.write_records', side_effect=write_unless_poisoned):
+            self.assertEqual(buffer.flush(), 4)
+
+        self.assertEqual(buffer.failed, 1)
+        self.assertEqual(
+            sorted(VisitPageview.objects.values_list('sequence_index', flat=True)),
+            [1, 2, 3, 5],
+        )
+
+    def test_unavailable_database_keeps_the_batch_without_bisecting(self):
+        buffer = AnalyticsBuffer(batch_size=2, autostart=False)
+        for sequence_index in range(1, 6):
+            buffer.enqueue(self._pageview(sequence_index, sequence_index))
+
+        with patch('_analytics.ingestion.write_records', side_effect=OperationalError('server closed')) as write_mock:
+            self.assertEqual(buffer.flush(), 0)
+
+        self.assertEqual(write_mock.call_count, 1)
+        self.assertEqual((len(buffer), buffer.failed, buffer.dropped), (5, 0, 0))
+        self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(
+            list(VisitPageview.objects.order_by('sequence_index').values_list('sequence_index', flat=True)),
+            [1, 2, 3, 4, 5],
+        )
+
+    def test_outage_during_bisection_requeues_the_unwritten_parts(self):
+        buffer = AnalyticsBuffer(batch_size=4, autostart=False)
+        for sequence_index in range(1, 5):
+            buffer.enqueue(self._pageview(sequence_index, sequence_index))
+        errors = [IntegrityError('bad row'), OperationalError('server closed')]
+
+        def fail_then_write(batch):
+            if errors:
+                raise errors.pop(0)
+            return write_records(batch)
+
+        with patch('_analytics.ingestion.write_records', side_effect=fail_then_write):
+            self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(len(buffer), 4)
+            self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(buffer.failed, 0)
+
+    def test_requeued_records_stay_within_max_records(self):
+        buffer = AnalyticsBuffer(max_records=3, batch_size=2, autostart=False)
+        for sequence_index in (1, 2, 3):
+            buffer.enqueue(self._pageview(sequence_index, sequence_index))
+
+        def enqueue_during_outage(batch):
+            buffer.enqueue(self._pageview(4, 4))
+            raise OperationalError('server closed')
+
+        with patch('_analytics.ingestion.write_records', side_effect=enqueue_during_outage):
+            buffer.flush()
+
+        self.assertEqual((len(buffer), buffer.dropped), (3, 1))
+        buffer.flush()
+        self.assertEqual(
+            list(VisitPageview.objects.order_by('sequence_index').values_list('sequence_index', flat=True)),
+            [2, 3, 4],
+        )
+
+    def test_events_are_linked_to_pageviews_written_later(self):
+        first = AnalyticsEvent.objects.create(visit=self.visit, session_key='buffered-session', event_type='add_to_cart')
+        second = AnalyticsEvent.objects.create(visit=self.visit, session_key='buffered-session', event_type='add_to_cart')
+        buffer = AnalyticsBuffer(batch_size=2, autostart=False)
+        buffer.enqueue(self._pageview(1, 0))
+        buffer.enqueue(EventPageviewLinkRecord((first.pk,), self.visit.pk, 1))
+        buffer.enqueue(self._pageview(2, 5, previous_seconds=0))
+        buffer.enqueue(EventPageviewLinkRecord((second.pk,), self.visit.pk, 1))
+
+        buffer.flush()
+
+        pageview = VisitPageview.objects.get(visit=self.visit, sequence_index=1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.pageview_id, pageview.pk)
+        self.assertEqual(second.pageview_id, pageview.pk)
+
+    @override_settings(VISIT_TRACKING_BUFFERED=True)
+    def test_middleware_enqueues_instead_of_writing(self):
+        buffer = AnalyticsBuffer(autostart=False)
+        with patch('_analytics.ingestion.get_buffer', return_value=buffer):
+            self.client.get(reverse('visits_summary'))
+            self.client.get(reverse('visits_summary'))
+
+        self.assertEqual(VisitPageview.objects.count(), 0)
+        self.assertEqual(len(buffer), 2)
+        buffer.flush()
+        self.assertEqual(
+            list(VisitPageview.objects.order_by('sequence_index').values_list('sequence_index', flat=True)),
+            [1, 2],
+        )
+
+    @override_settings(VISIT_TRACKING_BUFFERED=True)
+    def test_buffered_tracking_links_events_and_durations_on_flush(self):
+        session = _Session()
+        session.session_key = 'buffered-end-to-end'
+        buffer = AnalyticsBuffer(autostart=False)
+
+        cookies = {}
+
+        def page_request(method, path):
+            request = getattr(RequestFactory(), method)(path, HTTP_USER_AGENT='Mozilla/5.0 (Windows NT 10.0)')
+            request.COOKIES.update(cookies)
+            request.session = session
+            request.user = SimpleNamespace(is_authenticated=False)
+            return request
+
+        def page(path):
+            request = page_request('get', path)
+            response = HttpResponse('<html></html>')
+            track_request(request, response)
+            save_visit_state(request, response)
+            cookies.update({name: morsel.value for name, morsel in response.cookies.items()})
+
+        with patch('_analytics.ingestion.get_buffer', return_value=buffer):
+            page('/')
+            event = track_event(page_request('post', '/cart/'), 'add_to_cart')
+            page('/cart/')
+
+        self.assertIsNone(event.pageview_id)
+        self.assertFalse(VisitPageview.objects.filter(session_key='buffered-end-to-end').exists())
+        self.assertEqual(buffer.flush(), 2)
+
+        pageviews = list(VisitPageview.objects.filter(session_key='buffered-end-to-end').order_by('sequence_index'))
+        self.assertEqual([pageview.sequence_index for pageview in pageviews], [1, 2])
+        self.assertIsNotNone(pageviews[0].duration_seconds)
+        event.refresh_from_db()
+        self.assertEqual(event.pageview_id, pageviews[0].pk)
+
+
+class VisitDailyRollupTests(TestCase):
+    def setUp(self):
+        self.staff_user = get_user_model().objects.create_user(
+            username='rollupstaff',
+            password='staffpass123',
+            is_staff=True,
+        )
+        self.today = timezone.localdate()
+        self.old_start = timezone.now() - timedelta(days=3)
+        for index, source in enumerate(('search', 'search', 'direct')):
+            visit = Visit.objects.create(
+                session_key=f'old-{index}',
+                started_at=self.old_start,
+                last_seen_at=self.old_start + timedelta(seconds=60),
+                traffic_source=source,
+                device_type='mobile',
+                browser_family='Safari',
+                pageview_count=2 if index == 0 else 1,
+            )
+            VisitPageview.objects.create(
+                visit=visit,
+                session_key=visit.session_key,
+                path='/product/milk/',
+                viewed_at=self.old_start,
+                duration_seconds=20,
+            )
+            if index == 0:
+                VisitPageview.objects.create(
+                    visit=visit,
+                    session_key=visit.session_key,
+                    path='/basket/',
+                    viewed_at=self.old_start + timedelta(seconds=20),
+                    sequence_index=2,
+                )
+                event = AnalyticsEvent.objects.create(visit=visit, session_key=visit.session_key, event_type='paid_order')
+                AnalyticsEvent.objects.filter(pk=event.pk).update(created_at=self.old_start)
+        # Rows above bypass tracking, so derive the conversion flags from them.
+        rebuild_visit_conversions(Visit.objects.all())
+
+    def test_compute_rollup_rows_groups_by_day_and_dimensions(self):
+        rows = compute_rollup_rows(self.today - timedelta(days=3), self.today)
+        search = next(row for row in rows if row['traffic_source'] == 'search')
+
+        self.assertEqual(search['sessions'], 2)
+        self.assertEqual(search['bounced_sessions'], 1)
+        self.assertEqual(search['session_seconds'], 120)
+        self.assertEqual(search['pageviews'], 3)
+        self.assertEqual(search['dwell_samples'], 2)
+        self.assertEqual(search['product_view_sessions'], 2)
+        self.assertEqual(search['paid_order'], 1)
+        self.assertEqual(search['paid_sessions'], 1)
+
+    def test_summary_reads_closed_days_from_rollups(self):
+        call_command('rollup_visits', stdout=StringIO())
+        self.assertEqual(VisitDailyRollup.objects.filter(traffic_source='search').get().sessions, 2)
+
+        # Raw rows for closed days are no longer read once rolled up.
+        Visit.objects.filter(started_at__date__lt=self.today).delete()
+        Visit.objects.create(
+            session_key='today',
+            started_at=timezone.now(),
+            last_seen_at=timezone.now(),
+            traffic_source='direct',
+        )
+
+        self.client.force_login(self.staff_user)
+        payload = self.client.get(reverse('visits_summary'), {'days': 30, 'source': 'search'}).json()
+        self.assertEqual(payload['totals']['sessions'], 2)
+        self.assertEqual(payload['totals']['bounce_rate'], 50.0)
+        self.assertEqual(payload['conversion_totals']['paid_order'], 1)
+
+        payload = self.client.get(reverse('visits_summary'), {'days': 30}).json()
+        self.assertEqual(payload['totals']['sessions'], 4)
+        self.assertEqual(payload['totals']['today_sessions'], 1)
+        self.assertIn('search', payload['available_filters']['sources'])
+
+    def test_unique_visitors_merge_daily_sketches(self):
+        call_command('rollup_visits', stdout=StringIO())
+        window_start = self.today - timedelta(days=29)
+
+        self.assertEqual(estimate_unique_visitors(window_start, self.today, {}), 3)
+        self.assertEqual(estimate_unique_visitors(window_start, self.today, {'source': 'search'}), 2)
+        self.assertIsNone(estimate_unique_visitors(window_start, self.today, {'source': 'search', 'device': 'mobile'}))
+
+        self.client.force_login(self.staff_user)
+        totals = self.client.get(reverse('visits_summary'), {'days': 30}).json()['totals']
+        self.assertEqual(totals['unique_visitors'], 3)
+        self.assertTrue(totals['unique_visitors_estimated'])
+        totals = self.client.get(reverse('visits_summary'), {'days': 7}).json()['totals']
+        self.assertFalse(totals['unique_visitors_estimated'])
+
+    def test_reading_rolls_up_finished_days_without_the_command(self):
+        window_start = self.today - timedelta(days=6)
+        rows = load_rollup_rows(window_start, self.today, {'source': 'search'})
+
+        self.assertEqual(sum(row['sessions'] for row in rows), 2)
+        self.assertEqual(VisitDailyRollup.objects.filter(traffic_source='search').get().sessions, 2)
+        final_days = final_rollup_days(window_start, self.today)
+        self.assertIn(timezone.localdate(self.old_start), final_days)
+        self.assertNotIn(self.today, final_days)
+
+        with patch('_analytics.rollups.compute_rollup_rows', wraps=compute_rollup_rows) as compute_mock:
+            load_rollup_rows(window_start, self.today, {})
+        compute_mock.assert_called_once_with(self.today, self.today)
+
+    def test_command_only_processes_open_days(self):
+        call_command('rollup_visits', stdout=StringIO())
+        out = StringIO()
+        call_command('rollup_visits', stdout=out)
+        self.assertIn(f'{self.today}..{self.today}', out.getvalue())
+
+
+@override_settings(ANALYTICS_RESPONSE_CACHE=True, ANALYTICS_CACHE_STALE_SECONDS=600)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff_user = get_user_model().objects.create_user(
+            username='cachestaff',
+            password='staffpass123',
+            is_staff=True,
+        )
+
+    def test_stale_entry_is_served_while_refreshing_in_background(self):
+        build = MagicMock(side_effect=[{'n': 1}, {'n': 2}])
+        self.assertEqual(response_cache.cached_response('test', {'a': 1}, build, ttl=60), {'n': 1})
+        self.assertEqual(response_cache.cached_response('test', {'a': 1}, build, ttl=60), {'n': 1})
+        self.assertEqual(build.call_count, 1)
+
+        later = response_cache.time.time() + 120
+        with patch('_analytics.response_cache.time.time', return_value=later), patch(
+            '_analytics.response_cache.threading.Thread'
+        ) as thread_mock:
+            self.assertEqual(response_cache.cached_response('test', {'a': 1}, build, ttl=60), {'n': 1})
+            # A second stale hit does not start another refresh.
+            response_cache.cached_response('test', {'a': 1}, build, ttl=60)
+            self.assertEqual(thread_mock.call_count, 1)
+            with patch('_analytics.response_cache.connection'):
+                thread_mock.call_args.kwargs['target'](*thread_mock.call_args.kwargs['args'])
+
+        self.assertEqual(response_cache.cached_response('test', {'a': 1}, build, ttl=60), {'n': 2})
+
+    def test_cold_miss_waits_for_a_refresh_already_running(self):
+        key = response_cache.response_cache_key('test', {'a': 1})
+        cache.add(f'{key}:refreshing', 1, response_cache.REFRESH_LOCK_TIMEOUT)
+        build = MagicMock(return_value={'n': 'rebuilt'})
+
+        def refresh_finishes(_seconds):
+            response_cache._store(key, {'n': 'warmed'}, 60)
+            cache.delete(f'{key}:refreshing')
+
+        with patch('_analytics.response_cache.time.sleep', side_effect=refresh_finishes) as sleep_mock:
+            self.assertEqual(response_cache.cached_response('test', {'a': 1}, build, ttl=60), {'n': 'warmed'})
+        self.assertEqual(sleep_mock.call_count, 1)
+        build.assert_not_called()
+
+        # A refresh that never finishes only delays the caller by the wait bound.
+        other_key = response_cache.response_cache_key('test', {'a': 2})
+        cache.add(f'{other_key}:refreshing', 1, response_cache.REFRESH_LOCK_TIMEOUT)
+        with patch.object(response_cache, 'REFRESH_WAIT_SECONDS', 0):
+            self.assertEqual(response_cache.cached_response('test', {'a': 2}, build, ttl=60), {'n': 'rebuilt'})
+
+    def test_cold_miss_holds_the_refresh_lock_while_building(self):
+        key = response_cache.response_cache_key('test', {'a': 1})
+
+        def build():
+            self.assertFalse(response_cache.warm('test', {'a': 1}, dict, ttl=60))
+            return {'n': 1}
+
+        self.assertEqual(response_cache.cached_response('test', {'a': 1}, build, ttl=60), {'n': 1})
+        self.assertIsNone(cache.get(f'{key}:refreshing'))
+
+    def test_refresh_lock_expires_independently_of_entry_ttl(self):
+        with patch('_analytics.response_cache.threading.Thread'), patch.object(
+            response_cache.cache, 'add', return_value=True
+        ) as add_mock:
+            self.assertTrue(response_cache.refresh_in_background('key', dict, response_cache.closed_ttl()))
+        add_mock.assert_called_once_with('key:refreshing', 1, response_cache.REFRESH_LOCK_TIMEOUT)
+
+    def test_invalidate_all_retires_cached_responses(self):
+        key = response_cache.response_cache_key('test', {'a': 1})
+        response_cache.invalidate_all()
+        self.assertNotEqual(response_cache.response_cache_key('test', {'a': 1}), key)
+
+    def test_summary_is_cached_per_window_and_filters(self):
+        self.client.force_login(self.staff_user)
+        now = timezone.now()
+        Visit.objects.create(session_key='a', started_at=now, last_seen_at=now, traffic_source='direct')
+        self.assertEqual(self.client.get(reverse('visits_summary'), {'days': 7}).json()['totals']['sessions'], 1)
+
+        Visit.objects.create(session_key='b', started_at=now, last_seen_at=now, traffic_source='search')
+        self.assertEqual(self.client.get(reverse('visits_summary'), {'days': 7}).json()['totals']['sessions'], 1)
+        payload = self.client.get(reverse('visits_summary'), {'days': 7, 'source': 'search'}).json()
+        self.assertEqual(payload['totals']['sessions'], 1)
+        self.assertEqual(payload['filters']['source'], 'search')
+
+
+class IngestRulesTests(TestCase):
+    bot_agent = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+
+    def _page_request(self, path, session_key='session-123', **extra):
+        request = RequestFactory().get(path, **extra)
+        session = _Session()
+        session.session_key = session_key
+        request.session = session
+        request.user = SimpleNamespace(is_authenticated=False)
+        return request
+
+    def test_bots_are_counted_without_visit_rows(self):
+        for _ in range(2):
+            track_request(self._page_request('/', HTTP_USER_AGENT=self.bot_agent), HttpResponse('<html></html>'))
+
+        self.assertFalse(Visit.objects.exists())
+        counter = IngestionCounter.objects.get()
+        self.assertEqual((counter.kind, counter.key, counter.count), ('bot_pageview', 'googlebot', 2))
+
+        with override_settings(VISIT_BOT_POLICY='drop'):
+            track_request(self._page_request('/', HTTP_USER_AGENT=self.bot_agent), HttpResponse('<html></html>'))
+        self.assertEqual(IngestionCounter.objects.get(kind='bot_dropped').count, 1)
+
+    @override_settings(VISIT_PAGEVIEW_SAMPLING={'/product/': 2})
+    def test_sampled_pageviews_carry_weights_and_are_counted(self):
+        kept = 0
+        for index in range(40):
+            session_key = f'sample-{index}'
+            now = timezone.now()
+            visit = Visit.objects.create(session_key=session_key, started_at=now, last_seen_at=now)
+            pageview = track_pageview(self._page_request('/product/milk/', session_key), visit=visit)
+            self.assertEqual(pageview is not None, is_sampled_in(session_key, '/product/', 2))
+            if pageview is not None:
+                kept += 1
+                self.assertEqual(pageview.sample_weight, 2)
+            # Unsampled paths are always stored.
+            self.assertIsNotNone(track_pageview(self._page_request('/basket/', session_key), visit=visit))
+
+        self.assertTrue(0 < kept < 40)
+        self.assertEqual(IngestionCounter.objects.get(kind='sampled_out', key='/product/').count, 40 - kept)
+        # Conversion flags stay exact for sampled-out product views.
+        self.assertEqual(VisitConversion.objects.filter(viewed_product=True).count(), 40)
+        today = timezone.localdate()
+        self.assertEqual(sum(row['pageviews'] for row in compute_rollup_rows(today, today)), kept * 2 + 40)
+
+    def _track_sampled_visits(self):
+        session_keys = [key for key in (f'bounce-{index}' for index in range(40)) if not is_sampled_in(key, '/product/', 2)]
+        now = timezone.now()
+        visits = (
+            (session_keys[0], ['/product/milk/', '/basket/']),
+            (session_keys[1], ['/basket/']),
+            # Every pageview sampled out: not stored at all, yet not a bounce.
+            (session_keys[2], ['/product/milk/', '/product/bread/']),
+        )
+        for session_key, paths in visits:
+            visit = Visit.objects.create(session_key=session_key, started_at=now, last_seen_at=now)
+            state = None
+            for path in paths:
+                request = self._page_request(path, session_key)
+                if state is not None:
+                    request._visit_state = state
+                track_pageview(request, visit=visit)
+                state = request._visit_state
+
+    @override_settings(VISIT_PAGEVIEW_SAMPLING={'/product/': 2})
+    def test_sampled_out_pages_do_not_turn_visits_into_bounces(self):
+        self._track_sampled_visits()
+
+        self.assertEqual(VisitPageview.objects.count(), 2)
+        today = timezone.localdate()
+        self.assertEqual(sum(row['bounced_sessions'] for row in compute_rollup_rows(today, today)), 1)
+
+    @override_settings(VISIT_PAGEVIEW_SAMPLING={'/product/': 2}, VISIT_TRACKING_BUFFERED=True)
+    def test_buffered_sampled_out_pages_still_count_towards_the_visit(self):
+        buffer = AnalyticsBuffer(autostart=False)
+        with patch('_analytics.ingestion.get_buffer', return_value=buffer):
+            self._track_sampled_visits()
+        buffer.flush()
+
+        self.assertEqual(sorted(Visit.objects.values_list('pageview_count', flat=True)), [1, 2, 2])
+        today = timezone.localdate()
+        self.assertEqual(sum(row['bounced_sessions'] for row in compute_rollup_rows(today, today)), 1)
+
+
+class VisitStateCookieTests(TestCase):
+    def setUp(self):
+        self.middleware = VisitTrackingMiddleware(lambda request: HttpResponse('<html></html>'))
+
+    def _get(self, path, cookie=None):
+        request = RequestFactory().get(path, HTTP_USER_AGENT='Mozilla/5.0 (Windows NT 10.0; Win64; x64)')
+        request.session = SessionStore()
+        request.user = SimpleNamespace(is_authenticated=False)
+        if cookie is not None:
+            request.COOKIES['vstate'] = cookie
+        response = self.middleware(request)
+        return request, response
+
+    def test_tracking_state_lives_in_a_signed_cookie(self):
+        request, response = self._get('/')
+        self.assertIsNone(request.session.session_key)
+        self.assertFalse(request.session.modified)
+        self.assertEqual(Session.objects.count(), 0)
+
+        _, response = self._get('/basket/', response.cookies['vstate'].value)
+        visit = Visit.objects.get()
+        self.assertEqual(list(visit.pageviews.order_by('sequence_index').values_list('path', 'sequence_index')), [('/', 1), ('/basket/', 2)])
+        self.assertEqual(len(visit.session_key), 32)
+        self.assertEqual(VisitPageview.objects.filter(session_key=visit.session_key).count(), 2)
+
+        # A tampered cookie is ignored and starts a new visit.
+        self._get('/', response.cookies['vstate'].value[:-2] + 'xx')
+        self.assertEqual(Visit.objects.count(), 2)
+
+
+@override_settings(VISIT_PRESENCE_SHARED_CACHE=True)
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tracker = presence.PresenceTracker(flush_seconds=10, worker_id='web-1')
+        patcher = patch('_analytics.presence._tracker', self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_buckets_from_all_workers_are_merged(self):
+        now = 1_000_000.0
+        other = presence.PresenceTracker(flush_seconds=0, worker_id='web-2')
+        self.tracker.record('a', 'desktop', '/product/milk/', now=now)
+        other.record('b', 'mobile', '/basket/', now=now + 5)
+        # The same visitor on two workers is counted once.
+        other.record('a', 'desktop', '/', now=now + 5)
+
+        summary = presence.presence_summary(now=now + 6)
+        self.assertEqual(summary['active_users'], 2)
+        self.assertEqual({row['label']: row['count'] for row in summary['devices']}, {'desktop': 1, 'mobile': 1})
+        # The newest bucket decides a visitor's section.
+        self.assertEqual({row['label'] for row in summary['sections']}, {'/basket/', '/'})
+
+    def test_visitors_leave_the_window(self):
+        now = 1_000_000.0
+        self.tracker.record('a', 'desktop', '/', now=now)
+        self.assertEqual(presence.presence_summary(now=now + 60)['active_users'], 1)
+        self.assertEqual(presence.presence_summary(now=now + presence.WINDOW_MINUTES * 60 + 60)['active_users'], 0)
+
+    def test_reading_does_not_flush_the_worker_buckets(self):
+        now = 1_000_000.0
+        self.tracker.record('a', 'desktop', '/', now=now)
+        self.tracker.record('b', 'mobile', '/', now=now + 1)
+
+        with patch.object(presence.cache, 'set_many') as set_many_mock:
+            self.assertEqual(presence.presence_summary(now=now + 2)['active_users'], 1)
+        set_many_mock.assert_not_called()
+        self.tracker.flush(now=now + 3)
+        self.assertEqual(presence.presence_summary(now=now + 3)['active_users'], 2)
+
+    @override_settings(
+        VISIT_PRESENCE_SHARED_CACHE=None,
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_process_local_cache_falls_back_to_recent_visits(self):
+        self.assertFalse(presence.uses_shared_cache())
+        now = timezone.now()
+        visit = Visit.objects.create(session_key='live', started_at=now, last_seen_at=now, device_type='mobile')
+        VisitPageview.objects.create(visit=visit, session_key='live', path='/', viewed_at=now - timedelta(seconds=30))
+        VisitPageview.objects.create(visit=visit, session_key='live', path='/product/milk/', viewed_at=now)
+        Visit.objects.create(session_key='gone', started_at=now - timedelta(hours=1), last_seen_at=now - timedelta(hours=1))
+        # Buckets in a per-process cache only hold this worker's visitors and are ignored.
+        self.tracker.record('a', 'desktop', '/basket/', now=now.timestamp())
+
+        summary = presence.presence_summary(now=now.timestamp())
+        self.assertEqual(summary['active_users'], 1)
+        self.assertEqual(summary['devices'], [{'label': 'mobile', 'count': 1}])
+        self.assertEqual(summary['sections'], [{'label': '/product/', 'count': 1}])
+
+    def test_active_endpoint_requires_staff(self):
+        self.tracker.record('a', 'mobile', '/product/milk/')
+        url = reverse('visits_active')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff_user = get_user_model().objects.create_user(username='presencestaff', password='x', is_staff=True)
+        self.client.force_login(staff_user)
+        payload = self.client.get(url).json()
+        self.assertEqual(payload['window_minutes'], presence.WINDOW_MINUTES)
+        self.assertIn({'label': '/product/', 'count': 1}, payload['sections'])
+
+
+class AnalyticsExportTests(TestCase):
+    def setUp(self):
+        self.staff_user = get_user_model().objects.create_user(username='exportstaff', password='x', is_staff=True)
+        now = timezone.now()
+        self.mobile = Visit.objects.create(session_key='m', started_at=now, last_seen_at=now, device_type='mobile')
+        self.desktop = Visit.objects.create(session_key='d', started_at=now, last_seen_at=now, device_type='desktop')
+        for visit in (self.mobile, self.desktop):
+            VisitPageview.objects.create(visit=visit, session_key=visit.session_key, path='/', viewed_at=now)
+        AnalyticsEvent.objects.create(
+            visit=self.mobile, session_key='m', event_type='add_to_cart', properties={'product': 'milk, 1l'},
+        )
+
+    def _download(self, **params):
+        self.client.force_login(self.staff_user)
+        response = self.client.get(reverse('visits_export'), {'days': 7, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_honours_dashboard_filters(self):
+        response, body = self._download(dataset='visits', device='mobile')
+        self.assertIn('attachment; filename="analytics-visits-', response['Content-Disposition'])
+        rows = list(csv.DictReader(body.decode('utf-8').splitlines()))
+        self.assertEqual([int(row['id']) for row in rows], [self.mobile.pk])
+        self.assertNotIn('session_key', rows[0])
+
+        _, body = self._download(dataset='events')
+        row = next(csv.DictReader(body.decode('utf-8').splitlines()))
+        self.assertEqual(json.loads(row['properties']), {'product': 'milk, 1l'})
+
+    def test_gzipped_ndjson_export(self):
+        response, body = self._download(dataset='pageviews', format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(body).decode('utf-8').splitlines()]
+        self.assertEqual({row['visit_id'] for row in rows}, {self.mobile.pk, self.desktop.pk})
+
+    def test_unknown_dataset_is_rejected(self):
+        self.client.force_login(self.staff_user)
+        self.assertEqual(self.client.get(reverse('visits_export'), {'dataset': 'users'}).status_code, 400)
+
+    def test_export_queryset_filters_child_rows_by_their_visit(self):
+        today = timezone.localdate()
+        filters = {'device': 'desktop', 'user_scope': 'anonymous'}
+        self.assertFalse(export_queryset('events', today, today, filters).exists())
+        self.assertEqual(list(export_queryset('pageviews', today, today, filters).values_list('visit', flat=True)), [self.desktop.pk])
+        self.assertFalse(export_queryset('visits', today - timedelta(days=3), today - timedelta(days=1), {}).exists())
+
+    def test_command_writes_export_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'visits.ndjson')
+            call_command('export_analytics', 'visits', '--format', 'ndjson', '--device', 'desktop', '--output', output, stdout=StringIO())
+            with open(output, encoding='utf-8') as handle:
+                rows = [json.loads(line) for line in handle]
+        self.assertEqual([row['id'] for row in rows], [self.desktop.pk])
+        self.assertNotIn('session_key', rows[0])
+
+
+class CohortRetentionTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='x')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='x')
+
+    def _matrix_cells(self):
+        return {
+            (cell.cohort_week, cell.week_offset): (cell.active_buyers, cell.orders, cell.revenue)
+            for cell in CohortRetentionCell.objects.all()
+        }
+
+    def test_paid_orders_fill_the_matrix_once(self):
+        week = week_start(timezone.localdate())
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.bob, total=Decimal('5.00'))
+            order = Order.objects.create(user=self.alice, total=Decimal('10.00'), status='paid')
+            Order.objects.create(user=self.alice, total=Decimal('2.50'), status='paid')
+            order.status = 'delivered'
+            order.save(update_fields=['status'])
+
+        self.assertEqual(self._matrix_cells(), {(week, 0): (1, 2, Decimal('12.50'))})
+        self.assertEqual(CustomerCohort.objects.get(user=self.alice).paid_orders, 2)
+        self.assertFalse(CustomerCohort.objects.filter(user=self.bob).exists())
+
+        later = Order.objects.create(user=self.alice, total=Decimal('4.00'))
+        self.assertTrue(record_paid_order(later, paid_at=timezone.now() + timedelta(weeks=2)))
+        self.assertFalse(record_paid_order(later))
+        self.assertEqual(self._matrix_cells()[(week, 2)], (1, 1, Decimal('4.00')))
+
+        cohort = retention_matrix(weeks=4, today=timezone.localdate() + timedelta(weeks=2))['cohorts'][2]
+        self.assertEqual((cohort['cohort_week'], cohort['customers'], cohort['repeat_rate']), (week.isoformat(), 1, 1.0))
+        self.assertEqual([cell['retention'] for cell in cohort['weeks']], [1.0, 0.0, 1.0])
+
+    def test_an_older_order_paid_late_moves_the_customer_to_its_cohort(self):
+        now = timezone.now()
+        orders = []
+        for weeks_ago, total in ((0, '4.00'), (3, '10.00'), (1, '2.50')):
+            order = Order.objects.create(user=self.alice, total=Decimal(total))
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(weeks=weeks_ago), status='paid')
+            order.refresh_from_db()
+            orders.append(order)
+        bob_order = Order.objects.create(user=self.bob, total=Decimal('1.00'))
+        Order.objects.filter(pk=bob_order.pk).update(created_at=now - timedelta(weeks=3), status='paid')
+        bob_order.refresh_from_db()
+
+        for order in (*orders, bob_order):
+            self.assertTrue(record_paid_order(order))
+        live = self._matrix_cells()
+        member = CustomerCohort.objects.get(user=self.alice)
+        self.assertEqual((member.cohort_week, member.first_paid_at), (week_start(timezone.localdate(orders[1].created_at)), orders[1].created_at))
+
+        rebuild_cohorts(Order.objects.filter(status='paid'))
+        self.assertEqual(live, self._matrix_cells())
+        self.assertEqual(live[(member.cohort_week, 0)][0], 2)
+
+    def test_only_the_move_into_paid_is_recorded_at_order_time(self):
+        order = Order.objects.create(user=self.alice, total=Decimal('10.00'))
+        created_at = timezone.now() - timedelta(weeks=3)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.refresh_from_db()
+
+        with patch('_analytics.signals.record_paid_order', wraps=record_paid_order) as recorder:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.save()
+                order.status = 'paid'
+                order.save(update_fields=['status'])
+                order.status = 'delivered'
+                order.save()
+        self.assertEqual(recorder.call_count, 1)
+        self.assertEqual(CohortOrder.objects.get(order=order).week, week_start(timezone.localdate(created_at)))
+        self.assertEqual(OrderAttribution.objects.get(order=order).day, timezone.localdate(created_at))
+
+    def test_analytics_errors_do_not_reach_the_payment(self):
+        with patch('_analytics.signals.record_paid_order', side_effect=DatabaseError('cohorts down')):
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.create(user=self.alice, total=Decimal('10.00'), status='paid')
+        self.assertTrue(Order.objects.filter(pk=order.pk, status='paid').exists())
+        self.assertTrue(OrderAttribution.objects.filter(order=order).exists())
+
+    def test_rebuild_replays_paid_orders(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.alice, total=Decimal('10.00'), status='paid')
+            Order.objects.create(user=self.bob, total=Decimal('3.00'), status='processed')
+            Order.objects.create(user=self.bob, total=Decimal('7.00'), status='canceled')
+        incremental = self._matrix_cells()
+
+        call_command('rebuild_cohorts', stdout=StringIO())
+        self.assertEqual(self._matrix_cells(), incremental)
+        self.assertEqual(CohortOrder.objects.count(), 2)
+        self.assertEqual(rebuild_cohorts(Order.objects.none()), 0)
+        self.assertFalse(CustomerCohort.objects.exists())
+
+    def test_cohorts_endpoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.alice, total=Decimal('10.00'), status='paid')
+        staff_user = get_user_model().objects.create_user(
+            username='cohortstaff', email='cohortstaff@example.com', password='x', is_staff=True,
+        )
+        self.client.force_login(staff_user)
+        payload = self.client.get(reverse('visits_cohorts'), {'weeks': 4}).json()
+        self.assertEqual(len(payload['cohorts']), 4)
+        self.assertEqual(payload['cohorts'][0]['customers'], 1)
+        self.assertEqual(payload['cohorts'][0]['weeks'], [{'week_offset': 0, 'active_buyers': 1, 'retention': 1.0, 'orders': 1, 'revenue': '10.00'}])
+
+
+class AnalyticsAdminTests(TestCase):
+    def setUp(self):
+        self.admin_user = get_user_model().objects.create_superuser(
+            username='analyticsadmin', email='analyticsadmin@example.com', password='x',
+        )
+        now = timezone.now()
+        for index in range(5):
+            visit = Visit.objects.create(session_key=f's{index}', started_at=now, last_seen_at=now, browser_family='Firefox')
+            VisitPageview.objects.create(visit=visit, session_key=visit.session_key, path='/', viewed_at=now)
+            AnalyticsEvent.objects.create(visit=visit, session_key=visit.session_key, event_type='add_to_cart')
+        VisitDailyRollup.objects.create(day=timezone.localdate(), browser_family='Firefox', sessions=5)
+
+    def test_changelists_render_with_scaled_filters(self):
+        self.client.force_login(self.admin_user)
+        for name, params in (
+            ('admin:_analytics_visit_changelist', {'browser_family': 'Firefox'}),
+            ('admin:_analytics_visitpageview_changelist', {'is_authenticated__exact': '0'}),
+            ('admin:_analytics_analyticsevent_changelist', {'event_type': 'add_to_cart'}),
+        ):
+            response = self.client.get(reverse(name), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['cl'].result_count, 5)
+
+    def test_browser_filter_lists_browsers_not_rolled_up_yet(self):
+        cache.clear()
+        now = timezone.now()
+        Visit.objects.create(session_key='edge', started_at=now, last_seen_at=now, browser_family='Edge')
+        self.client.force_login(self.admin_user)
+
+        response = self.client.get(reverse('admin:_analytics_visit_changelist'))
+        browser_filter = next(spec for spec in response.context['cl'].filter_specs if getattr(spec, 'parameter_name', None) == 'browser_family')
+        self.assertEqual(browser_filter.lookup_choices, [('Edge', 'Edge'), ('Firefox', 'Firefox')])
+
+    def test_filtered_counts_are_capped(self):
+        paginator = EstimatedCountPaginator(Visit.objects.filter(browser_family='Firefox'), 2)
+        paginator.max_pages = 2
+        self.assertEqual(paginator.count, 4)
+        self.assertEqual(EstimatedCountPaginator(Visit.objects.all(), 2).count, 5)
+
+
+class CampaignAttributionTests(TestCase):
+    def setUp(self):
+        self.customer = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        self.middleware = VisitTrackingMiddleware(lambda request: HttpResponse('<html></html>'))
+
+    def _stats(self):
+        return {
+            (row.utm_source, row.utm_campaign): (row.arrivals, row.sessions, row.orders, row.revenue)
+            for row in CampaignDailyStats.objects.all()
+        }
+
+    def test_sessions_and_paid_orders_update_daily_counters(self):
+        request = RequestFactory().get('/?utm_source=google&utm_campaign=spring', HTTP_USER_AGENT='Mozilla/5.0 (Windows NT 10.0)')
+        request.session = SessionStore()
+        request.user = SimpleNamespace(is_authenticated=False)
+        self.middleware(request)
+        self.assertEqual(self._stats(), {('google', 'spring'): (0, 1, 0, Decimal('0'))})
+
+        now = timezone.now()
+        Visit.objects.create(
+            session_key='buyer', user=self.customer, started_at=now - timedelta(days=2), last_seen_at=now,
+            utm_source='google', utm_campaign='spring',
+        )
+        Visit.objects.create(session_key='buyer2', user=self.customer, started_at=now - timedelta(hours=1), last_seen_at=now)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.customer, total=Decimal('20.00'), status='paid')
+            order.status = 'delivered'
+            order.save(update_fields=['status'])
+
+        self.assertEqual(self._stats(), {('google', 'spring'): (0, 1, 1, Decimal('20.00'))})
+        self.assertEqual(OrderAttribution.objects.get(order=order).utm_campaign, 'spring')
+
+    def test_orders_without_campaign_visit_are_stored_but_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.customer, total=Decimal('5.00'), status='paid')
+        attribution = OrderAttribution.objects.get(order=order)
+        self.assertIsNone(attribution.visit_id)
+        self.assertFalse(CampaignDailyStats.objects.exists())
+
+    def test_live_and_backfill_attribution_share_the_payment_time(self):
+        created_at = timezone.now() - timedelta(days=10)
+        Visit.objects.create(
+            session_key='buyer', user=self.customer, started_at=created_at - timedelta(days=1), last_seen_at=created_at,
+            utm_source='google', utm_campaign='winter',
+        )
+        orders = [Order.objects.create(user=self.customer, total=Decimal('4.00'), status='paid') for _ in range(2)]
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(created_at=created_at)
+        live, backfilled = Order.objects.order_by('pk')
+
+        self.assertEqual(record_order_attribution(live).day, timezone.localdate(created_at))
+        attribute_orders(Order.objects.filter(pk=backfilled.pk))
+        self.assertEqual(
+            set(OrderAttribution.objects.values_list('day', 'utm_campaign')),
+            {(timezone.localdate(created_at), 'winter')},
+        )
+
+    def test_attribute_orders_adds_its_rows_to_the_counters(self):
+        now = timezone.now()
+        Visit.objects.create(
+            session_key='buyer', user=self.customer, started_at=now - timedelta(hours=2), last_seen_at=now,
+            utm_source='google', utm_campaign='summer',
+        )
+        with patch('_analytics.signals.record_order_attribution'), self.captureOnCommitCallbacks(execute=True):
+            orders = [Order.objects.create(user=self.customer, total=Decimal('3.00'), status='paid') for _ in range(3)]
+        self.assertEqual(attribute_orders(Order.objects.filter(pk__in=[order.pk for order in orders]), batch_size=2), 3)
+        self.assertEqual(self._stats(), {('google', 'summer'): (0, 0, 3, Decimal('9.00'))})
+
+    def test_backfill_keeps_counters_for_days_before_the_oldest_visit(self):
+        today = timezone.localdate()
+        archived_day = today - timedelta(days=400)
+        CampaignDailyStats.objects.create(day=archived_day, utm_source='google', utm_campaign='old', sessions=40, orders=2)
+        with patch('_analytics.signals.record_order_attribution'), self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.customer, total=Decimal('6.00'), status='paid')
+        OrderAttribution.objects.create(order_id=order.pk, day=archived_day, revenue=order.total)
+        now = timezone.now()
+        Visit.objects.create(session_key='recent', started_at=now - timedelta(days=3), last_seen_at=now)
+
+        for days in (0, 1000):
+            call_command('backfill_campaign_attribution', '--days', str(days), stdout=StringIO())
+            self.assertEqual(self._stats(), {('google', 'old'): (0, 40, 2, Decimal('0'))})
+
+    def test_backfill_rebuilds_counters_and_endpoint_reads_them(self):
+        now = timezone.now()
+        visit = Visit.objects.create(
+            session_key='buyer', user=self.customer, started_at=now, last_seen_at=now,
+            utm_source='google', utm_campaign='autumn',
+        )
+        GoogleAdsLandingArrival.objects.create(visit=visit, arrived_at=now, utm_source='google', utm_campaign='autumn')
+        with patch('_analytics.signals.record_order_attribution'), self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.customer, total=Decimal('7.50'), status='paid')
+        self.assertFalse(OrderAttribution.objects.exists())
+
+        call_command('backfill_campaign_attribution', stdout=StringIO())
+        self.assertEqual(self._stats(), {('google', 'autumn'): (1, 1, 1, Decimal('7.50'))})
+
+        staff_user = get_user_model().objects.create_user(
+            username='campaignstaff', email='campaignstaff@example.com', password='x', is_staff=True,
+        )
+        self.client.force_login(staff_user)
+        payload = self.client.get(reverse('visits_campaigns'), {'days': 7}).json()
+        self.assertEqual(
+            payload['campaigns'],
+            [{'label': 'autumn', 'arrivals': 1, 'sessions': 1, 'orders': 1, 'conversion_rate': 100.0, 'revenue': '7.50'}],
+        )
+
+
+class AnalyticsArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        self.month = add_months(month_start(timezone.localdate()), -15)
+        started_at = month_bounds(self.month)[0] + timedelta(days=3, hours=10)
+        self.visit = Visit.objects.create(session_key='old', started_at=started_at, last_seen_at=started_at)
+        pageview = VisitPageview.objects.create(
+            visit=self.visit,
+            session_key='old',
+            path='/product/milk/',
+            viewed_at=started_at,
+        )
+        event = AnalyticsEvent.objects.create(visit=self.visit, pageview=pageview, session_key='old', event_type='add_to_cart')
+        AnalyticsEvent.objects.filter(pk=event.pk).update(created_at=started_at)
+        self.recent = Visit.objects.create(session_key='new', started_at=timezone.now(), last_seen_at=timezone.now())
+
+    def _archive(self):
+        out = StringIO()
+        call_command('archive_analytics', keep_months=13, archive_dir=self.archive_dir.name, stdout=out)
+        return out.getvalue()
+
+    def test_months_without_final_rollups_are_kept(self):
+        self.assertIn('rollups are not final, skipped', self._archive())
+        self.assertTrue(Visit.objects.filter(pk=self.visit.pk).exists())
+
+    def test_archive_removes_old_rows_and_load_restores_them(self):
+        rebuild_rollups(self.month, add_months(self.month, 1) - timedelta(days=1))
+
+        self.assertIn('Archived 1 month(s)', self._archive())
+        self.assertFalse(Visit.objects.filter(pk=self.visit.pk).exists())
+        self.assertEqual(VisitPageview.objects.count(), 0)
+        self.assertEqual(AnalyticsEvent.objects.count(), 0)
+        self.assertTrue(Visit.objects.filter(pk=self.recent.pk).exists())
+        # Rollups outlive the raw rows.
+        self.assertEqual(VisitDailyRollup.objects.get().sessions, 1)
+
+        call_command('load_analytics_archive', f'{self.month:%Y-%m}', archive_dir=self.archive_dir.name, stdout=StringIO())
+        self.assertEqual(Visit.objects.get(pk=self.visit.pk).session_key, 'old')
+        self.assertEqual(VisitPageview.objects.get().path, '/product/milk/')
+        event = AnalyticsEvent.objects.get()
+        self.assertEqual(event.visit_id, self.visit.pk)
+        self.assertEqual(event.created_at, self.visit.started_at)
+
+    def test_rows_hanging_off_archived_visits_are_archived_with_them(self):
+        rebuild_rollups(self.month, add_months(self.month, 1) - timedelta(days=1))
+        arrival = GoogleAdsLandingArrival.objects.create(
+            visit=self.visit,
+            arrived_at=self.visit.started_at,
+            utm_source='google',
+            utm_campaign='spring',
+        )
+        VisitConversion.objects.update_or_create(visit=self.visit, defaults={'added_to_cart': True})
+        user = get_user_model().objects.create_user(username='archived-buyer', password='x')
+        order = Order.objects.create(user=user, total=Decimal('9.00'))
+        OrderAttribution.objects.create(
+            order=order,
+            visit=self.visit,
+            arrival=arrival,
+            utm_source='google',
+            utm_campaign='spring',
+            day=self.month,
+            revenue=Decimal('9.00'),
+        )
+
+        self._archive()
+        self.assertFalse(GoogleAdsLandingArrival.objects.exists())
+        self.assertFalse(VisitConversion.objects.filter(visit_id=self.visit.pk).exists())
+        attribution = OrderAttribution.objects.get(order=order)
+        self.assertEqual((attribution.visit_id, attribution.arrival_id, attribution.utm_campaign), (None, None, 'spring'))
+
+        call_command('load_analytics_archive', f'{self.month:%Y-%m}', archive_dir=self.archive_dir.name, stdout=StringIO())
+        self.assertEqual(GoogleAdsLandingArrival.objects.get().utm_campaign, 'spring')
+        self.assertTrue(VisitConversion.objects.get(visit_id=self.visit.pk).added_to_cart)
+        attribution.refresh_from_db()
+        self.assertEqual((attribution.visit_id, attribution.arrival_id), (self.visit.pk, arrival.pk))
+
+    @override_settings(ANALYTICS_ARCHIVE_DIR='')
+    def test_archiving_requires_an_explicit_archive_dir(self):
+        rebuild_rollups(self.month, add_months(self.month, 1) - timedelta(days=1))
+
+        with self.assertRaisesMessage(CommandError, 'ANALYTICS_ARCHIVE_DIR'):
+            call_command('archive_analytics', keep_months=13, stdout=StringIO())
+        self.assertTrue(Visit.objects.filter(pk=self.visit.pk).exists())
+
+    def test_partitioning_requires_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command('analytics_partitions', convert=True, stdout=StringIO())
+
+
+class VisitConversionTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.visit = Visit.objects.create(
+            session_key='conv',
+            started_at=now,
+            last_seen_at=now,
+            traffic_source='paid_search',
+            utm_campaign='spring',
+        )
+
+    def _event(self, event_type, value=None):
+        return AnalyticsEvent.objects.create(
+            visit=self.visit,
+            session_key=self.visit.session_key,
+            event_type=event_type,
+            value=value,
+        )
+
+    def test_record_events_sets_flags_and_accumulates_revenue(self):
+        record_events([self._event('add_to_cart'), self._event('paid_order', Decimal('12.50'))])
+        record_events([self._event('paid_order', Decimal('2.25')), self._event('page_view')])
+
+        conversion = VisitConversion.objects.get(visit=self.visit)
+        self.assertTrue(conversion.added_to_cart)
+        self.assertFalse(conversion.started_checkout)
+        self.assertTrue(conversion.paid)
+        self.assertEqual(conversion.revenue, Decimal('14.75'))
+
+    def test_rebuild_matches_incremental_updates_and_feeds_campaigns(self):
+        VisitPageview.objects.create(
+            visit=self.visit,
+            session_key=self.visit.session_key,
+            path='/product/milk/',
+            viewed_at=self.visit.started_at,
+        )
+        self._event('checkout_started')
+        self._event('paid_order', Decimal('9.99'))
+
+        out = StringIO()
+        call_command('backfill_visit_conversions', stdout=out)
+        self.assertIn('Rebuilt conversion flags for 1 visit(s).', out.getvalue())
+        conversion = VisitConversion.objects.get(visit=self.visit)
+        self.assertTrue(conversion.viewed_product)
+        self.assertTrue(conversion.started_checkout)
+        self.assertFalse(conversion.added_to_cart)
+        self.assertEqual(conversion.revenue, Decimal('9.99'))
+
+        today = timezone.localdate()
+        row = compute_rollup_rows(today, today)[0]
+        self.assertEqual(row['product_view_sessions'], 1)
+        self.assertEqual(row['checkout_sessions'], 1)
+        self.assertEqual(row['paid_sessions'], 1)
+        self.assertEqual(row['revenue'], Decimal('9.99'))
+        self.assertEqual(
+            _rollup_campaigns([row]),
+            [{'label': 'spring', 'sessions': 1, 'paid_orders': 1, 'paid_sessions': 1, 'conversion_rate': 100.0, 'revenue': '9.99'}],
+        )
+
+
+class PageTransitionTests(TestCase):
+    def setUp(self):
+        self.staff_user = get_user_model().objects.create_user(
+            username='flowstaff',
+            password='staffpass123',
+            is_staff=True,
+        )
+        self.today = timezone.localdate()
+        start = timezone.now() - timedelta(days=3)
+        sequences = [
+            ['/', '/product/milk/', '/basket/'],
+            ['/', '/product/milk/', '/product/bread/', '/product/milk/', '/basket/'],
+            ['/product/milk/'],
+        ]
+        for visit_index, paths in enumerate(sequences):
+            visit = Visit.objects.create(session_key=f'flow-{visit_index}', started_at=start, last_seen_at=start)
+            VisitPageview.objects.bulk_create(
+                [
+                    VisitPageview(
+                        visit=visit,
+                        session_key=visit.session_key,
+                        path=path,
+                        viewed_at=start + timedelta(seconds=index),
+                        sequence_index=index + 1,
+                    )
+                    for index, path in enumerate(paths)
+                ]
+            )
+
+    def test_next_page_counts_uses_one_query(self):
+        with self.assertNumQueries(1):
+            counts = next_page_counts(VisitPageview.objects.all(), '/product/milk/')
+        self.assertEqual(counts, {'/basket/': 2, '/product/bread/': 1})
+
+    def test_transitions_are_stored_by_rollup_job(self):
+        transitions = compute_page_transitions(self.today - timedelta(days=3), self.today)
+        day = self.today - timedelta(days=3)
+        self.assertEqual(transitions[(day, '/', '/product/milk/')], 2)
+        self.assertEqual(transitions[(day, '/product/milk/', '/basket/')], 2)
+
+        call_command('rollup_visits', stdout=StringIO())
+        VisitPageview.objects.all().delete()
+
+        self.client.force_login(self.staff_user)
+        payload = self.client.get(reverse('visits_page_daily'), {'path': '/product/milk/', 'days': 30}).json()
+        self.assertEqual(
+            payload['next_pages'],
+            [{'label': '/basket/', 'count': 2}, {'label': '/product/bread/', 'count': 1}],
+        )
+
+
+class PagesSummaryTests(TestCase):
+    def setUp(self):
+        self.staff_user = get_user_model().objects.create_user(
+            username='pagesstaff',
+            password='staffpass123',
+            is_staff=True,
+        )
+        old = timezone.now() - timedelta(days=3)
+        now = timezone.now()
+        visit = Visit.objects.create(session_key='pages-old', started_at=old, last_seen_at=old)
+        today_visit = Visit.objects.create(session_key='pages-today', started_at=now, last_seen_at=now)
+        views = [('/product/milk/', 5, visit, old), ('/product/bread/', 3, visit, old), ('/basket/', 4, visit, old)]
+        views += [('/product/bread/', 4, today_visit, now), ('/checkout/', 1, today_visit, now)]
+        for path, count, owner, viewed_at in views:
+            VisitPageview.objects.bulk_create(
+                [
+                    VisitPageview(visit=owner, session_key=owner.session_key, path=path, viewed_at=viewed_at, duration_seconds=10)
+                    for _ in range(count)
+                ]
+            )
+        call_command('rollup_visits', stdout=StringIO())
+        self.client.force_login(self.staff_user)
+
+    def _get(self, **params):
+        return self.client.get(reverse('visits_pages_summary'), {'days': 30, **params}).json()
+
+    def test_merges_stored_and_live_rows_and_paginates(self):
+        payload = self._get(per_page=2)
+        self.assertEqual(payload['total_rows'], 4)
+        self.assertEqual(payload['pages'], 2)
+        self.assertEqual(
+            [(row['path'], row['pageviews']) for row in payload['results']],
+            [('/product/bread/', 7), ('/product/milk/', 5)],
+        )
+
+        payload = self._get(per_page=2, page=2)
+        self.assertEqual([row['path'] for row in payload['results']], ['/basket/', '/checkout/'])
+
+    def test_prefix_search_and_path_sort(self):
+        payload = self._get(q='/product/', sort='path')
+        self.assertEqual([row['path'] for row in payload['results']], ['/product/bread/', '/product/milk/'])
+        self.assertEqual(payload['results'][0]['avg_dwell_seconds'], 10.0)
+
+    def test_dwell_sort_puts_untimed_paths_last(self):
+        visit = Visit.objects.get(session_key='pages-today')
+        now = timezone.now()
+        VisitPageview.objects.bulk_create([
+            VisitPageview(visit=visit, session_key=visit.session_key, path='/about/', viewed_at=now, duration_seconds=None),
+            VisitPageview(visit=visit, session_key=visit.session_key, path='/zero/', viewed_at=now, duration_seconds=0),
+        ])
+        expected = ['/basket/', '/checkout/', '/product/bread/', '/product/milk/', '/zero/', '/about/']
+        for params in ({}, {'user_scope': 'anonymous'}):
+            payload = self._get(sort='avg_dwell', **params)
+            self.assertEqual([row['path'] for row in payload['results']], expected)
+
+    def test_dimension_filters_use_raw_rows(self):
+        payload = self._get(user_scope='anonymous', sort='pageviews')
+        self.assertEqual(payload['results'][0], {'path': '/product/bread/', 'pageviews': 7, 'sessions': 2, 'avg_dwell_seconds': 10.0})
+
+
+class ProductPerformanceTests(TestCase):
+    def _event(self, event_type, **properties):
+        return AnalyticsEvent.objects.create(
+            event_type=event_type,
+            label=properties.pop('label', ''),
+            properties=properties,
+        )
+
+    def test_backfill_then_group_in_sql(self):
+        self._event('add_to_cart', label='Milk', product_id=1, quantity=2, sub_category='Milk & Cream')
+        self._event('order_item_paid', label='Milk', product_id=1, quantity=2, line_total='3.00', sub_category='Milk & Cream')
+        self._event('order_item_paid', label='Bread', product_id=2, quantity=1, line_total='1.20', main_category='Bakery')
+        self._event('add_to_cart', label='Eggs', product_id=3)
+        self._event('paid_order', order_id=5)
+
+        out = StringIO()
+        call_command('backfill_event_product_fields', stdout=out)
+        self.assertIn('Updated product columns for 4 event(s).', out.getvalue())
+        self.assertEqual(AnalyticsEvent.objects.get(label='Bread').revenue, Decimal('1.20'))
+
+        with self.assertNumQueries(2):
+            products, categories = _build_product_performance(AnalyticsEvent.objects.all())
+
+        self.assertEqual(
+            products[0],
+            {'product_id': '1', 'label': 'Milk', 'add_to_cart': 2, 'paid_quantity': 2, 'paid_revenue': '3.00'},
+        )
+        self.assertEqual(products[-1]['add_to_cart'], 1)
+        self.assertEqual([row['label'] for row in categories], ['Milk & Cream', 'Bakery', 'Uncategorized'])
+
+    def test_events_without_a_product_id_are_grouped_by_label(self):
+        for label, product_id, quantity in (('Loose apples', None, 2), ('Loose pears', None, 1), ('Loose apples', None, 1), ('Milk', 1, 2)):
+            AnalyticsEvent.objects.create(event_type='add_to_cart', label=label, product_id=product_id, quantity=quantity)
+
+        products, _ = _build_product_performance(AnalyticsEvent.objects.all())
+
+        self.assertEqual(
+            [(row['product_id'], row['label'], row['add_to_cart']) for row in products],
+            [('', 'Loose apples', 3), ('1', 'Milk', 2), ('', 'Loose pears', 1)],
+        )
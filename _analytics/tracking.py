@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import hashlib
+import re
+import secrets
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal, InvalidOperation
@@ -9,7 +12,8 @@ from django.conf import settings
 from django.db import DatabaseError
 from django.utils import timezone
 
-from .models import AnalyticsEvent, GoogleAdsLandingArrival, Visit, VisitPageview
+from . import attribution, conversions, ingestion, presence
+from .models import AnalyticsEvent, GoogleAdsLandingArrival, IngestionCounter, Visit, VisitPageview
 
 
 TRACKED_UTM_KEYS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content')
@@ -32,6 +36,12 @@ class VisitSettings:
     session_timeout_seconds: int
     last_seen_update_seconds: int
     excluded_path_prefixes: tuple[str, ...]
+    buffered: bool = False
+    # 'track' stores bots like people, 'count' keeps per-bot daily counters only,
+    # 'drop' keeps a single daily counter.
+    bot_policy: str = 'count'
+    # (path prefix, N) pairs, longest prefix first: store 1 in N visits' pageviews.
+    pageview_sampling: tuple[tuple[str, int], ...] = ()
 
 
 def get_visit_settings() -> VisitSettings:
@@ -50,6 +60,14 @@ def get_visit_settings() -> VisitSettings:
                 ),
             )
         ),
+        buffered=bool(getattr(settings, 'VISIT_TRACKING_BUFFERED', True)),
+        bot_policy=getattr(settings, 'VISIT_BOT_POLICY', 'count'),
+        pageview_sampling=tuple(
+            sorted(
+                ((prefix, max(1, int(every))) for prefix, every in getattr(settings, 'VISIT_PAGEVIEW_SAMPLING', {}).items()),
+                key=lambda rule: -len(rule[0]),
+            )
+        ),
     )
 
 
@@ -68,6 +86,15 @@ def classify_device_type(user_agent: str) -> str:
     return 'other'
 
 
+BOT_TOKEN_RE = re.compile(r'[\w.-]*(?:bot|spider|crawl|slurp)[\w.-]*')
+
+
+def bot_name(user_agent: str) -> str:
+    """Short crawler name from a bot user agent, e.g. 'googlebot'."""
+    match = BOT_TOKEN_RE.search((user_agent or '').lower())
+    return match.group(0)[:100] if match else 'other'
+
+
 def classify_browser_family(user_agent: str) -> str:
     ua = (user_agent or '').lower()
     if 'edg/' in ua:
@@ -146,12 +173,98 @@ def should_track_request(request, response, visit_settings: VisitSettings | None
     return True
 
 
-def _get_or_create_session_key(request) -> str | None:
-    if not hasattr(request, 'session'):
-        return None
-    if request.session.session_key is None:
-        request.session.save()
-    return request.session.session_key
+VISIT_STATE_SALT = '_analytics.visit_state'
+_STATE_INT_FIELDS = ('visit_id', 'last_seen_ts', 'last_db_update_ts', 'last_pageview_id', 'last_pageview_ts', 'sequence')
+_LEGACY_SESSION_KEYS = {
+    'visit_id': 'visit_id',
+    'last_seen_ts': 'visit_last_seen_ts',
+    'last_db_update_ts': 'visit_last_db_update_ts',
+    'last_pageview_id': 'visit_last_pageview_id',
+    'last_pageview_ts': 'visit_last_pageview_ts',
+    'sequence': 'visit_pageview_sequence',
+}
+_TRACKING_KEY_RE = re.compile(r'^[0-9A-Za-z_-]{1,40}$')
+
+
+@dataclass
+class VisitState:
+    """
+    Per-browser tracking state, kept in a signed cookie instead of the Django
+    session so tracked pages never write session rows. ``key`` identifies the
+    browser in analytics rows (stored as ``session_key``).
+    """
+
+    key: str
+    visit_id: int | None = None
+    last_seen_ts: int | None = None
+    last_db_update_ts: int | None = None
+    last_pageview_id: int | None = None
+    last_pageview_ts: int | None = None
+    sequence: int | None = 0
+    changed: bool = False
+
+    def update(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+        self.changed = True
+
+    def encode(self) -> str:
+        values = [getattr(self, name) for name in _STATE_INT_FIELDS]
+        return '.'.join([self.key, *('' if value is None else str(value) for value in values)])
+
+    @classmethod
+    def decode(cls, raw) -> 'VisitState | None':
+        parts = str(raw or '').split('.')
+        if len(parts) != len(_STATE_INT_FIELDS) + 1 or not _TRACKING_KEY_RE.match(parts[0]):
+            return None
+        try:
+            values = [int(part) if part else None for part in parts[1:]]
+        except ValueError:
+            return None
+        return cls(parts[0], **dict(zip(_STATE_INT_FIELDS, values)))
+
+
+def _state_cookie_name() -> str:
+    return getattr(settings, 'VISIT_STATE_COOKIE_NAME', 'vstate')
+
+
+def get_visit_state(request) -> VisitState:
+    state = getattr(request, '_visit_state', None)
+    if state is not None:
+        return state
+
+    state = VisitState.decode(request.get_signed_cookie(_state_cookie_name(), default=None, salt=VISIT_STATE_SALT))
+    if state is None:
+        # First tracked request: reuse an existing session key and any state an
+        # older release kept in the session (read only), else mint a new key.
+        session = getattr(request, 'session', None)
+        session_key = getattr(session, 'session_key', None) or ''
+        if not _TRACKING_KEY_RE.match(session_key):
+            session_key = secrets.token_hex(16)
+        state = VisitState(session_key, changed=True)
+        if session is not None:
+            for name, session_name in _LEGACY_SESSION_KEYS.items():
+                value = session.get(session_name)
+                if isinstance(value, int):
+                    setattr(state, name, value)
+    request._visit_state = state
+    return state
+
+
+def save_visit_state(request, response):
+    """Write the tracking cookie when this request changed the state."""
+    state = getattr(request, '_visit_state', None)
+    if state is None or not state.changed:
+        return
+    response.set_signed_cookie(
+        _state_cookie_name(),
+        state.encode(),
+        salt=VISIT_STATE_SALT,
+        max_age=getattr(settings, 'SESSION_COOKIE_AGE', 60 * 60 * 24 * 14),
+        secure=getattr(settings, 'SESSION_COOKIE_SECURE', False),
+        httponly=True,
+        samesite='Lax',
+    )
 
 
 def _get_user(request):
@@ -172,15 +285,14 @@ def get_or_create_active_visit(request, *, now=None, create=True):
         return None, True
 
     visit_settings = get_visit_settings()
-    session_key = _get_or_create_session_key(request)
-    if not session_key:
-        return None, True
+    state = get_visit_state(request)
+    session_key = state.key
 
     now = now or timezone.now()
     timeout = timedelta(seconds=visit_settings.session_timeout_seconds)
     now_ts = int(now.timestamp())
-    visit_id = request.session.get('visit_id')
-    last_seen_at = _timestamp_to_datetime(request.session.get('visit_last_seen_ts'))
+    visit_id = state.visit_id
+    last_seen_at = _timestamp_to_datetime(state.last_seen_ts)
 
     is_new_visit = (
         visit_id is None
@@ -220,12 +332,15 @@ def get_or_create_active_visit(request, *, now=None, create=True):
         if not create:
             return None, True
         visit = Visit.objects.create(**visit_defaults)
-        request.session['visit_id'] = visit.pk
-        request.session['visit_last_seen_ts'] = now_ts
-        request.session['visit_last_db_update_ts'] = now_ts
-        request.session['visit_last_pageview_id'] = None
-        request.session['visit_last_pageview_ts'] = None
-        request.session['visit_pageview_sequence'] = 0
+        attribution.record_campaign_session(visit)
+        state.update(
+            visit_id=visit.pk,
+            last_seen_ts=now_ts,
+            last_db_update_ts=now_ts,
+            last_pageview_id=None,
+            last_pageview_ts=None,
+            sequence=0,
+        )
         request.current_visit = visit
         return visit, True
 
@@ -236,17 +351,20 @@ def get_or_create_active_visit(request, *, now=None, create=True):
             if not create:
                 return None, True
             visit = Visit.objects.create(**visit_defaults)
-            request.session['visit_id'] = visit.pk
-            request.session['visit_last_seen_ts'] = now_ts
-            request.session['visit_last_db_update_ts'] = now_ts
-            request.session['visit_last_pageview_id'] = None
-            request.session['visit_last_pageview_ts'] = None
-            request.session['visit_pageview_sequence'] = 0
+            attribution.record_campaign_session(visit)
+            state.update(
+                visit_id=visit.pk,
+                last_seen_ts=now_ts,
+                last_db_update_ts=now_ts,
+                last_pageview_id=None,
+                last_pageview_ts=None,
+                sequence=0,
+            )
             request.current_visit = visit
             return visit, True
 
-    request.session['visit_last_seen_ts'] = now_ts
-    last_db_update_ts = request.session.get('visit_last_db_update_ts')
+    state.update(last_seen_ts=now_ts)
+    last_db_update_ts = state.last_db_update_ts
     if (
         not isinstance(last_db_update_ts, int)
         or (now_ts - last_db_update_ts) >= visit_settings.last_seen_update_seconds
@@ -256,19 +374,29 @@ def get_or_create_active_visit(request, *, now=None, create=True):
             updates['user'] = user
         if visit.is_authenticated != bool(user):
             updates['is_authenticated'] = bool(user)
-        if updates:
+        if visit_settings.buffered:
+            ingestion.enqueue(
+                ingestion.VisitTouchRecord(
+                    visit_id=visit.pk,
+                    last_seen_at=now,
+                    user_id=getattr(user, 'id', None),
+                    is_authenticated=bool(user),
+                )
+            )
+        else:
             Visit.objects.filter(pk=visit.pk).update(**updates)
-            for field_name, field_value in updates.items():
-                setattr(visit, field_name, field_value)
-        request.session['visit_last_db_update_ts'] = now_ts
+        for field_name, field_value in updates.items():
+            setattr(visit, field_name, field_value)
+        state.update(last_db_update_ts=now_ts)
 
     request.current_visit = visit
     return visit, False
 
 
 def _update_previous_pageview_duration(request, now):
-    previous_pageview_id = request.session.get('visit_last_pageview_id')
-    previous_ts = _timestamp_to_datetime(request.session.get('visit_last_pageview_ts'))
+    state = get_visit_state(request)
+    previous_pageview_id = state.last_pageview_id
+    previous_ts = _timestamp_to_datetime(state.last_pageview_ts)
     if not previous_pageview_id or previous_ts is None:
         return
 
@@ -278,6 +406,68 @@ def _update_previous_pageview_duration(request, now):
     )
 
 
+def _advance_pageview_count(visit, sequence_index):
+    Visit.objects.filter(pk=visit.pk, pageview_count__lt=sequence_index).update(pageview_count=sequence_index)
+    visit.pageview_count = max(visit.pageview_count, sequence_index)
+
+
+def record_ingestion_counter(kind, key='', *, now=None, visit_settings=None):
+    """Count a tracking record that was not stored; buffered like pageviews."""
+    visit_settings = visit_settings or get_visit_settings()
+    day = timezone.localdate(now or timezone.now())
+    if visit_settings.buffered:
+        ingestion.enqueue(ingestion.CounterRecord(day=day, kind=kind, key=key))
+    else:
+        ingestion.write_counters({(day, kind, key): 1})
+
+
+def pageview_sample_rule(path, visit_settings=None):
+    """``(prefix, N)`` of the sampling rule matching ``path``, or ``('', 1)``."""
+    visit_settings = visit_settings or get_visit_settings()
+    for prefix, every in visit_settings.pageview_sampling:
+        if path.startswith(prefix):
+            return prefix, every
+    return '', 1
+
+
+def is_sampled_in(session_key, prefix, every) -> bool:
+    """
+    Deterministic 1-in-``every`` choice per session and rule, so a visit keeps
+    either all or none of its pageviews under a sampled prefix.
+    """
+    if every <= 1:
+        return True
+    digest = hashlib.blake2b(f'{session_key}|{prefix}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % every == 0
+
+
+def _skip_sampled_pageview(request, visit, now, previous_sequence_index, sequence_index, visit_settings):
+    # The previous pageview's duration is known now even though this one is not stored.
+    state = get_visit_state(request)
+    previous_ts = _timestamp_to_datetime(state.last_pageview_ts)
+    if visit_settings.buffered:
+        if previous_ts is not None:
+            ingestion.enqueue(
+                ingestion.PageviewDurationRecord(
+                    visit_id=visit.pk,
+                    sequence_index=previous_sequence_index,
+                    duration_seconds=max(0, int((now - previous_ts).total_seconds())),
+                )
+            )
+        ingestion.enqueue(ingestion.SampledPageviewRecord(visit_id=visit.pk, sequence_index=sequence_index))
+    else:
+        _update_previous_pageview_duration(request, now)
+        _advance_pageview_count(visit, sequence_index)
+    # Conversion flags stay exact for sampled paths.
+    if (getattr(request, 'path', '') or '').startswith(conversions.PRODUCT_PATH_PREFIX):
+        if visit_settings.buffered:
+            ingestion.enqueue(ingestion.ProductViewRecord(visit_id=visit.pk))
+        else:
+            conversions.mark_product_views([visit.pk])
+    state.update(last_pageview_id=None, last_pageview_ts=int(now.timestamp()), sequence=sequence_index)
+    request.current_pageview = None
+
+
 def track_pageview(request, *, visit=None, now=None):
     now = now or timezone.now()
     visit = visit or getattr(request, 'current_visit', None)
@@ -286,22 +476,55 @@ def track_pageview(request, *, visit=None, now=None):
     if visit is None:
         return None
 
-    _update_previous_pageview_duration(request, now)
-    sequence_index = int(request.session.get('visit_pageview_sequence') or 0) + 1
-    pageview = VisitPageview.objects.create(
-        visit=visit,
-        user=_get_user(request),
-        session_key=request.session.session_key or '',
-        path=getattr(request, 'path', '') or '',
-        query=getattr(request, 'META', {}).get('QUERY_STRING', '') or '',
-        referrer=getattr(request, 'META', {}).get('HTTP_REFERER', '') or '',
-        viewed_at=now,
-        sequence_index=sequence_index,
-        is_authenticated=bool(_get_user(request)),
+    visit_settings = get_visit_settings()
+    state = get_visit_state(request)
+    previous_sequence_index = int(state.sequence or 0)
+    sequence_index = previous_sequence_index + 1
+    path = getattr(request, 'path', '') or ''
+    prefix, every = pageview_sample_rule(path, visit_settings)
+    if not is_sampled_in(state.key, prefix, every):
+        _skip_sampled_pageview(request, visit, now, previous_sequence_index, sequence_index, visit_settings)
+        record_ingestion_counter(IngestionCounter.KIND_SAMPLED_OUT, prefix, now=now, visit_settings=visit_settings)
+        return None
+
+    user = _get_user(request)
+    fields = {
+        'user_id': getattr(user, 'id', None),
+        'session_key': state.key,
+        'path': path,
+        'query': getattr(request, 'META', {}).get('QUERY_STRING', '') or '',
+        'referrer': getattr(request, 'META', {}).get('HTTP_REFERER', '') or '',
+        'viewed_at': now,
+        'sequence_index': sequence_index,
+        'is_authenticated': bool(user),
+        'sample_weight': every,
+    }
+
+    if visit_settings.buffered:
+        previous_ts = _timestamp_to_datetime(state.last_pageview_ts)
+        ingestion.enqueue(
+            ingestion.PageviewRecord(
+                visit_id=visit.pk,
+                previous_sequence_index=previous_sequence_index if previous_ts is not None else None,
+                previous_viewed_at=previous_ts,
+                **fields,
+            )
+        )
+        # The row id is not known until the flusher writes it; events tracked
+        # meanwhile are linked to it by visit and sequence index at flush time.
+        pageview = None
+    else:
+        _update_previous_pageview_duration(request, now)
+        pageview = VisitPageview.objects.create(visit=visit, **fields)
+        _advance_pageview_count(visit, sequence_index)
+        if fields['path'].startswith(conversions.PRODUCT_PATH_PREFIX):
+            conversions.mark_product_views([visit.pk])
+
+    state.update(
+        last_pageview_id=getattr(pageview, 'pk', None),
+        last_pageview_ts=int(now.timestamp()),
+        sequence=sequence_index,
     )
-    request.session['visit_last_pageview_id'] = pageview.pk
-    request.session['visit_last_pageview_ts'] = int(now.timestamp())
-    request.session['visit_pageview_sequence'] = sequence_index
     request.current_pageview = pageview
     return pageview
 
@@ -310,10 +533,24 @@ def track_request(request, response):
     try:
         if not should_track_request(request, response):
             return
+        visit_settings = get_visit_settings()
+        user_agent = getattr(request, 'META', {}).get('HTTP_USER_AGENT', '') or ''
+        if visit_settings.bot_policy != 'track' and classify_device_type(user_agent) == 'bot':
+            # Checked before the session is touched, so crawlers cost no session or visit rows.
+            if visit_settings.bot_policy == 'drop':
+                record_ingestion_counter(IngestionCounter.KIND_BOT_DROPPED, visit_settings=visit_settings)
+            else:
+                record_ingestion_counter(
+                    IngestionCounter.KIND_BOT_PAGEVIEW,
+                    bot_name(user_agent),
+                    visit_settings=visit_settings,
+                )
+            return
         visit, _ = get_or_create_active_visit(request, create=True)
         if visit is None:
             return
         track_pageview(request, visit=visit)
+        presence.record(get_visit_state(request).key, visit.device_type, getattr(request, 'path', '') or '')
     except DatabaseError:
         return
 
@@ -327,38 +564,156 @@ def _normalize_event_value(value):
         return None
 
 
+def _positive_int(value):
+    try:
+        number = int(Decimal(str(value)))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    return number if number >= 0 else None
+
+
+def _product_id(value):
+    number = _positive_int(value)
+    return number or None
+
+
+def product_event_fields(properties) -> dict:
+    """Typed product columns derived from an event's ``properties`` payload."""
+    props = properties if isinstance(properties, dict) else {}
+    return {
+        'product_id': _product_id(props.get('product_id')),
+        'quantity': _positive_int(props.get('quantity')),
+        'revenue': _normalize_event_value(props.get('line_total')),
+        'main_category': str(props.get('main_category') or '')[:255],
+        'sub_category': str(props.get('sub_category') or '')[:255],
+    }
+
+
+def _resolve_event_context(request, now):
+    """
+    The request's visit and pageview, plus the sequence index of a pageview
+    that is still waiting in the ingestion buffer (then ``pageview`` is None
+    and the events are linked to it when the buffer is flushed).
+    """
+    visit, _ = get_or_create_active_visit(request, now=now, create=True)
+    if visit is None:
+        return None, None, None
+
+    pageview = getattr(request, 'current_pageview', None)
+    pending_sequence = None
+    if pageview is None:
+        state = get_visit_state(request)
+        pageview_id = state.last_pageview_id
+        sequence_index = state.sequence
+        if pageview_id:
+            pageview = VisitPageview.objects.filter(pk=pageview_id).first()
+        elif sequence_index:
+            pageview = VisitPageview.objects.filter(visit=visit, sequence_index=sequence_index).first()
+            if pageview is None and get_visit_settings().buffered:
+                pending_sequence = sequence_index
+        request.current_pageview = pageview
+    return visit, pageview, pending_sequence
+
+
+def _link_buffered_pageview(visit, pending_sequence, events):
+    event_ids = tuple(event.pk for event in events if event.pk is not None)
+    if pending_sequence and event_ids:
+        ingestion.enqueue(
+            ingestion.EventPageviewLinkRecord(
+                event_ids=event_ids,
+                visit_id=visit.pk,
+                sequence_index=pending_sequence,
+            )
+        )
+
+
+def _build_event_kwargs(request, visit, pageview, event_type, *, label='', value=None, properties=None, path=None):
+    return {
+        'visit': visit,
+        'pageview': pageview,
+        'user': _get_user(request),
+        'session_key': get_visit_state(request).key,
+        'event_type': (event_type or '').strip(),
+        'path': (path or getattr(request, 'path', '') or '').strip(),
+        'label': (label or '').strip(),
+        'value': _normalize_event_value(value),
+        'properties': properties or {},
+        **product_event_fields(properties),
+    }
+
+
 def track_event(request, event_type: str, *, label: str = '', value=None, properties=None, path: str | None = None):
     try:
         if not hasattr(request, 'session'):
             return None
 
         now = timezone.now()
-        visit, _ = get_or_create_active_visit(request, now=now, create=True)
+        visit, pageview, pending_sequence = _resolve_event_context(request, now)
         if visit is None:
             return None
 
-        pageview = getattr(request, 'current_pageview', None)
-        if pageview is None:
-            pageview_id = request.session.get('visit_last_pageview_id')
-            if pageview_id:
-                pageview = VisitPageview.objects.filter(pk=pageview_id).first()
-
         event = AnalyticsEvent.objects.create(
-            visit=visit,
-            pageview=pageview,
-            user=_get_user(request),
-            session_key=request.session.session_key or '',
-            event_type=(event_type or '').strip(),
-            path=(path or getattr(request, 'path', '') or '').strip(),
-            label=(label or '').strip(),
-            value=_normalize_event_value(value),
-            properties=properties or {},
+            **_build_event_kwargs(
+                request,
+                visit,
+                pageview,
+                event_type,
+                label=label,
+                value=value,
+                properties=properties,
+                path=path,
+            )
         )
+        _link_buffered_pageview(visit, pending_sequence, [event])
+        conversions.record_events([event])
         return event
     except DatabaseError:
         return None
 
 
+def track_events_bulk(request, events, *, path: str | None = None):
+    """
+    Record several events for the same request with one visit/pageview lookup
+    and a single bulk insert. Each item in ``events`` is a dict with
+    ``event_type`` and optional ``label``, ``value``, ``properties`` and ``path``.
+    """
+    try:
+        if not hasattr(request, 'session'):
+            return []
+
+        events = [event for event in (events or []) if (event.get('event_type') or '').strip()]
+        if not events:
+            return []
+
+        now = timezone.now()
+        visit, pageview, pending_sequence = _resolve_event_context(request, now)
+        if visit is None:
+            return []
+
+        created = AnalyticsEvent.objects.bulk_create(
+            [
+                AnalyticsEvent(
+                    **_build_event_kwargs(
+                        request,
+                        visit,
+                        pageview,
+                        event['event_type'],
+                        label=event.get('label', ''),
+                        value=event.get('value'),
+                        properties=event.get('properties'),
+                        path=event.get('path') or path,
+                    )
+                )
+                for event in events
+            ]
+        )
+        _link_buffered_pageview(visit, pending_sequence, created)
+        conversions.record_events(created)
+        return created
+    except DatabaseError:
+        return []
+
+
 def record_google_ads_landing_arrival(request, *, path: str | None = None):
     try:
         if not hasattr(request, 'session'):
@@ -377,11 +732,11 @@ def record_google_ads_landing_arrival(request, *, path: str | None = None):
         if visit is None or (visit.landing_path or '').strip() != arrival_path:
             return None
 
-        arrival, _ = GoogleAdsLandingArrival.objects.get_or_create(
+        arrival, created = GoogleAdsLandingArrival.objects.get_or_create(
             visit=visit,
             defaults={
                 'user': _get_user(request),
-                'session_key': request.session.session_key or '',
+                'session_key': get_visit_state(request).key,
                 'path': arrival_path,
                 'arrived_at': now,
                 'traffic_source': (visit.traffic_source or '').strip(),
@@ -394,6 +749,8 @@ def record_google_ads_landing_arrival(request, *, path: str | None = None):
                 'referrer_host': (visit.referrer_host or '').strip(),
             },
         )
+        if created:
+            attribution.record_arrival(arrival)
         return arrival
     except DatabaseError:
         return None
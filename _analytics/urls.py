@@ -1,10 +1,23 @@
 from django.urls import path
 
-from .views import visits_dashboard, visits_page_daily, visits_pages_summary, visits_summary
+from .views import (
+    visits_active,
+    visits_campaigns,
+    visits_cohorts,
+    visits_dashboard,
+    visits_export,
+    visits_page_daily,
+    visits_pages_summary,
+    visits_summary,
+)
 
 urlpatterns = [
     path('visits/dashboard/', visits_dashboard, name='visits_dashboard'),
     path('visits/', visits_summary, name='visits_summary'),
     path('visits/page/daily/', visits_page_daily, name='visits_page_daily'),
     path('visits/pages/', visits_pages_summary, name='visits_pages_summary'),
+    path('visits/active/', visits_active, name='visits_active'),
+    path('visits/export/', visits_export, name='visits_export'),
+    path('visits/cohorts/', visits_cohorts, name='visits_cohorts'),
+    path('visits/campaigns/', visits_campaigns, name='visits_campaigns'),
 ]
@@ -1,20 +1,43 @@
 from __future__ import annotations
 
 from collections import defaultdict
-from datetime import datetime, time, timedelta
-from decimal import Decimal, InvalidOperation
+from datetime import datetime, timedelta
+from decimal import Decimal
 
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.paginator import EmptyPage, Paginator
 from django.db import DatabaseError
-from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
-from django.db.models.functions import TruncDate
-from django.http import JsonResponse
+from django.db.models import Avg, Case, Count, DecimalField, ExpressionWrapper, F, FloatField, Max, Q, Sum, Value, When
+from django.db.models.expressions import OrderBy
+from django.db.models.functions import Coalesce, NullIf, TruncDate
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils import timezone
 
-from .models import AnalyticsAnnotation, AnalyticsEvent, AnalyticsSavedView, GoogleAdsLandingArrival, Visit, VisitPageview
+from . import attribution, cohorts, exports, presence, response_cache
+from .models import (
+    AnalyticsAnnotation,
+    AnalyticsEvent,
+    AnalyticsSavedView,
+    IngestionCounter,
+    PathDailyStats,
+    Visit,
+    VisitDailyRollup,
+    VisitPageview,
+)
+from .rollups import (
+    CONVERSION_EVENT_TYPES,
+    estimate_unique_visitors,
+    final_rollup_days,
+    load_rollup_rows,
+    next_page_counts,
+    pageview_count,
+    path_session_count,
+    stored_next_page_counts,
+    window_bounds,
+)
 
 
 ANALYTICS_SCHEMA_ERROR = 'Analytics database changes are not applied yet. Run manage.py migrate _analytics and reload this page.'
@@ -46,13 +69,6 @@ def _format_date(value):
     return value.isoformat() if value else ''
 
 
-def _date_bounds(start_date, end_date):
-    tz = timezone.get_current_timezone()
-    start_dt = timezone.make_aware(datetime.combine(start_date, time.min), tz)
-    end_dt = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
-    return start_dt, end_dt
-
-
 def _resolve_window(request, default_days=30):
     days = _parse_days(request.GET.get('days'), default=default_days)
     today = timezone.localdate()
@@ -68,7 +84,7 @@ def _resolve_window(request, default_days=30):
         resolved_start = today - timedelta(days=days - 1)
         resolved_days = days
 
-    start_dt, end_dt = _date_bounds(resolved_start, resolved_end)
+    start_dt, end_dt = window_bounds(resolved_start, resolved_end)
     previous_start_dt = start_dt - (end_dt - start_dt)
     previous_end_dt = start_dt
     return {
@@ -146,23 +162,6 @@ def _apply_event_filters(qs, filters):
     return qs
 
 
-def _apply_google_ads_arrival_filters(qs, filters):
-    qs = qs.filter(Q(user__isnull=True) | Q(user__is_superuser=False))
-    if filters['device']:
-        qs = qs.filter(device_type=filters['device'])
-    if filters['browser']:
-        qs = qs.filter(browser_family=filters['browser'])
-    if filters['source']:
-        qs = qs.filter(traffic_source=filters['source'])
-    if filters['campaign']:
-        qs = qs.filter(utm_campaign=filters['campaign'])
-    if filters['user_scope'] == 'authenticated':
-        qs = qs.filter(is_authenticated=True)
-    elif filters['user_scope'] == 'anonymous':
-        qs = qs.filter(is_authenticated=False)
-    return qs
-
-
 def _comparison_payload(current, previous):
     if previous in (None, 0):
         delta_pct = None if current == 0 else 100.0
@@ -176,18 +175,21 @@ def _comparison_payload(current, previous):
 
 
 def _unique_visitor_count(visits_qs):
-    return len({(user_id or 0, session_key or '') for user_id, session_key in visits_qs.values_list('user_id', 'session_key')})
+    return visits_qs.order_by().values('user_id', 'session_key').distinct().count()
 
 
-def _average_session_seconds(visits_qs):
-    total_seconds = 0
-    count = 0
-    for started_at, last_seen_at in visits_qs.values_list('started_at', 'last_seen_at'):
-        if not started_at or not last_seen_at:
-            continue
-        total_seconds += max(0, int((last_seen_at - started_at).total_seconds()))
-        count += 1
-    return round(total_seconds / count, 1) if count else 0
+def _unique_visitors(visits_qs, start_date, end_date, filters):
+    """
+    Distinct visitors for the window and whether the figure is an estimate.
+    Short windows are counted exactly; longer ones merge daily HyperLogLog
+    sketches (about 3% standard error) unless several filters are combined.
+    """
+    exact_max_days = int(getattr(settings, 'VISIT_EXACT_UNIQUES_MAX_DAYS', 7))
+    if (end_date - start_date).days + 1 > exact_max_days:
+        estimate = estimate_unique_visitors(start_date, end_date, filters)
+        if estimate is not None:
+            return estimate, True
+    return _unique_visitor_count(visits_qs), False
 
 
 def _average_page_dwell_seconds(pageviews_qs):
@@ -195,24 +197,6 @@ def _average_page_dwell_seconds(pageviews_qs):
     return round(float(avg), 1) if avg is not None else 0
 
 
-def _bounce_rate(visits_qs, start_dt, end_dt):
-    total_sessions = visits_qs.count()
-    if total_sessions == 0:
-        return 0
-    bounced = (
-        visits_qs.annotate(
-            pageview_count=Count(
-                'pageviews',
-                filter=Q(pageviews__viewed_at__gte=start_dt, pageviews__viewed_at__lt=end_dt),
-                distinct=True,
-            )
-        )
-        .filter(pageview_count__lte=1)
-        .count()
-    )
-    return round((bounced / total_sessions) * 100, 1)
-
-
 def _serialize_breakdown(qs, field_name, *, limit=8, label_key='label', count_key='count', exclude_blank=True):
     if exclude_blank:
         qs = qs.exclude(**{field_name: ''})
@@ -232,9 +216,9 @@ def _serialize_breakdown(qs, field_name, *, limit=8, label_key='label', count_ke
     return payload
 
 
-def _build_time_series(visits_qs, pageviews_qs):
+def _build_time_series(visits_qs, pageviews_qs, *, session_weight=1):
     sessions_by_day = {
-        row['day']: row['sessions']
+        row['day']: row['sessions'] * session_weight
         for row in (
             visits_qs.annotate(day=TruncDate('started_at'))
             .values('day')
@@ -247,7 +231,7 @@ def _build_time_series(visits_qs, pageviews_qs):
         for row in (
             pageviews_qs.annotate(day=TruncDate('viewed_at'))
             .values('day')
-            .annotate(pageviews=Count('id'))
+            .annotate(pageviews=pageview_count())
             .order_by('day')
         )
     }
@@ -262,47 +246,72 @@ def _build_time_series(visits_qs, pageviews_qs):
     ]
 
 
-def _build_google_ads_arrivals_series(arrivals_qs):
-    return [
-        {
-            'day': row['day'].isoformat(),
-            'arrivals': row['arrivals'],
-        }
-        for row in (
-            arrivals_qs.annotate(day=TruncDate('arrived_at'))
-            .values('day')
-            .annotate(arrivals=Count('id'))
-            .order_by('day')
-        )
-    ]
+def _sum_rows(rows, metric):
+    return sum(row[metric] for row in rows)
 
 
-def _conversion_totals(events_qs):
-    tracked_events = ['signup_started', 'signup_completed', 'add_to_cart', 'checkout_started', 'paid_order', 'order_item_paid']
-    rows = (
-        events_qs.filter(event_type__in=tracked_events)
-        .values('event_type')
-        .annotate(count=Count('id'))
-    )
-    data = {name: 0 for name in tracked_events}
+def _ratio(numerator, denominator, *, scale=1):
+    return round((numerator / denominator) * scale, 1) if denominator else 0
+
+
+def _rollup_breakdown(rows, dimension, *, metric='sessions', limit=8):
+    totals = defaultdict(int)
     for row in rows:
-        data[row['event_type']] = row['count']
-    return data
+        if row[dimension]:
+            totals[row[dimension]] += row[metric]
+    ranked = sorted(((label, count) for label, count in totals.items() if count), key=lambda item: (-item[1], item[0]))
+    return [{'label': label, 'count': count} for label, count in ranked[:limit]]
+
 
+def _rollup_time_series(rows):
+    per_day = defaultdict(lambda: {'sessions': 0, 'pageviews': 0, 'arrivals': 0})
+    for row in rows:
+        day = per_day[row['day']]
+        day['sessions'] += row['sessions']
+        day['pageviews'] += row['pageviews']
+        day['arrivals'] += row['google_ads_arrivals']
+    series = [
+        {'day': day.isoformat(), 'sessions': values['sessions'], 'pageviews': values['pageviews']}
+        for day, values in sorted(per_day.items())
+        if values['sessions'] or values['pageviews']
+    ]
+    arrivals = [
+        {'day': day.isoformat(), 'arrivals': values['arrivals']}
+        for day, values in sorted(per_day.items())
+        if values['arrivals']
+    ]
+    return series, arrivals
 
-def _build_funnel(visits_qs, pageviews_qs, events_qs):
-    sessions = visits_qs.count()
-    product_page_sessions = pageviews_qs.filter(path__startswith='/product/').values('session_key').distinct().count()
-    add_to_cart_sessions = events_qs.filter(event_type='add_to_cart').values('session_key').distinct().count()
-    checkout_sessions = events_qs.filter(event_type='checkout_started').values('session_key').distinct().count()
-    paid_sessions = events_qs.filter(event_type='paid_order').values('session_key').distinct().count()
 
+def _rollup_campaigns(rows, *, limit=8):
+    campaigns = defaultdict(lambda: {'sessions': 0, 'paid_orders': 0, 'paid_sessions': 0, 'revenue': Decimal('0')})
+    for row in rows:
+        if row['utm_campaign']:
+            campaign = campaigns[row['utm_campaign']]
+            campaign['sessions'] += row['sessions']
+            campaign['paid_orders'] += row['paid_order']
+            campaign['paid_sessions'] += row['paid_sessions']
+            campaign['revenue'] += Decimal(row['revenue'] or 0)
+    ranked = sorted(campaigns.items(), key=lambda item: (-item[1]['sessions'], item[0]))
+    return [
+        {
+            'label': label,
+            **values,
+            'conversion_rate': _ratio(values['paid_sessions'], values['sessions'], scale=100),
+            'revenue': str(values['revenue'].quantize(Decimal('0.01'))),
+        }
+        for label, values in ranked[:limit]
+        if values['sessions']
+    ]
+
+
+def _rollup_funnel(rows):
     steps = [
-        ('sessions', 'Sessions', sessions),
-        ('product_views', 'Product page visits', product_page_sessions),
-        ('add_to_cart', 'Add to cart', add_to_cart_sessions),
-        ('checkout_started', 'Checkout started', checkout_sessions),
-        ('paid_orders', 'Paid orders', paid_sessions),
+        ('sessions', 'Sessions', _sum_rows(rows, 'sessions')),
+        ('product_views', 'Product page visits', _sum_rows(rows, 'product_view_sessions')),
+        ('add_to_cart', 'Add to cart', _sum_rows(rows, 'add_to_cart_sessions')),
+        ('checkout_started', 'Checkout started', _sum_rows(rows, 'checkout_sessions')),
+        ('paid_orders', 'Paid orders', _sum_rows(rows, 'paid_sessions')),
     ]
     payload = []
     previous = None
@@ -313,147 +322,131 @@ def _build_funnel(visits_qs, pageviews_qs, events_qs):
     return payload
 
 
-def _decimal_from_value(value):
-    if value in (None, ''):
-        return Decimal('0')
-    try:
-        return Decimal(str(value))
-    except (InvalidOperation, TypeError, ValueError):
-        return Decimal('0')
+FILTER_VALUE_DIMENSIONS = {
+    'devices': 'device_type',
+    'browsers': 'browser_family',
+    'sources': 'traffic_source',
+    'campaigns': 'utm_campaign',
+}
+
+
+def _stored_filter_values():
+    return {
+        key: sorted(VisitDailyRollup.objects.exclude(**{dimension: ''}).values_list(dimension, flat=True).distinct())
+        for key, dimension in FILTER_VALUE_DIMENSIONS.items()
+    }
+
+
+def _available_filters(rows):
+    stored = response_cache.cached_filter_values(_stored_filter_values)
+    filters = {}
+    for key, dimension in FILTER_VALUE_DIMENSIONS.items():
+        merged = sorted(set(stored[key]) | {row[dimension] for row in rows if row[dimension]})
+        filters[key] = merged[:50] if key == 'campaigns' else merged
+    return filters
+
+
+PRODUCT_PERFORMANCE_EVENT_TYPES = ('add_to_cart', 'order_item_paid')
+
+
+def _product_performance_metrics():
+    # Events without a quantity count as one unit, as before.
+    units = Coalesce(NullIf(F('quantity'), 0), 1)
+    return {
+        'add_to_cart': Coalesce(Sum(units, filter=Q(event_type='add_to_cart')), 0),
+        'paid_quantity': Coalesce(Sum(units, filter=Q(event_type='order_item_paid')), 0),
+        'paid_revenue': Coalesce(
+            Sum('revenue', filter=Q(event_type='order_item_paid')),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    }
 
 
 def _build_product_performance(events_qs, *, limit=10):
-    product_rows = {}
-    category_rows = {}
-    for event_type, label, properties in events_qs.filter(event_type__in=['add_to_cart', 'order_item_paid']).values_list(
-        'event_type',
-        'label',
-        'properties',
-    ):
-        props = properties or {}
-        product_id = str(props.get('product_id') or '')
-        product_label = label or props.get('product_name') or f'Product {product_id}'
-        category_label = props.get('sub_category') or props.get('main_category') or 'Uncategorized'
-        quantity = int(_decimal_from_value(props.get('quantity') or 0 or 0))
-        revenue = _decimal_from_value(props.get('line_total'))
-
-        product_row = product_rows.setdefault(
-            product_id or product_label,
-            {
-                'product_id': product_id,
-                'label': product_label,
-                'add_to_cart': 0,
-                'paid_quantity': 0,
-                'paid_revenue': Decimal('0'),
-            },
+    """Product and category performance grouped in SQL over the typed product columns."""
+    events_qs = events_qs.filter(event_type__in=PRODUCT_PERFORMANCE_EVENT_TYPES).order_by()
+    ordering = ('-paid_revenue', '-paid_quantity', '-add_to_cart')
+    # Events without a product id are grouped by their label, not into one row.
+    product_rows = (
+        events_qs.annotate(
+            unlinked_label=Case(When(product_id__isnull=True, then='label'), default=Value('')),
         )
-        category_row = category_rows.setdefault(
-            category_label,
-            {
-                'label': category_label,
-                'add_to_cart': 0,
-                'paid_quantity': 0,
-                'paid_revenue': Decimal('0'),
-            },
+        .values('product_id', 'unlinked_label')
+        .annotate(label=Max('label'), **_product_performance_metrics())
+        .order_by(*ordering, 'product_id', 'unlinked_label')[:limit]
+    )
+    category_rows = (
+        events_qs.annotate(
+            category=Coalesce(NullIf('sub_category', Value('')), NullIf('main_category', Value('')), Value('Uncategorized')),
         )
+        .values('category')
+        .annotate(**_product_performance_metrics())
+        .order_by(*ordering, 'category')[:limit]
+    )
 
-        if event_type == 'add_to_cart':
-            add_qty = quantity or 1
-            product_row['add_to_cart'] += add_qty
-            category_row['add_to_cart'] += add_qty
-        else:
-            paid_qty = quantity or 1
-            product_row['paid_quantity'] += paid_qty
-            product_row['paid_revenue'] += revenue
-            category_row['paid_quantity'] += paid_qty
-            category_row['paid_revenue'] += revenue
-
-    product_payload = sorted(
-        product_rows.values(),
-        key=lambda row: (row['paid_revenue'], row['paid_quantity'], row['add_to_cart']),
-        reverse=True,
-    )[:limit]
-    category_payload = sorted(
-        category_rows.values(),
-        key=lambda row: (row['paid_revenue'], row['paid_quantity'], row['add_to_cart']),
-        reverse=True,
-    )[:limit]
-    for row in product_payload:
-        row['paid_revenue'] = str(row['paid_revenue'].quantize(Decimal('0.01')))
-    for row in category_payload:
-        row['paid_revenue'] = str(row['paid_revenue'].quantize(Decimal('0.01')))
+    product_payload = [
+        {
+            'product_id': str(row['product_id'] or ''),
+            'label': row['label'] or f"Product {row['product_id'] or ''}",
+            'add_to_cart': row['add_to_cart'],
+            'paid_quantity': row['paid_quantity'],
+            'paid_revenue': str(Decimal(row['paid_revenue']).quantize(Decimal('0.01'))),
+        }
+        for row in product_rows
+    ]
+    category_payload = [
+        {
+            'label': row['category'],
+            'add_to_cart': row['add_to_cart'],
+            'paid_quantity': row['paid_quantity'],
+            'paid_revenue': str(Decimal(row['paid_revenue']).quantize(Decimal('0.01'))),
+        }
+        for row in category_rows
+    ]
     return product_payload, category_payload
 
 
-def _summary_payload(visits_qs, pageviews_qs, events_qs, google_ads_arrivals_qs, window, filters):
-    sessions = visits_qs.count()
-    unique_visitors = _unique_visitor_count(visits_qs)
-    pageviews = pageviews_qs.count()
-    avg_session_seconds = _average_session_seconds(visits_qs)
-    avg_page_dwell_seconds = _average_page_dwell_seconds(pageviews_qs)
-    bounce_rate = _bounce_rate(visits_qs, window['start_dt'], window['end_dt'])
-    google_ads_arrivals = google_ads_arrivals_qs.count()
-    active_users = _apply_visit_filters(
-        Visit.objects.filter(last_seen_at__gte=timezone.now() - timedelta(minutes=5)),
-        filters,
-    ).count()
+def _summary_payload(visits_qs, events_qs, window, filters):
+    """
+    Dashboard payload. Counters come from daily rollups (stored for closed
+    days, computed from raw rows for today); unique visitors merge daily
+    sketches. Product performance and active users still read raw rows.
+    """
+    start_date, end_date = window['start_date'], window['end_date']
+    rows = load_rollup_rows(start_date, end_date, filters)
+    sessions = _sum_rows(rows, 'sessions')
+    unique_visitors, unique_visitors_estimated = _unique_visitors(visits_qs, start_date, end_date, filters)
+    pageviews = _sum_rows(rows, 'pageviews')
+    google_ads_arrivals = _sum_rows(rows, 'google_ads_arrivals')
+    if _has_dimension_filters(filters) or not presence.uses_shared_cache():
+        # Presence buckets only know device and section, and only span workers
+        # with a shared cache; otherwise recent visits are the source of truth.
+        active_users = _apply_visit_filters(
+            Visit.objects.filter(last_seen_at__gte=timezone.now() - timedelta(minutes=presence.WINDOW_MINUTES)),
+            filters,
+        ).count()
+    else:
+        active_users = presence.presence_summary()['active_users']
 
     comparison = {}
     if window['compare_enabled']:
+        previous_end_date = start_date - timedelta(days=1)
+        previous_start_date = previous_end_date - (end_date - start_date)
+        previous_rows = load_rollup_rows(previous_start_date, previous_end_date, filters)
         previous_visits = _apply_visit_filters(
             Visit.objects.filter(started_at__gte=window['previous_start_dt'], started_at__lt=window['previous_end_dt']),
             filters,
         )
-        previous_pageviews = _apply_pageview_filters(
-            VisitPageview.objects.filter(viewed_at__gte=window['previous_start_dt'], viewed_at__lt=window['previous_end_dt']),
-            filters,
-        )
+        previous_unique_visitors, _ = _unique_visitors(previous_visits, previous_start_date, previous_end_date, filters)
         comparison = {
-            'sessions': _comparison_payload(sessions, previous_visits.count()),
-            'unique_visitors': _comparison_payload(unique_visitors, _unique_visitor_count(previous_visits)),
-            'pageviews': _comparison_payload(pageviews, previous_pageviews.count()),
-            'google_ads_arrivals': _comparison_payload(
-                google_ads_arrivals,
-                _apply_google_ads_arrival_filters(
-                    GoogleAdsLandingArrival.objects.filter(
-                        arrived_at__gte=window['previous_start_dt'],
-                        arrived_at__lt=window['previous_end_dt'],
-                    ),
-                    filters,
-                ).count(),
-            ),
-            'paid_orders': _comparison_payload(
-                events_qs.filter(event_type='paid_order').count(),
-                _apply_event_filters(
-                    AnalyticsEvent.objects.filter(
-                        created_at__gte=window['previous_start_dt'],
-                        created_at__lt=window['previous_end_dt'],
-                        event_type='paid_order',
-                    ),
-                    filters,
-                ).count(),
-            ),
+            'sessions': _comparison_payload(sessions, _sum_rows(previous_rows, 'sessions')),
+            'unique_visitors': _comparison_payload(unique_visitors, previous_unique_visitors),
+            'pageviews': _comparison_payload(pageviews, _sum_rows(previous_rows, 'pageviews')),
+            'google_ads_arrivals': _comparison_payload(google_ads_arrivals, _sum_rows(previous_rows, 'google_ads_arrivals')),
+            'paid_orders': _comparison_payload(_sum_rows(rows, 'paid_order'), _sum_rows(previous_rows, 'paid_order')),
         }
 
-    campaigns = []
-    campaign_rows = (
-        visits_qs.exclude(utm_campaign='')
-        .values('utm_campaign')
-        .annotate(
-            sessions=Count('id'),
-            paid_orders=Count('events', filter=Q(events__event_type='paid_order'), distinct=True),
-        )
-        .order_by('-sessions', 'utm_campaign')[:8]
-    )
-    for row in campaign_rows:
-        campaigns.append(
-            {
-                'label': row['utm_campaign'],
-                'sessions': row['sessions'],
-                'paid_orders': row['paid_orders'],
-            }
-        )
-
     product_performance, category_performance = _build_product_performance(events_qs)
     annotations = [
         {
@@ -463,82 +456,164 @@ def _summary_payload(visits_qs, pageviews_qs, events_qs, google_ads_arrivals_qs,
             'color': row.color,
         }
         for row in AnalyticsAnnotation.objects.filter(
-            event_date__gte=window['start_date'],
-            event_date__lte=window['end_date'],
+            event_date__gte=start_date,
+            event_date__lte=end_date,
         )[:12]
     ]
+    per_day, google_ads_arrivals_per_day = _rollup_time_series(rows)
+    today = timezone.localdate()
+    ingestion_counts = dict.fromkeys((kind for kind, _ in IngestionCounter.KIND_CHOICES), 0)
+    for row in (
+        IngestionCounter.objects.filter(day__gte=start_date, day__lte=end_date)
+        .values('kind')
+        .annotate(total=Sum('count'))
+        .order_by()
+    ):
+        ingestion_counts[row['kind']] = row['total']
 
     return {
         'window': {
-            'start': _format_date(window['start_date']),
-            'end': _format_date(window['end_date']),
+            'start': _format_date(start_date),
+            'end': _format_date(end_date),
             'days': window['days'],
             'compare': window['compare_enabled'],
         },
         'filters': filters,
-        'available_filters': {
-            'devices': list(Visit.objects.exclude(device_type='').values_list('device_type', flat=True).distinct().order_by('device_type')),
-            'browsers': list(Visit.objects.exclude(browser_family='').values_list('browser_family', flat=True).distinct().order_by('browser_family')),
-            'sources': list(Visit.objects.exclude(traffic_source='').values_list('traffic_source', flat=True).distinct().order_by('traffic_source')),
-            'campaigns': list(Visit.objects.exclude(utm_campaign='').values_list('utm_campaign', flat=True).distinct().order_by('utm_campaign')[:50]),
-        },
+        'available_filters': _available_filters(rows),
         'totals': {
             'sessions': sessions,
-            'today_sessions': visits_qs.filter(started_at__date=timezone.localdate()).count(),
+            'today_sessions': sum(row['sessions'] for row in rows if row['day'] == today),
             'unique_visitors': unique_visitors,
+            'unique_visitors_estimated': unique_visitors_estimated,
             'pageviews': pageviews,
             'google_ads_arrivals': google_ads_arrivals,
-            'avg_session_seconds': avg_session_seconds,
-            'avg_page_dwell_seconds': avg_page_dwell_seconds,
-            'bounce_rate': bounce_rate,
+            'avg_session_seconds': _ratio(_sum_rows(rows, 'session_seconds'), sessions),
+            'avg_page_dwell_seconds': _ratio(_sum_rows(rows, 'dwell_seconds'), _sum_rows(rows, 'dwell_samples')),
+            'bounce_rate': _ratio(_sum_rows(rows, 'bounced_sessions'), sessions, scale=100),
             'active_users': active_users,
         },
         'comparison': comparison,
-        'per_day': _build_time_series(visits_qs, pageviews_qs),
-        'google_ads_arrivals_per_day': _build_google_ads_arrivals_series(google_ads_arrivals_qs),
-        'source_breakdown': _serialize_breakdown(visits_qs, 'traffic_source'),
-        'device_breakdown': _serialize_breakdown(visits_qs, 'device_type'),
-        'browser_breakdown': _serialize_breakdown(visits_qs, 'browser_family'),
-        'top_referrers': _serialize_breakdown(visits_qs, 'referrer_host', limit=10),
-        'campaigns': campaigns,
-        'conversion_totals': _conversion_totals(events_qs),
-        'funnel': _build_funnel(visits_qs, pageviews_qs, events_qs),
+        'per_day': per_day,
+        'google_ads_arrivals_per_day': google_ads_arrivals_per_day,
+        'source_breakdown': _rollup_breakdown(rows, 'traffic_source'),
+        'device_breakdown': _rollup_breakdown(rows, 'device_type'),
+        'browser_breakdown': _rollup_breakdown(rows, 'browser_family'),
+        'top_referrers': _rollup_breakdown(rows, 'referrer_host', limit=10),
+        'campaigns': _rollup_campaigns(rows),
+        'conversion_totals': {event_type: _sum_rows(rows, event_type) for event_type in CONVERSION_EVENT_TYPES},
+        'funnel': _rollup_funnel(rows),
         'product_performance': product_performance,
         'category_performance': category_performance,
         'annotations': annotations,
+        # Tracking records not stored: bot traffic and sampled-out pageviews.
+        'not_stored': ingestion_counts,
     }
 
 
+def _window_cache_params(window, filters, **extra):
+    return {
+        'start': _format_date(window['start_date']),
+        'end': _format_date(window['end_date']),
+        'compare': window['compare_enabled'],
+        'filters': filters,
+        **extra,
+    }
+
+
+def _window_cache_ttl(window):
+    """Long TTL only when every day of the window has a final rollup."""
+    if window['end_date'] < timezone.localdate():
+        if len(final_rollup_days(window['start_date'], window['end_date'])) == window['days']:
+            return response_cache.closed_ttl()
+    return response_cache.live_ttl()
+
+
+def _build_summary(window, filters):
+    visits_qs = _apply_visit_filters(
+        Visit.objects.filter(started_at__gte=window['start_dt'], started_at__lt=window['end_dt']),
+        filters,
+    )
+    events_qs = _apply_event_filters(
+        AnalyticsEvent.objects.filter(created_at__gte=window['start_dt'], created_at__lt=window['end_dt']),
+        filters,
+    )
+    return _summary_payload(visits_qs, events_qs, window, filters)
+
+
 @staff_member_required
 def visits_summary(request):
     try:
         window = _resolve_window(request, default_days=30)
         filters = _build_filters(request)
-
-        visits_qs = _apply_visit_filters(
-            Visit.objects.filter(started_at__gte=window['start_dt'], started_at__lt=window['end_dt']),
-            filters,
-        )
-        pageviews_qs = _apply_pageview_filters(
-            VisitPageview.objects.filter(viewed_at__gte=window['start_dt'], viewed_at__lt=window['end_dt']),
-            filters,
-        )
-        events_qs = _apply_event_filters(
-            AnalyticsEvent.objects.filter(created_at__gte=window['start_dt'], created_at__lt=window['end_dt']),
-            filters,
+        payload = response_cache.cached_response(
+            'summary',
+            _window_cache_params(window, filters),
+            lambda: _build_summary(window, filters),
+            ttl=_window_cache_ttl(window),
         )
-        google_ads_arrivals_qs = _apply_google_ads_arrival_filters(
-            GoogleAdsLandingArrival.objects.filter(
-                arrived_at__gte=window['start_dt'],
-                arrived_at__lt=window['end_dt'],
-            ),
-            filters,
-        )
-        return JsonResponse(_summary_payload(visits_qs, pageviews_qs, events_qs, google_ads_arrivals_qs, window, filters))
+        return JsonResponse(payload)
     except DatabaseError:
         return JsonResponse({'error': ANALYTICS_SCHEMA_ERROR}, status=503)
 
 
+def _page_daily_payload(path, window, filters):
+    sequence_qs = _apply_pageview_filters(
+        VisitPageview.objects.filter(viewed_at__gte=window['start_dt'], viewed_at__lt=window['end_dt']),
+        filters,
+    )
+    pageviews_qs = sequence_qs.filter(path=path)
+    visits_qs = _apply_visit_filters(
+        Visit.objects.filter(
+            started_at__gte=window['start_dt'],
+            started_at__lt=window['end_dt'],
+            pageviews__path=path,
+        ).distinct(),
+        filters,
+    )
+
+    # Sessions on a sampled path are scaled like its pageviews.
+    totals = pageviews_qs.aggregate(pageviews=pageview_count(), weight=Coalesce(Max('sample_weight'), 1))
+    per_day = _build_time_series(visits_qs, pageviews_qs, session_weight=totals['weight'])
+    if _has_dimension_filters(filters):
+        next_page_counter = next_page_counts(sequence_qs, path)
+    else:
+        # Closed days come from the transition table; open days are computed live.
+        final_days = final_rollup_days(window['start_date'], window['end_date'])
+        next_page_counter = stored_next_page_counts(path, final_days)
+        open_days = [
+            window['start_date'] + timedelta(days=offset)
+            for offset in range(window['days'])
+            if window['start_date'] + timedelta(days=offset) not in final_days
+        ]
+        if open_days:
+            open_start_dt, open_end_dt = window_bounds(open_days[0], open_days[-1])
+            live_qs = sequence_qs.filter(viewed_at__gte=open_start_dt, viewed_at__lt=open_end_dt)
+            if final_days:
+                live_qs = live_qs.exclude(viewed_at__date__in=final_days)
+            next_page_counter.update(next_page_counts(live_qs, path))
+
+    next_pages = [
+        {'label': page, 'count': count}
+        for page, count in sorted(next_page_counter.items(), key=lambda row: (-row[1], row[0]))[:10]
+    ]
+    top_referrers = _serialize_breakdown(pageviews_qs.exclude(referrer=''), 'referrer', limit=8, exclude_blank=False)
+
+    return {
+        'path': path,
+        'window': {
+            'start': _format_date(window['start_date']),
+            'end': _format_date(window['end_date']),
+            'days': window['days'],
+        },
+        'total_sessions': visits_qs.count() * totals['weight'],
+        'total_pageviews': totals['pageviews'],
+        'avg_dwell_seconds': _average_page_dwell_seconds(pageviews_qs),
+        'per_day': per_day,
+        'next_pages': next_pages,
+        'top_referrers': top_referrers,
+    }
+
+
 @staff_member_required
 def visits_page_daily(request):
     path = (request.GET.get('path') or '').strip()
@@ -547,63 +622,168 @@ def visits_page_daily(request):
     try:
         window = _resolve_window(request, default_days=30)
         filters = _build_filters(request)
-        pageviews_qs = _apply_pageview_filters(
-            VisitPageview.objects.filter(
-                viewed_at__gte=window['start_dt'],
-                viewed_at__lt=window['end_dt'],
-                path=path,
-            ),
-            filters,
-        )
-        visits_qs = _apply_visit_filters(
-            Visit.objects.filter(
-                started_at__gte=window['start_dt'],
-                started_at__lt=window['end_dt'],
-                pageviews__path=path,
-            ).distinct(),
-            filters,
-        )
-
-        per_day = _build_time_series(visits_qs, pageviews_qs)
-        next_page_counts = defaultdict(int)
-        visit_ids = list(pageviews_qs.values_list('visit_id', flat=True).distinct())
-        for visit_id in visit_ids:
-            sequence = list(
-                pageviews_qs.model.objects.filter(visit_id=visit_id, viewed_at__gte=window['start_dt'], viewed_at__lt=window['end_dt'])
-                .order_by('sequence_index', 'viewed_at')
-                .values_list('path', flat=True)
-            )
-            for index, current_path in enumerate(sequence[:-1]):
-                if current_path == path:
-                    next_page = sequence[index + 1]
-                    next_page_counts[next_page] += 1
-
-        next_pages = [
-            {'label': page, 'count': count}
-            for page, count in sorted(next_page_counts.items(), key=lambda row: (-row[1], row[0]))[:10]
-        ]
-        top_referrers = _serialize_breakdown(pageviews_qs.exclude(referrer=''), 'referrer', limit=8, exclude_blank=False)
-
-        return JsonResponse(
-            {
-                'path': path,
-                'window': {
-                    'start': _format_date(window['start_date']),
-                    'end': _format_date(window['end_date']),
-                    'days': window['days'],
-                },
-                'total_sessions': visits_qs.count(),
-                'total_pageviews': pageviews_qs.count(),
-                'avg_dwell_seconds': _average_page_dwell_seconds(pageviews_qs),
-                'per_day': per_day,
-                'next_pages': next_pages,
-                'top_referrers': top_referrers,
-            }
+        payload = response_cache.cached_response(
+            'page_daily',
+            _window_cache_params(window, filters, path=path),
+            lambda: _page_daily_payload(path, window, filters),
+            ttl=_window_cache_ttl(window),
         )
+        return JsonResponse(payload)
     except DatabaseError:
         return JsonResponse({'error': ANALYTICS_SCHEMA_ERROR}, status=503)
 
 
+PAGES_SUMMARY_ORDERING = {
+    'path': ('path',),
+    'sessions': ('-sessions', 'path'),
+    # Paths without any timed pageview have no average; they rank last.
+    'avg_dwell': (F('avg_dwell_seconds').desc(nulls_last=True), 'path'),
+    'pageviews': ('-pageviews', 'path'),
+}
+
+
+def _has_dimension_filters(filters):
+    return any(filters[name] for name in ('device', 'browser', 'source', 'campaign')) or filters['user_scope'] != 'all'
+
+
+def _path_search_filter(search):
+    # Paths typed with a leading slash use an index-backed prefix match.
+    if search.startswith('/'):
+        return Q(path__startswith=search)
+    return Q(path__icontains=search)
+
+
+def _raw_path_rows(pageviews_qs):
+    return pageviews_qs.values('path').annotate(
+        pageviews=pageview_count(),
+        sessions=path_session_count(),
+        dwell_seconds=Coalesce(Sum('duration_seconds'), 0),
+        dwell_samples=Count('duration_seconds'),
+        avg_dwell_seconds=Avg('duration_seconds'),
+    )
+
+
+def _stored_path_rows(stats_qs):
+    return stats_qs.values('path').annotate(
+        pageviews=Sum('pageviews'),
+        sessions=Sum('sessions'),
+        dwell_seconds=Sum('dwell_seconds'),
+        dwell_samples=Sum('dwell_samples'),
+        avg_dwell_seconds=ExpressionWrapper(
+            F('dwell_seconds') * 1.0 / NullIf(F('dwell_samples'), 0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def _ordering_sort_key(ordering):
+    """Python sort key matching a ``PAGES_SUMMARY_ORDERING`` entry."""
+
+    def sort_key(row):
+        key = []
+        for field in ordering:
+            if isinstance(field, OrderBy):
+                value = row[field.expression.name]
+                key.append((value is None, -value if value is not None and field.descending else value or 0))
+            elif field.startswith('-'):
+                key.append((row[field[1:]] or 0) * -1)
+            else:
+                key.append(row[field])
+        return tuple(key)
+
+    return sort_key
+
+
+def _merged_path_page(stored_rows, live_rows, ordering, offset, limit):
+    """
+    Merge stored (closed-day) and live (open-day) path rows and return one
+    page plus the distinct path count. Only the stored top ``offset + limit``
+    rows and the stored rows of paths seen live can reach the page, so the
+    stored side is never read in full.
+    """
+    live = {row['path']: row for row in live_rows}
+    candidates = {row['path']: dict(row) for row in stored_rows.order_by(*ordering)[: offset + limit]}
+    stored_live_paths = set()
+    for row in stored_rows.filter(path__in=list(live)):
+        stored_live_paths.add(row['path'])
+        candidates.setdefault(row['path'], dict(row))
+    for path, row in live.items():
+        merged = candidates.setdefault(path, {'path': path, 'pageviews': 0, 'sessions': 0, 'dwell_seconds': 0, 'dwell_samples': 0})
+        for metric in ('pageviews', 'sessions', 'dwell_seconds', 'dwell_samples'):
+            merged[metric] += row[metric] or 0
+    for row in candidates.values():
+        row['avg_dwell_seconds'] = row['dwell_seconds'] / row['dwell_samples'] if row['dwell_samples'] else None
+
+    rows = sorted(candidates.values(), key=_ordering_sort_key(ordering))
+    total = stored_rows.count() + len(set(live) - stored_live_paths)
+    return rows[offset:offset + limit], total
+
+
+def _pages_summary_page(window, filters, search, sort, page_number, per_page):
+    ordering = PAGES_SUMMARY_ORDERING.get(sort, PAGES_SUMMARY_ORDERING['pageviews'])
+    pageviews_qs = _apply_pageview_filters(
+        VisitPageview.objects.filter(viewed_at__gte=window['start_dt'], viewed_at__lt=window['end_dt']),
+        filters,
+    )
+    if search:
+        pageviews_qs = pageviews_qs.filter(_path_search_filter(search))
+
+    final_days = set() if _has_dimension_filters(filters) else final_rollup_days(window['start_date'], window['end_date'])
+    if not final_days:
+        paginator = Paginator(_raw_path_rows(pageviews_qs).order_by(*ordering), per_page)
+        try:
+            page_obj = paginator.page(page_number)
+        except EmptyPage:
+            page_obj = paginator.page(paginator.num_pages or 1)
+        return list(page_obj.object_list), page_obj.number, paginator.num_pages, paginator.count
+
+    stats_qs = PathDailyStats.objects.filter(day__in=final_days)
+    if search:
+        stats_qs = stats_qs.filter(_path_search_filter(search))
+    stored_rows = _stored_path_rows(stats_qs)
+
+    if len(final_days) == window['days']:
+        total = stored_rows.count()
+        num_pages = max(1, -(-total // per_page))
+        page_number = min(page_number, num_pages)
+        offset = (page_number - 1) * per_page
+        return list(stored_rows.order_by(*ordering)[offset:offset + per_page]), page_number, num_pages, total
+
+    live_rows = list(_raw_path_rows(pageviews_qs.exclude(viewed_at__date__in=final_days)))
+    rows, total = _merged_path_page(stored_rows, live_rows, ordering, (page_number - 1) * per_page, per_page)
+    num_pages = max(1, -(-total // per_page))
+    if page_number > num_pages:
+        page_number = num_pages
+        rows, total = _merged_path_page(stored_rows, live_rows, ordering, (page_number - 1) * per_page, per_page)
+    return rows, page_number, num_pages, total
+
+
+def _pages_summary_payload(window, filters, search, sort, page_number, per_page):
+    rows, page_number, num_pages, total_rows = _pages_summary_page(window, filters, search, sort, page_number, per_page)
+    results = [
+        {
+            'path': row['path'] or '',
+            'pageviews': row['pageviews'],
+            'sessions': row['sessions'],
+            'avg_dwell_seconds': round(float(row['avg_dwell_seconds'] or 0), 1),
+        }
+        for row in rows
+    ]
+    return {
+        'window': {
+            'start': _format_date(window['start_date']),
+            'end': _format_date(window['end_date']),
+            'days': window['days'],
+        },
+        'search': search,
+        'sort': sort,
+        'page': page_number,
+        'pages': num_pages,
+        'total_rows': total_rows,
+        'results': results,
+    }
+
+
 @staff_member_required
 def visits_pages_summary(request):
     try:
@@ -613,60 +793,87 @@ def visits_pages_summary(request):
         sort = (request.GET.get('sort') or 'pageviews').strip()
         page_number = _parse_days(request.GET.get('page'), default=1)
         per_page = min(100, _parse_days(request.GET.get('per_page'), default=12))
-
-        pageviews_qs = _apply_pageview_filters(
-            VisitPageview.objects.filter(viewed_at__gte=window['start_dt'], viewed_at__lt=window['end_dt']),
-            filters,
+        payload = response_cache.cached_response(
+            'pages_summary',
+            _window_cache_params(window, filters, q=search, sort=sort, page=page_number, per_page=per_page),
+            lambda: _pages_summary_payload(window, filters, search, sort, page_number, per_page),
+            ttl=_window_cache_ttl(window),
         )
-        if search:
-            pageviews_qs = pageviews_qs.filter(path__icontains=search)
-
-        rows = list(
-            pageviews_qs.values('path')
-            .annotate(
-                pageviews=Count('id'),
-                sessions=Count('visit', distinct=True),
-                avg_dwell_seconds=Avg('duration_seconds'),
-            )
+        return JsonResponse(payload)
+    except DatabaseError:
+        return JsonResponse({'error': ANALYTICS_SCHEMA_ERROR}, status=503)
+
+
+@staff_member_required
+def visits_active(request):
+    """Real-time presence for the dashboard's "active now" card; cheap enough to poll."""
+    try:
+        return JsonResponse(presence.presence_summary())
+    except DatabaseError:
+        return JsonResponse({'error': ANALYTICS_SCHEMA_ERROR}, status=503)
+
+
+@staff_member_required
+def visits_campaigns(request):
+    """Campaign arrivals, sessions, attributed orders and revenue from the daily campaign counters."""
+    try:
+        window = _resolve_window(request, default_days=30)
+        campaign = (request.GET.get('campaign') or '').strip()
+        rows = response_cache.cached_response(
+            'campaigns',
+            _window_cache_params(window, {'campaign': campaign}),
+            lambda: attribution.campaign_report(window['start_date'], window['end_date'], campaign=campaign),
+            # Orders land on the day they are paid, so even closed windows move until backfills finish.
+            ttl=response_cache.live_ttl(),
         )
-        for row in rows:
-            row['path'] = row['path'] or ''
-            row['avg_dwell_seconds'] = round(float(row['avg_dwell_seconds'] or 0), 1)
-
-        reverse_sort = sort != 'path'
-        sort_key_map = {
-            'path': lambda row: row['path'],
-            'sessions': lambda row: row['sessions'],
-            'avg_dwell': lambda row: row['avg_dwell_seconds'],
-            'pageviews': lambda row: row['pageviews'],
-        }
-        rows.sort(key=sort_key_map.get(sort, sort_key_map['pageviews']), reverse=reverse_sort)
+        return JsonResponse({
+            'window': {'start': _format_date(window['start_date']), 'end': _format_date(window['end_date'])},
+            'attribution_window_days': attribution.ATTRIBUTION_WINDOW_DAYS,
+            'campaigns': rows,
+        })
+    except DatabaseError:
+        return JsonResponse({'error': ANALYTICS_SCHEMA_ERROR}, status=503)
 
-        paginator = Paginator(rows, per_page)
-        try:
-            page_obj = paginator.page(page_number)
-        except EmptyPage:
-            page_obj = paginator.page(paginator.num_pages or 1)
 
-        return JsonResponse(
-            {
-                'window': {
-                    'start': _format_date(window['start_date']),
-                    'end': _format_date(window['end_date']),
-                    'days': window['days'],
-                },
-                'search': search,
-                'sort': sort,
-                'page': page_obj.number,
-                'pages': paginator.num_pages,
-                'total_rows': paginator.count,
-                'results': list(page_obj.object_list),
-            }
+@staff_member_required
+def visits_cohorts(request):
+    """Weekly acquisition cohorts of paying customers, read from the maintained retention matrix."""
+    try:
+        weeks = max(1, min(_parse_days(request.GET.get('weeks'), default=12), 52))
+        payload = response_cache.cached_response(
+            'cohorts',
+            {'weeks': weeks, 'today': timezone.localdate().isoformat()},
+            lambda: cohorts.retention_matrix(weeks=weeks),
+            ttl=response_cache.live_ttl(),
         )
+        return JsonResponse(payload)
     except DatabaseError:
         return JsonResponse({'error': ANALYTICS_SCHEMA_ERROR}, status=503)
 
 
+@staff_member_required
+def visits_export(request):
+    """Stream raw visits, pageviews or events for the dashboard window and filters."""
+    dataset = (request.GET.get('dataset') or 'visits').strip()
+    fmt = (request.GET.get('format') or 'csv').strip()
+    if dataset not in exports.EXPORT_DATASETS or fmt not in exports.EXPORT_FORMATS:
+        return JsonResponse(
+            {'error': f'dataset must be one of {", ".join(exports.EXPORT_DATASETS)} and format one of {", ".join(exports.EXPORT_FORMATS)}.'},
+            status=400,
+        )
+    compress = _parse_bool(request.GET.get('gzip'))
+    window = _resolve_window(request, default_days=30)
+    qs = exports.export_queryset(dataset, window['start_date'], window['end_date'], _build_filters(request))
+    response = StreamingHttpResponse(
+        exports.stream_export(qs, fmt, compress=compress),
+        content_type=exports.content_type(fmt, compress=compress),
+    )
+    filename = exports.export_filename(dataset, window['start_date'], window['end_date'], fmt, compress=compress)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 @staff_member_required
 def visits_dashboard(request):
     analytics_boot_error = ''
@@ -682,14 +889,31 @@ def visits_dashboard(request):
     except DatabaseError:
         saved_views = []
         analytics_boot_error = ANALYTICS_SCHEMA_ERROR
+    window = _resolve_window(request, default_days=30)
+    if not analytics_boot_error:
+        # Start the default summary while the page shell renders so its first fetch is warm.
+        filters = _build_filters(request)
+        try:
+            response_cache.warm(
+                'summary',
+                _window_cache_params(window, filters),
+                lambda: _build_summary(window, filters),
+                ttl=_window_cache_ttl(window),
+            )
+        except DatabaseError:
+            pass
     return render(
         request,
         '_analytics/visits_dashboard.html',
         {
-            'default_days': _resolve_window(request, default_days=30)['days'],
+            'default_days': window['days'],
             'visits_summary_url': reverse('visits_summary'),
             'visits_pages_summary_url': reverse('visits_pages_summary'),
             'visits_page_daily_url': reverse('visits_page_daily'),
+            'visits_active_url': reverse('visits_active'),
+            'visits_export_url': reverse('visits_export'),
+            'visits_cohorts_url': reverse('visits_cohorts'),
+            'visits_campaigns_url': reverse('visits_campaigns'),
             'saved_views': saved_views,
             'analytics_boot_error': analytics_boot_error,
         },
@@ -1,9 +1,35 @@
+from decimal import Decimal
+
 from django.contrib import admin
 from django.db.models import Q
 from .models import All_Products, Product_Labels_For_Searchbar, All_ProductsMissingRSP, HomeCategoryTile, HomeValuePillar
 from django.utils.html import format_html
 
-   
+
+class PriceRangeFilter(admin.SimpleListFilter):
+    """Fixed price bands; a plain 'price' filter lists every distinct price in the catalogue."""
+
+    title = 'price'
+    parameter_name = 'price_range'
+    BANDS = (
+        ('0-1', 'Under £1', Decimal('0'), Decimal('1')),
+        ('1-5', '£1 to £5', Decimal('1'), Decimal('5')),
+        ('5-10', '£5 to £10', Decimal('5'), Decimal('10')),
+        ('10-25', '£10 to £25', Decimal('10'), Decimal('25')),
+        ('25-', '£25 and over', Decimal('25'), None),
+    )
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, label, _, _ in self.BANDS]
+
+    def queryset(self, request, queryset):
+        for key, _, low, high in self.BANDS:
+            if self.value() == key:
+                queryset = queryset.filter(price__gte=low)
+                return queryset.filter(price__lt=high) if high is not None else queryset
+        return queryset
+
+
 @admin.register(All_Products)
 class All_ProductsAdmin(admin.ModelAdmin):
     list_display = ('name', 
@@ -16,9 +42,11 @@ class All_ProductsAdmin(admin.ModelAdmin):
                     'sub_category', 
                     'sub_subcategory',)
     
-    list_filter = ('name', 'price', 'sub_category')
+    # Product names are unique-ish, so they are found through search rather than a sidebar filter.
+    list_filter = (PriceRangeFilter, 'sub_category')
     search_fields = ('name', 'sku')
     ordering = ('name',)
+    show_full_result_count = False
 
     @admin.display(description='Image')
     def image_link(self, obj):
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_catalog', '0018_alter_homevaluepillar_subtitle'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='all_products',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='all_products',
+            name='sub_category',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
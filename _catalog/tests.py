@@ -262,3 +262,21 @@ class HomeCategoryFavoritesTests(TestCase):
         self.assertEqual(resp.context['cart_items'][0]['unit_price'], expected_unit_price)
         self.assertEqual(resp.context['total_price'], expected_unit_price * 2)
 
+
+class ProductAdminFilterTests(TestCase):
+    def test_price_range_filter(self):
+        for index, price in enumerate(('0.50', '3.00', '30.00')):
+            All_Products.objects.create(
+                ga_product_id=f'price-{index}',
+                name=f'Item {price}',
+                price=price,
+                list_position=index,
+                url='http://example.com/item',
+            )
+        admin_user = get_user_model().objects.create_superuser(
+            username='catalogadmin', email='catalogadmin@example.com', password='x',
+        )
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:_catalog_all_products_changelist'), {'price_range': '1-5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product.name for product in response.context['cl'].result_list], ['Item 3.00'])
@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 from django.db.models import Count
 from django.template.response import TemplateResponse
 from django.urls import path
+from _product_management.models import PaidOrdersVersion
+
 from .models import Order, OrderItem
 
 class OrderItemInline(admin.TabularInline):
@@ -51,6 +54,8 @@ class OrderAdmin(admin.ModelAdmin):
 
     def mark_as_delivered(self, request, queryset):
         updated = queryset.update(status='delivered')
+        if updated:
+            transaction.on_commit(PaidOrdersVersion.bump)
         self.message_user(request, f"{updated} orders marked as delivered.")
     mark_as_delivered.short_description = "Mark selected orders as delivered"
 
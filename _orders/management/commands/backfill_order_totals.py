@@ -1,22 +1,68 @@
-from django.core.management.base import BaseCommand
-from django.db.models import F, Sum, DecimalField, ExpressionWrapper
-from _orders.models import Order
-
-
-class Command(BaseCommand):
-    help = 'Recalculate and backfill Order.total from OrderItem price x quantity.'
-
-    def handle(self, *args, **options):
-        amount_expr = ExpressionWrapper(
-            F('items__price') * F('items__quantity'),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        )
-        updated = 0
-        for order in Order.objects.all().iterator():
-            total = order.items.aggregate(t=Sum(amount_expr)).get('t') or 0
-            if order.total != total:
-                order.total = total
-                order.save(update_fields=['total'])
-                updated += 1
-        self.stdout.write(self.style.SUCCESS(f'Updated totals for {updated} order(s).'))
+from datetime import datetime, time as dt_time
+from decimal import Decimal
 
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from GROCERY.batching import PkBatchCommand
+from _orders.models import Order, OrderItem
+
+
+def _items_total_expression():
+    dec = DecimalField(max_digits=12, decimal_places=2)
+    item_totals = (
+        OrderItem.objects
+        .filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+        .annotate(t=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=dec)))
+        .values('t')
+    )
+    return Coalesce(Subquery(item_totals, output_field=dec), Value(Decimal('0.00'), output_field=dec))
+
+
+class Command(PkBatchCommand):
+    help = (
+        'Recalculate and backfill Order.total from OrderItem price x quantity. '
+        'Runs one set-based UPDATE per batch of orders instead of saving orders one by one.'
+    )
+    default_batch_size = 5000
+    batch_size_flags = ('--chunk-size', '--batch-size')
+    batch_size_help = 'Orders handled per UPDATE'
+    dry_run_help = 'Only count orders whose total is out of date'
+    empty_message = 'No orders to backfill.'
+    progress_verb = 'stale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default='', help='Only orders created on/after this date (YYYY-MM-DD)')
+        super().add_arguments(parser)
+
+    def validate(self, opts):
+        self.since_dt = None
+        if opts['since']:
+            try:
+                since = datetime.strptime(opts['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format.')
+            self.since_dt = timezone.make_aware(datetime.combine(since, dt_time.min))
+        self.total_expr = _items_total_expression()
+
+    def get_queryset(self, opts):
+        orders = Order.objects.all()
+        if self.since_dt:
+            orders = orders.filter(created_at__gte=self.since_dt)
+        return orders
+
+    def count_batch(self, batch, opts):
+        return batch.exclude(total=self.total_expr).count()
+
+    def update_batch(self, batch, opts):
+        with transaction.atomic():
+            return batch.exclude(total=self.total_expr).update(total=self.total_expr)
+
+    def finish(self, changed, opts):
+        verb = 'Would update' if opts['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} totals for {changed} order(s).'))
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_orders', '0002_order_referral_discounts'),
+        ('_suppliers', '0002_purchaseorder_purchaseorderline_supplierproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='purchase_order',
+            field=models.ForeignKey(blank=True, help_text='Supplier purchase order that covered this item.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='_suppliers.purchaseorder'),
+        ),
+    ]
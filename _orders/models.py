@@ -45,6 +45,14 @@ class OrderItem(models.Model):
         default=False,
         help_text="Mark if we've already ordered this item from suppliers."
     )
+    purchase_order = models.ForeignKey(
+        '_suppliers.PurchaseOrder',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='order_items',
+        help_text="Supplier purchase order that covered this item.",
+    )
 
     def __str__(self):
         return f"Order #{self.order_id} | {self.product.name} x {self.quantity}"
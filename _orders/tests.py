@@ -1,13 +1,15 @@
 from decimal import Decimal
+from io import StringIO
 from types import SimpleNamespace
 from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 
 from _catalog.models import All_Products
-from _orders.models import Order
+from _orders.models import Order, OrderItem
 from _orders.pricing import calculate_checkout_totals
 from _orders.notifications import send_paid_order_notification
 from _product_management.templatetags.sum_tags import add_delivery_if_paid, checkout_grand_total, paid_order_grand_total
@@ -151,3 +153,41 @@ class DeliverySlotsPricingTests(TestCase):
         self.assertEqual(order.total, Decimal('40.24'))
         self.assertEqual(order.items.count(), 1)
         self.assertEqual(order.items.first().price, Decimal('20.12'))
+
+
+class BackfillOrderTotalsCommandTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='backfill-user',
+            password='test-pass-123',
+        )
+        self.product = All_Products.objects.create(
+            ga_product_id='ga-backfill-1',
+            name='Backfill Product',
+            price=Decimal('2.00'),
+            list_position=1,
+            url='https://example.com/products/backfill-product',
+        )
+        self.orders = []
+        for quantity in (1, 2, 3):
+            order = Order.objects.create(user=self.user, status='paid')
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=Decimal('2.50'))
+            self.orders.append(order)
+        # Simulate a pricing incident: stored totals drift from the items.
+        Order.objects.filter(pk__in=[self.orders[0].pk, self.orders[2].pk]).update(total=Decimal('99.00'))
+
+    def test_dry_run_reports_without_writing(self):
+        out = StringIO()
+        call_command('backfill_order_totals', '--dry-run', stdout=out)
+
+        self.assertIn('Would update totals for 2 order(s).', out.getvalue())
+        self.orders[0].refresh_from_db()
+        self.assertEqual(self.orders[0].total, Decimal('99.00'))
+
+    def test_backfill_updates_only_stale_orders_across_chunks(self):
+        out = StringIO()
+        call_command('backfill_order_totals', '--chunk-size', '1', stdout=out)
+
+        self.assertIn('Updated totals for 2 order(s).', out.getvalue())
+        totals = [Order.objects.get(pk=order.pk).total for order in self.orders]
+        self.assertEqual(totals, [Decimal('2.50'), Decimal('5.00'), Decimal('7.50')])
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Payment
+from .models import Payment, StripeWebhookEvent
 
 
 @admin.register(Payment)
@@ -8,3 +8,11 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'order', 'amount', 'currency', 'status', 'created_at')
     list_filter = ('status', 'currency', 'created_at')
     search_fields = ('id', 'user__username', 'user__email', 'order__id', 'stripe_payment_intent_id')
+
+
+@admin.register(StripeWebhookEvent)
+class StripeWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'stripe_event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('stripe_event_id',)
+    readonly_fields = ('stripe_event_id', 'event_type', 'payload', 'attempts', 'last_error', 'received_at', 'processed_at')
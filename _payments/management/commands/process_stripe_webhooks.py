@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from _payments.webhooks import MAX_WEBHOOK_ATTEMPTS, process_pending_webhook_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Process stored Stripe webhook events that are pending or failed. "
+        "Use --loop to keep running as a worker; the Procfile's worker process "
+        "runs it that way so events are retried even when no new webhook arrives."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='Max events per batch')
+        parser.add_argument('--max-attempts', type=int, default=MAX_WEBHOOK_ATTEMPTS, help='Skip events that already failed this many times')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds between polls when looping')
+
+    def handle(self, *args, **opts):
+        while True:
+            processed = process_pending_webhook_events(
+                limit=opts['limit'],
+                max_attempts=opts['max_attempts'],
+            )
+            if processed or opts['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} webhook event(s).'))
+            if not opts['loop']:
+                break
+            time.sleep(max(0.1, opts['sleep']))
@@ -1,14 +1,24 @@
+import json
+from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import patch
 
+import stripe
 from django.contrib.auth import get_user_model
 from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from _accounts.models import ReferralCreditLedger
 from _catalog.models import All_Products
 from _orders.models import Order, OrderItem
-from _payments.models import Payment
+from _payments.models import Payment, StripeWebhookEvent
+from _payments.webhooks import (
+    _run_webhook_event,
+    process_pending_webhook_events,
+    process_webhook_event,
+    record_webhook_event,
+)
 
 
 @override_settings(
@@ -242,3 +252,98 @@ class ReferralCheckoutTests(TestCase):
         self.order.refresh_from_db()
         self.assertEqual(self.order.referral_credit_discount, Decimal('3.00'))
         self.assertEqual(response.context['grand_total'], Decimal('3.50'))
+
+
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='webhook-user',
+            password='test-pass-123',
+            email='webhook@example.com',
+        )
+        self.order = Order.objects.create(user=self.user, total=Decimal('10.00'), status='pending')
+        self.payment = Payment.objects.create(
+            user=self.user,
+            order=self.order,
+            amount=Decimal('11.50'),
+            currency='gbp',
+            status='created',
+        )
+        self.event = {
+            'id': 'evt_test_1',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {'metadata': {'payment_id': str(self.payment.id)}}},
+        }
+
+    def _post_event(self, event):
+        verified = stripe.Event.construct_from(event, 'sk_test')
+        with patch('_payments.views.stripe.Webhook.construct_event', return_value=verified):
+            return self.client.post(
+                reverse('stripe_webhook'),
+                data=json.dumps(event),
+                content_type='application/json',
+                HTTP_STRIPE_SIGNATURE='sig',
+            )
+
+    @patch('_payments.views.dispatch_webhook_event')
+    def test_webhook_stores_event_once_and_acks(self, dispatch_mock):
+        first = self._post_event(self.event)
+        second = self._post_event(self.event)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        stored = StripeWebhookEvent.objects.get(stripe_event_id='evt_test_1')
+        self.assertEqual(stored.event_type, 'payment_intent.succeeded')
+        self.assertEqual(stored.payload['data']['object']['metadata'], {'payment_id': str(self.payment.id)})
+        dispatch_mock.assert_called_once()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    @patch('_payments.webhooks.send_paid_order_notification')
+    def test_processing_marks_order_paid_and_notifies_once(self, notification_mock):
+        stored, _ = record_webhook_event(self.event)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(process_webhook_event(stored.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(process_webhook_event(stored.pk))
+
+        self.order.refresh_from_db()
+        self.payment.refresh_from_db()
+        stored.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(self.payment.status, 'succeeded')
+        self.assertEqual(stored.status, 'processed')
+        self.assertEqual(stored.attempts, 1)
+        notification_mock.assert_called_once()
+
+    @patch('_payments.webhooks.send_paid_order_notification')
+    def test_processing_skips_notification_when_order_already_paid(self, notification_mock):
+        self.order.status = 'paid'
+        self.order.save(update_fields=['status'])
+        stored, _ = record_webhook_event(self.event)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending_webhook_events()
+
+        stored.refresh_from_db()
+        self.assertEqual(stored.status, 'processed')
+        notification_mock.assert_not_called()
+
+    @patch('_payments.webhooks.send_paid_order_notification')
+    def test_next_webhook_retries_events_whose_thread_died(self, notification_mock):
+        stale, _ = record_webhook_event(self.event)
+        StripeWebhookEvent.objects.filter(pk=stale.pk).update(received_at=timezone.now() - timedelta(hours=1))
+        fresh_failure, _ = record_webhook_event({'id': 'evt_test_2', 'type': 'payment_intent.succeeded', 'data': {}})
+        StripeWebhookEvent.objects.filter(pk=fresh_failure.pk).update(status='failed', attempts=1)
+        later, _ = record_webhook_event({'id': 'evt_test_3', 'type': 'charge.refunded'})
+
+        with patch('_payments.webhooks.connection'), self.captureOnCommitCallbacks(execute=True):
+            _run_webhook_event(later.pk)
+
+        self.assertEqual(
+            dict(StripeWebhookEvent.objects.values_list('stripe_event_id', 'status')),
+            {'evt_test_1': 'processed', 'evt_test_2': 'failed', 'evt_test_3': 'processed'},
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
@@ -8,13 +8,12 @@ from django.contrib import messages
 from django.http import HttpResponse
 from django.urls import reverse
 from decimal import Decimal, ROUND_HALF_UP
-from _analytics.tracking import track_event
+from _analytics.tracking import track_event, track_events_bulk
 from _accounts.referrals import (
     ReferralError,
     attach_referral_code,
     build_referral_discounts,
     can_attach_referral_code,
-    finalize_referral_rewards,
 )
 from _catalog.models import All_Products
 from _orders.models import Order, OrderItem
@@ -25,6 +24,7 @@ from _orders.pricing import (
     resolve_customer_unit_price,
 )
 from .models import Payment
+from .webhooks import dispatch_webhook_event, mark_order_paid, record_webhook_event
 
 logger = logging.getLogger(__name__)
 
@@ -243,41 +243,39 @@ def payment_success_view(request):
         return redirect('order_history')
 
     order = payment.order
-    if order and order.status == 'pending':
-        order.status = 'paid'
-        order.save()
-        finalize_referral_rewards(order)
-        track_event(
-            request,
-            'paid_order',
-            value=payment.amount,
-            properties={
-                'order_id': order.id,
-                'payment_id': payment.id,
-                'currency': payment.currency,
-                'subtotal': str(order.total),
-                'newcomer_referral_discount': str(order.newcomer_referral_discount),
-                'referral_credit_discount': str(order.referral_credit_discount),
-            },
-            path=reverse('payment_success'),
-        )
-        for item in order.items.select_related('product'):
-            track_event(
-                request,
-                'order_item_paid',
-                label=item.product.name,
-                value=item.quantity,
-                properties={
+    if order and mark_order_paid(order):
+        paid_events = [
+            {
+                'event_type': 'paid_order',
+                'value': payment.amount,
+                'properties': {
                     'order_id': order.id,
-                    'product_id': item.product_id,
-                    'quantity': item.quantity,
-                    'line_total': str(item.price * item.quantity),
-                    'main_category': item.product.main_category,
-                    'sub_category': item.product.sub_category,
-                    'sub_subcategory': item.product.sub_subcategory,
+                    'payment_id': payment.id,
+                    'currency': payment.currency,
+                    'subtotal': str(order.total),
+                    'newcomer_referral_discount': str(order.newcomer_referral_discount),
+                    'referral_credit_discount': str(order.referral_credit_discount),
                 },
-                path=reverse('payment_success'),
+            }
+        ]
+        for item in order.items.select_related('product'):
+            paid_events.append(
+                {
+                    'event_type': 'order_item_paid',
+                    'label': item.product.name,
+                    'value': item.quantity,
+                    'properties': {
+                        'order_id': order.id,
+                        'product_id': item.product_id,
+                        'quantity': item.quantity,
+                        'line_total': str(item.price * item.quantity),
+                        'main_category': item.product.main_category,
+                        'sub_category': item.product.sub_category,
+                        'sub_subcategory': item.product.sub_subcategory,
+                    },
+                }
             )
+        track_events_bulk(request, paid_events, path=reverse('payment_success'))
         send_paid_order_notification(order)
         messages.success(request, f"Order #{order.id} is now paid.")
         if 'cart' in request.session:
@@ -300,29 +298,14 @@ def stripe_webhook_view(request):
         event = stripe.Webhook.construct_event(
             payload, sig_header, endpoint_secret
         )
-    except stripe.error.SignatureVerificationError:
+    except (ValueError, stripe.error.SignatureVerificationError):
         return HttpResponse(status=400)
 
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        payment_id = payment_intent['metadata'].get('payment_id')
-
-        if payment_id:
-            try:
-                payment = Payment.objects.get(id=payment_id)
-                payment.status = 'succeeded'
-                payment.save()
-
-                order = payment.order  
-                if order and order.status == 'pending':
-                    order.status = 'paid'
-                    order.save()
-                    finalize_referral_rewards(order)
-                if order and order.status == 'paid':
-                    send_paid_order_notification(order)
-
-            except Payment.DoesNotExist:
-                pass
+    # Acknowledge immediately; the order/payment work happens in the background
+    # and Stripe retries of an already stored event id are ignored. The
+    # verified event is a dict subclass, so it is stored as is.
+    stored_event, created = record_webhook_event(event)
+    if stored_event is not None and created:
+        dispatch_webhook_event(stored_event.pk)
 
     return HttpResponse(status=200)
-
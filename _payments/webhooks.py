@@ -0,0 +1,149 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from _accounts.referrals import finalize_referral_rewards
+from _orders.models import Order
+from _orders.notifications import send_paid_order_notification
+
+from .models import Payment, StripeWebhookEvent
+
+
+logger = logging.getLogger(__name__)
+
+MAX_WEBHOOK_ATTEMPTS = 5
+# Events still unprocessed this long after arriving are assumed to have lost
+# their background thread (worker restart, crash) and are picked up again by
+# the next webhook's thread and by the ``worker`` process in the Procfile.
+STALE_WEBHOOK_SECONDS = 5 * 60
+STALE_WEBHOOK_BATCH = 20
+
+
+def record_webhook_event(event_data):
+    """Persist a verified Stripe event once; retries of the same event id are ignored."""
+    event_id = str(event_data.get('id') or '').strip()
+    if not event_id:
+        return None, False
+
+    return StripeWebhookEvent.objects.get_or_create(
+        stripe_event_id=event_id,
+        defaults={
+            'event_type': str(event_data.get('type') or ''),
+            'payload': event_data,
+        },
+    )
+
+
+def mark_order_paid(order):
+    """
+    Move a pending order to paid under a row lock so concurrent callers
+    (webhook worker, success page) cannot both perform the transition.
+    Returns the locked order when this call did the transition, else None.
+    """
+    order_id = getattr(order, 'pk', order)
+    if not order_id:
+        return None
+
+    with transaction.atomic():
+        locked = Order.objects.select_for_update().filter(pk=order_id).first()
+        if locked is None or locked.status != 'pending':
+            return None
+        locked.status = 'paid'
+        locked.save(update_fields=['status'])
+        finalize_referral_rewards(locked)
+
+    if isinstance(order, Order):
+        order.status = locked.status
+    return locked
+
+
+def _handle_payment_intent_succeeded(payload):
+    payment_intent = (payload.get('data') or {}).get('object') or {}
+    payment_id = (payment_intent.get('metadata') or {}).get('payment_id')
+    if not payment_id:
+        return None
+
+    payment = Payment.objects.select_for_update().filter(pk=payment_id).first()
+    if payment is None:
+        return None
+    if payment.status != 'succeeded':
+        payment.status = 'succeeded'
+        payment.save(update_fields=['status', 'updated_at'])
+
+    if not payment.order_id:
+        return None
+    return mark_order_paid(payment.order_id)
+
+
+WEBHOOK_HANDLERS = {
+    'payment_intent.succeeded': _handle_payment_intent_succeeded,
+}
+
+
+def process_webhook_event(event_pk):
+    """
+    Process one stored event exactly once. The event row stays locked for the
+    whole run, so a second worker picking the same event waits and then sees
+    it as processed. Returns True when the event was processed by this call.
+    """
+    with transaction.atomic():
+        event = StripeWebhookEvent.objects.select_for_update().filter(pk=event_pk).first()
+        if event is None or event.status == 'processed':
+            return False
+
+        event.attempts += 1
+        handler = WEBHOOK_HANDLERS.get(event.event_type)
+        try:
+            with transaction.atomic():
+                paid_order = handler(event.payload) if handler else None
+        except Exception as exc:
+            logger.exception('Stripe webhook event %s failed', event.stripe_event_id)
+            event.status = 'failed'
+            event.last_error = str(exc)[:2000]
+            event.save(update_fields=['status', 'attempts', 'last_error'])
+            return False
+
+        event.status = 'processed'
+        event.last_error = ''
+        event.processed_at = timezone.now()
+        event.save(update_fields=['status', 'attempts', 'last_error', 'processed_at'])
+
+        if paid_order is not None:
+            transaction.on_commit(lambda: send_paid_order_notification(paid_order))
+    return True
+
+
+def process_pending_webhook_events(*, limit=100, max_attempts=MAX_WEBHOOK_ATTEMPTS, received_before=None):
+    events = StripeWebhookEvent.objects.filter(status__in=('pending', 'failed'), attempts__lt=max_attempts)
+    if received_before is not None:
+        events = events.filter(received_at__lte=received_before)
+    event_ids = list(events.order_by('received_at', 'pk').values_list('pk', flat=True)[:limit])
+    return sum(1 for event_pk in event_ids if process_webhook_event(event_pk))
+
+
+def _run_webhook_event(event_pk):
+    try:
+        process_webhook_event(event_pk)
+        # Retry events whose own thread died or failed, so a paid order does
+        # not stay pending until someone runs process_stripe_webhooks.
+        process_pending_webhook_events(
+            limit=STALE_WEBHOOK_BATCH,
+            received_before=timezone.now() - timedelta(seconds=STALE_WEBHOOK_SECONDS),
+        )
+    except Exception:
+        logger.exception('Background processing failed for webhook event pk=%s', event_pk)
+    finally:
+        connection.close()
+
+
+def dispatch_webhook_event(event_pk):
+    """
+    Process the event, then any stale pending or failed ones, in a background
+    thread once the current transaction commits.
+    """
+    transaction.on_commit(
+        lambda: threading.Thread(target=_run_webhook_event, args=(event_pk,), daemon=True).start()
+    )
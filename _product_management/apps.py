@@ -6,3 +6,7 @@ class ProductManagementConfig(AppConfig):
     name = '_product_management'
     verbose_name = 'Product Management'
 
+    def ready(self):
+        # Register signals that invalidate cached paid-order reports
+        import _product_management.signals
+
@@ -0,0 +1,479 @@
+"""
+Shared HTTP fetching for the Bestway scrapers.
+
+``FetchEngine`` runs requests on a small thread pool over one pooled,
+keep-alive ``requests.Session``. Each host gets a concurrency cap and a
+token-bucket rate limit, and 429/5xx responses or connection errors are
+retried with jittered exponential backoff (``Retry-After`` is honoured).
+The engine keeps the ``request_attempts``/``request_failures`` counters the
+commands use to decide whether a scrape was healthy enough to publish: one
+attempt per URL, one failure per URL that never succeeded. Product detail
+pages are optional extras and are tallied apart, in
+``detail_attempts``/``detail_failures``.
+
+With a ``PageCache`` the engine serves pages younger than their class's max
+age from disk, revalidates older ones with ``If-None-Match`` /
+``If-Modified-Since``, and in offline mode replays the cache without any
+network access.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.management.base import CommandError
+from requests.adapters import HTTPAdapter
+
+
+# Simple browser-like headers to reduce blocking. Connections are kept alive
+# so consecutive pages reuse the same TLS connection.
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/124.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-GB,en;q=0.9",
+}
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 5.0
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 20
+# Listing pages carry prices, so they are always revalidated; product detail
+# text rarely changes.
+DEFAULT_MAX_AGE_HOURS = {"listing": 0, "detail": 7 * 24}
+
+_END = object()
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: ``rate`` tokens per second, up to ``burst``
+    banked. ``acquire`` reserves a token and sleeps until it is due, so
+    waiting callers are served in order without holding the lock.
+    """
+
+    def __init__(self, rate, burst=1, *, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping if needed; returns the seconds waited."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class PageCache:
+    """
+    Gzipped JSON entries under ``directory``, one per URL: the body, its
+    ETag/Last-Modified validators and when it was fetched. ``max_age`` maps
+    a URL class ("listing", "detail") to seconds an entry is used without
+    revalidation.
+    """
+
+    def __init__(self, directory, *, max_age=None):
+        self.directory = Path(directory)
+        self.max_age = dict(max_age or {})
+
+    def _path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json.gz"
+
+    def load(self, url):
+        try:
+            with gzip.open(self._path(url), "rt", encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def is_fresh(self, entry, kind, *, now=None):
+        age = (time.time() if now is None else now) - entry.get("fetched_at", 0)
+        return age < self.max_age.get(kind, 0)
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, response, *, now=None):
+        entry = {
+            "url": url,
+            "body": response.text,
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "fetched_at": time.time() if now is None else now,
+        }
+        self._write(url, entry)
+        return entry
+
+    def touch(self, url, entry, *, now=None):
+        """Mark a revalidated (304) entry as freshly fetched."""
+        entry = {**entry, "fetched_at": time.time() if now is None else now}
+        self._write(url, entry)
+        return entry
+
+    def _write(self, url, entry):
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+                json.dump(entry, fh, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+
+@dataclass
+class FetchResult:
+    url: str
+    response: Optional[requests.Response] = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+    body: Optional[str] = None
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and (
+            self.response is not None or self.body is not None
+        )
+
+    @property
+    def text(self) -> str:
+        if self.body is not None:
+            return self.body
+        return self.response.text if self.response is not None else ""
+
+
+class FetchEngine:
+    """
+    Concurrent, rate-limited page fetcher. ``get`` fetches one URL on the
+    calling thread; ``map`` fetches many on the pool and yields results in
+    input order, keeping only a bounded window of pages in flight.
+    """
+
+    def __init__(
+        self,
+        *,
+        headers=None,
+        concurrency=DEFAULT_CONCURRENCY,
+        per_host=None,
+        rate=DEFAULT_RATE,
+        burst=None,
+        retries=DEFAULT_RETRIES,
+        backoff=0.5,
+        max_backoff=30.0,
+        timeout=DEFAULT_TIMEOUT,
+        cache=None,
+        offline=False,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = int(concurrency)
+        self.per_host = int(per_host or concurrency)
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else self.per_host
+        self.retries = max(0, int(retries))
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.timeout = timeout
+        if offline and cache is None:
+            raise ValueError("offline mode needs a page cache")
+        self.cache = cache
+        self.offline = offline
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or HEADERS)
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=self.concurrency,
+            pool_block=True,
+            max_retries=0,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.request_attempts = 0
+        self.request_failures = 0
+        self.detail_attempts = 0
+        self.detail_failures = 0
+        self.retried = 0
+        self.cache_hits = 0
+        self._counter_lock = threading.Lock()
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options, **kwargs):
+        """Build an engine from the ``add_fetch_arguments`` command options."""
+        concurrency = options.get("concurrency", DEFAULT_CONCURRENCY)
+        rate = options.get("rate", DEFAULT_RATE)
+        retries = options.get("retries", DEFAULT_RETRIES)
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        if rate < 0 or retries < 0:
+            raise CommandError("--rate and --retries must not be negative.")
+
+        cache = None
+        offline = bool(options.get("offline"))
+        if not options.get("no_cache"):
+            max_age = {}
+            for kind, default in DEFAULT_MAX_AGE_HOURS.items():
+                hours = options.get(f"{kind}_max_age", default)
+                if hours < 0:
+                    raise CommandError(f"--{kind}-max-age must not be negative.")
+                max_age[kind] = hours * 3600
+            cache_dir = options.get("cache_dir") or settings.SCRAPER_CACHE_DIR
+            cache = PageCache(cache_dir, max_age=max_age)
+        elif offline:
+            raise CommandError("--offline replays the page cache; drop --no-cache.")
+        return cls(
+            concurrency=concurrency,
+            rate=rate,
+            retries=retries,
+            cache=cache,
+            offline=offline,
+            **kwargs,
+        )
+
+    def summary(self):
+        """One-line request tally for the command output."""
+        return (
+            f"Made {self.request_attempts:,} requests "
+            f"({self.cache_hits:,} from cache, {self.retried:,} retries, "
+            f"{self.request_failures:,} failed; "
+            f"{self.detail_attempts:,} detail pages, {self.detail_failures:,} failed)."
+        )
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _host_limits(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            limits = self._hosts.get(host)
+            if limits is None:
+                limits = (
+                    threading.BoundedSemaphore(self.per_host),
+                    TokenBucket(self.rate, self.burst) if self.rate > 0 else None,
+                )
+                self._hosts[host] = limits
+            return limits
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        # "Full jitter": spread retries from many workers across the window.
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _count(self, kind, *, failed=False):
+        with self._counter_lock:
+            if kind == "detail":
+                if failed:
+                    self.detail_failures += 1
+                else:
+                    self.detail_attempts += 1
+            elif failed:
+                self.request_failures += 1
+            else:
+                self.request_attempts += 1
+
+    def _save_to_cache(self, save, url, *args):
+        # The page was fetched; a full disk or unwritable cache only costs
+        # the next run a refetch.
+        try:
+            save(url, *args)
+        except OSError:
+            logger.warning("Could not write %s to the page cache", url, exc_info=True)
+
+    def _cache_hit(self, result, entry):
+        with self._counter_lock:
+            self.cache_hits += 1
+        result.body, result.error, result.from_cache = entry["body"], None, True
+        return result
+
+    def get(self, url, *, kind="listing") -> FetchResult:
+        """
+        Fetch ``url`` with retries. ``kind`` selects the cache max age and
+        which counters the request is tallied in. Never raises; check
+        ``result.ok``.
+        """
+        self._count(kind)
+        result = FetchResult(url=url)
+
+        entry = self.cache.load(url) if self.cache is not None else None
+        if entry is not None and (self.offline or self.cache.is_fresh(entry, kind)):
+            return self._cache_hit(result, entry)
+        if self.offline:
+            result.error = LookupError(f"{url} is not in the page cache")
+            self._count(kind, failed=True)
+            return result
+
+        headers = self.cache.conditional_headers(entry) if entry is not None else {}
+        semaphore, bucket = self._host_limits(url)
+        for attempt in range(self.retries + 1):
+            result.attempts = attempt + 1
+            response = None
+            with semaphore:
+                if bucket is not None:
+                    bucket.acquire()
+                try:
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                    if response.status_code == 304 and entry is not None:
+                        self._save_to_cache(self.cache.touch, url, entry)
+                        result.response = response
+                        return self._cache_hit(result, entry)
+                    response.raise_for_status()
+                except requests.RequestException as exc:
+                    result.error = exc
+                    retryable = response is None or response.status_code in RETRY_STATUSES
+                else:
+                    if self.cache is not None:
+                        self._save_to_cache(self.cache.store, url, response)
+                    result.response, result.error = response, None
+                    return result
+
+            if not retryable or attempt == self.retries:
+                break
+            with self._counter_lock:
+                self.retried += 1
+            time.sleep(self._retry_delay(attempt, response))
+
+        self._count(kind, failed=True)
+        return result
+
+    def map(self, urls: Iterable[str], *, kind="listing", window=None) -> Iterator[FetchResult]:
+        """
+        Fetch ``urls`` concurrently and yield their results in input order.
+        At most ``window`` (default twice the concurrency) results are held
+        ahead of the consumer.
+        """
+        window = max(1, window or self.concurrency * 2)
+        urls = iter(urls)
+        pending = deque()
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="scrape-fetch"
+        ) as executor:
+            for url in urls:
+                pending.append(executor.submit(self.get, url, kind=kind))
+                if len(pending) >= window:
+                    break
+            while pending:
+                result = pending.popleft().result()
+                next_url = next(urls, _END)
+                if next_url is not _END:
+                    pending.append(executor.submit(self.get, next_url, kind=kind))
+                yield result
+
+
+def add_fetch_arguments(parser):
+    """Register the shared fetching and page cache scraper options."""
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Pages fetched in parallel per host (default: {DEFAULT_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=(
+            "Maximum requests per second per host, 0 for no limit "
+            f"(default: {DEFAULT_RATE:g})."
+        ),
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=(
+            "Retries for 429/5xx responses and connection errors, with "
+            f"jittered backoff (default: {DEFAULT_RETRIES})."
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default="",
+        help="Page cache directory (default: settings.SCRAPER_CACHE_DIR).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the page cache.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Replay pages from the cache only; uncached pages count as failures.",
+    )
+    parser.add_argument(
+        "--listing-max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE_HOURS["listing"],
+        help=(
+            "Hours a cached listing page is used without revalidating it "
+            f"(default: {DEFAULT_MAX_AGE_HOURS['listing']})."
+        ),
+    )
+    parser.add_argument(
+        "--detail-max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE_HOURS["detail"],
+        help=(
+            "Hours a cached product detail page is used without revalidating "
+            f"it (default: {DEFAULT_MAX_AGE_HOURS['detail']})."
+        ),
+    )
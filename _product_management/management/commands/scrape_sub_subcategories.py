@@ -6,7 +6,8 @@ Usage:
 
 This command:
   - Reads nested categories from subcategories.json produced by scrape_subcategories
-  - For each subcategory URL, fetches the page
+  - For each subcategory URL, fetches the page (several at a time; see
+    --concurrency, --rate and --retries)
   - Looks for <ul class="caps chevron"> lists containing deeper links
   - Writes the collected structure to sub_subcategories.json next to this file
 
@@ -29,27 +30,16 @@ import json
 from pathlib import Path
 from urllib.parse import urlparse
 
-import requests
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand, CommandError
 
+from _product_management.fetching import FetchEngine, add_fetch_arguments
+
 from .scraper_for_sub_subcategory import Command as ProductScraperCommand
 
 
 BASE_URL = "https://www.bestwaywholesale.co.uk"
 
-# Simple browser-like headers to reduce blocking
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/124.0 Safari/537.36"
-    ),
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    "Accept-Language": "en-GB,en;q=0.9",
-    "Connection": "close",
-}
-
 
 class Command(BaseCommand):
     help = (
@@ -79,6 +69,7 @@ class Command(BaseCommand):
             default=BASE_URL,
             help="Base site URL (default: https://www.bestwaywholesale.co.uk).",
         )
+        add_fetch_arguments(parser)
 
     def handle(self, *args, **options):
         input_path = Path(options["input"])
@@ -102,15 +93,44 @@ class Command(BaseCommand):
                 f"Expected a JSON object in {input_path}, got {type(categories).__name__}"
             )
 
-        session = requests.Session()
-        session.headers.update(HEADERS)
-        request_attempts = 0
-        request_failures = 0
+        fetcher = FetchEngine.from_options(options)
+        try:
+            result, total_sub_subcats = self._discover(
+                categories, base_url, fetcher
+            )
+        finally:
+            fetcher.close()
+        self.stdout.write(fetcher.summary())
 
-        result: dict = {}
-        total_sub_subcats = 0
-        pagination_cache = {}
+        self._validate_result(
+            categories,
+            result,
+            output_path,
+            fetcher.request_attempts,
+            fetcher.request_failures,
+        )
 
+        # Write the collected data to JSON
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            json.dump(result, fh, ensure_ascii=False, indent=2)
+        tmp_path.replace(output_path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nWrote {total_sub_subcats} sub-subcategories across "
+                f"{len(result)} main categories to {output_path}"
+            )
+        )
+
+    def _discover(self, categories, base_url, fetcher):
+        """
+        Fetch every subcategory page, then every linked listing's first page
+        for its pagination, each batch concurrently. Results are merged in
+        input order so the taxonomy matches a sequential run.
+        """
+        pages = []
         for main_cat, subcat_map in categories.items():
             if not isinstance(subcat_map, dict):
                 self.stdout.write(
@@ -120,164 +140,143 @@ class Command(BaseCommand):
                 )
                 continue
 
-            main_bucket = result.setdefault(main_cat, {})
-
             for subcat_name, value in subcat_map.items():
-                urls = self._normalize_to_list(value)
-                if not urls:
-                    continue
-
-                sub_bucket = main_bucket.setdefault(subcat_name, {})
-                before = len(sub_bucket)
-
-                for url in urls:
-                    if not isinstance(url, str):
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f"Skipping non-string URL for {main_cat!r} -> "
-                                f"{subcat_name!r}: {url!r}"
-                            )
-                        )
-                        continue
-
+                for url in self._normalize_to_list(value):
                     page_url = url.strip()
-                    if not page_url:
-                        continue
-
                     # If somehow the URL is relative, make it absolute
                     if not page_url.startswith("http://") and not page_url.startswith("https://"):
                         if not page_url.startswith("/"):
                             page_url = "/" + page_url
                         page_url = f"{base_url}{page_url}"
+                    pages.append((main_cat, subcat_name, page_url))
+
+        # (main_cat, subcat_name, page_path, [(name, listing_url), ...]) per
+        # fetched page, or None for the links of a page that failed.
+        page_links = []
+        responses = fetcher.map(page_url for _, _, page_url in pages)
+        for (main_cat, subcat_name, page_url), fetched in zip(pages, responses):
+            self.stdout.write(
+                self.style.NOTICE(
+                    f"Fetched subcategory page: {page_url} "
+                    f"({main_cat} -> {subcat_name})"
+                )
+            )
+            parsed = urlparse(page_url)
+            if not fetched.ok:
+                self.stderr.write(
+                    self.style.WARNING(f"  Skipped ({fetched.error})")
+                )
+                page_links.append((main_cat, subcat_name, parsed.path, None))
+                continue
 
-                    self.stdout.write(
-                        self.style.NOTICE(
-                            f"Fetching subcategory page: {page_url} "
-                            f"({main_cat} -> {subcat_name})"
-                        )
+            soup = BeautifulSoup(fetched.text, "html.parser")
+            page_links.append(
+                (
+                    main_cat,
+                    subcat_name,
+                    parsed.path,
+                    self._deeper_links(soup, parsed.path, base_url),
+                )
+            )
+
+        # Inspect the live product count instead of assuming the old
+        # 100-product offsets through ?s=700. Bestway currently paginates in
+        # 20-product offsets, and the total varies by listing.
+        listing_urls = list(
+            dict.fromkeys(
+                full_url
+                for *_, links in page_links
+                for _, full_url in links or ()
+            )
+        )
+        pagination = {}
+        for fetched in fetcher.map(listing_urls):
+            if not fetched.ok:
+                self.stderr.write(
+                    self.style.WARNING(
+                        "  Could not inspect pagination for "
+                        f"{fetched.url} ({fetched.error}); recording its "
+                        "first page only."
                     )
+                )
+                pagination[fetched.url] = [fetched.url]
+            else:
+                listing_soup = BeautifulSoup(fetched.text, "html.parser")
+                pagination[fetched.url] = ProductScraperCommand._listing_page_urls(
+                    fetched.url, listing_soup
+                )
 
-                    try:
-                        request_attempts += 1
-                        resp = session.get(page_url, timeout=20)
-                        resp.raise_for_status()
-                    except Exception as exc:
-                        request_failures += 1
-                        self.stderr.write(
-                            self.style.WARNING(f"  Skipped ({exc})")
-                        )
-                        continue
-
-                    soup = BeautifulSoup(resp.text, "html.parser")
-
-                    # On these deeper pages the navigation often uses a plain
-                    # <ul> without the "caps chevron" classes (e.g.
-                    #   <ul>
-                    #     <li class="toplevel"><a href="/grocery/241">Baby Products</a></li>
-                    #     <li><a href="/grocery/241/502721">Canned Food</a></li>
-                    #     ...
-                    #   </ul>
-                    # )
-                    # So instead of relying on specific classes, we look for
-                    # anchors whose href starts with the current page path plus
-                    # a trailing slash (e.g. "/grocery/241/").
-                    parsed = urlparse(page_url)
-                    path_prefix = parsed.path.rstrip("/")
-                    if not path_prefix:
-                        path_prefix = "/"
-
-                    found_any = False
-                    for a in soup.find_all("a"):
-                        href = (a.get("href") or "").strip()
-                        if not href:
-                            continue
-                        if not href.startswith("/"):
-                            continue
-                        # We only want links that go deeper under this page,
-                        # e.g. "/grocery/241/502721" when the page is
-                        # "/grocery/241".
-                        if not href.startswith(path_prefix + "/"):
-                            continue
-
-                        name = " ".join(a.get_text(" ", strip=True).split())
-                        if not name:
-                            continue
-
-                        # Build absolute URL for the sub-subcategory
-                        full_url = f"{base_url}{href}"
-
-                        # Inspect the live product count instead of assuming
-                        # the old 100-product offsets through ?s=700. Bestway
-                        # currently paginates in 20-product offsets, and the
-                        # total varies by listing.
-                        if full_url not in pagination_cache:
-                            try:
-                                request_attempts += 1
-                                listing_response = session.get(
-                                    full_url, timeout=20
-                                )
-                                listing_response.raise_for_status()
-                            except Exception as exc:
-                                request_failures += 1
-                                self.stderr.write(
-                                    self.style.WARNING(
-                                        "  Could not inspect pagination for "
-                                        f"{full_url} ({exc}); recording its "
-                                        "first page only."
-                                    )
-                                )
-                                page_urls = [full_url]
-                            else:
-                                listing_soup = BeautifulSoup(
-                                    listing_response.text, "html.parser"
-                                )
-                                page_urls = (
-                                    ProductScraperCommand._listing_page_urls(
-                                        full_url, listing_soup
-                                    )
-                                )
-                            pagination_cache[full_url] = page_urls
-
-                        for listing_url in pagination_cache[full_url]:
-                            self._add_url(sub_bucket, name, listing_url)
-                        found_any = True
-
-                    if not found_any:
-                        self.stderr.write(
-                            self.style.WARNING(
-                                "  No deeper sub-subcategory links found under "
-                                f"{parsed.path}"
-                            )
+        result: dict = {
+            main_cat: {}
+            for main_cat, subcat_map in categories.items()
+            if isinstance(subcat_map, dict)
+        }
+        total_sub_subcats = 0
+        for main_cat, subcat_name in dict.fromkeys(
+            (main_cat, subcat_name) for main_cat, subcat_name, _, _ in page_links
+        ):
+            sub_bucket = result[main_cat].setdefault(subcat_name, {})
+            before = len(sub_bucket)
+            for page_main, page_subcat, path, links in page_links:
+                if (page_main, page_subcat) != (main_cat, subcat_name) or links is None:
+                    continue
+                if not links:
+                    self.stderr.write(
+                        self.style.WARNING(
+                            "  No deeper sub-subcategory links found under "
+                            f"{path}"
                         )
+                    )
+                for name, full_url in links:
+                    for listing_url in pagination[full_url]:
+                        self._add_url(sub_bucket, name, listing_url)
+
+            added = len(sub_bucket) - before
+            total_sub_subcats += max(0, added)
+            self.stdout.write(
+                f"  Found {added} new sub-subcategories for "
+                f"{main_cat!r} -> {subcat_name!r}"
+            )
 
-                added = len(sub_bucket) - before
-                total_sub_subcats += max(0, added)
-                self.stdout.write(
-                    f"  Found {added} new sub-subcategories for "
-                    f"{main_cat!r} -> {subcat_name!r}"
-                )
+        return result, total_sub_subcats
 
-        self._validate_result(
-            categories,
-            result,
-            output_path,
-            request_attempts,
-            request_failures,
+    @staticmethod
+    def _deeper_links(soup, page_path, base_url):
+        """
+        Return ``(name, absolute_url)`` for links that go deeper than the
+        current page.
+
+        On these deeper pages the navigation often uses a plain <ul> without
+        the "caps chevron" classes (e.g.
+          <ul>
+            <li class="toplevel"><a href="/grocery/241">Baby Products</a></li>
+            <li><a href="/grocery/241/502721">Canned Food</a></li>
+            ...
+          </ul>
         )
+        So instead of relying on specific classes, we look for anchors whose
+        href starts with the current page path plus a trailing slash (e.g.
+        "/grocery/241/").
+        """
+        path_prefix = page_path.rstrip("/")
+        if not path_prefix:
+            path_prefix = "/"
+
+        links = []
+        for a in soup.find_all("a"):
+            href = (a.get("href") or "").strip()
+            if not href:
+                continue
+            if not href.startswith("/"):
+                continue
+            if not href.startswith(path_prefix + "/"):
+                continue
 
-        # Write the collected data to JSON
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
-        with tmp_path.open("w", encoding="utf-8") as fh:
-            json.dump(result, fh, ensure_ascii=False, indent=2)
-        tmp_path.replace(output_path)
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"\nWrote {total_sub_subcats} sub-subcategories across "
-                f"{len(result)} main categories to {output_path}"
-            )
-        )
+            name = " ".join(a.get_text(" ", strip=True).split())
+            if not name:
+                continue
+            links.append((name, f"{base_url}{href}"))
+        return links
 
     @staticmethod
     def _leaf_count(data):
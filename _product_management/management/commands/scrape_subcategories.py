@@ -9,6 +9,7 @@ Usage:
 This command:
   - Reads a list of main-category paths from main_urls.json
   - Fetches each category page from https://www.bestwaywholesale.co.uk
+    (several at a time; see --concurrency, --rate and --retries)
   - Looks for <ul class="caps chevron"> lists containing subcategory links
   - Writes the collected structure to subcategories.json next to this file
 
@@ -27,28 +28,16 @@ Resulting JSON structure (example):
 import json
 from pathlib import Path
 
-import requests
 from bs4 import BeautifulSoup
-from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
+from _product_management.fetching import FetchEngine, add_fetch_arguments
+
 from .scraper_for_sub_subcategory import Command as ProductScraperCommand
 
 
 BASE_URL = "https://www.bestwaywholesale.co.uk"
 
-# Simple browser-like headers to reduce blocking
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/124.0 Safari/537.36"
-    ),
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    "Accept-Language": "en-GB,en;q=0.9",
-    "Connection": "close",
-}
-
 
 class Command(BaseCommand):
     help = (
@@ -78,6 +67,7 @@ class Command(BaseCommand):
             default=BASE_URL,
             help="Base site URL (default: https://www.bestwaywholesale.co.uk).",
         )
+        add_fetch_arguments(parser)
 
     def handle(self, *args, **options):
         input_path = Path(options["input"])
@@ -101,14 +91,10 @@ class Command(BaseCommand):
                 f"Expected a JSON list in {input_path}, got {type(main_paths).__name__}"
             )
 
-        session = requests.Session()
-        session.headers.update(HEADERS)
-
         all_data = {}
         total_subcats = 0
-        attempted_categories = 0
-        failed_categories = 0
 
+        paths = []
         for raw_path in main_paths:
             if not isinstance(raw_path, str):
                 self.stdout.write(
@@ -117,22 +103,25 @@ class Command(BaseCommand):
                 continue
 
             path = raw_path.strip().lstrip("/")
-            if not path:
-                continue
-
-            url = f"{base_url}/{path}"
-            self.stdout.write(self.style.NOTICE(f"Fetching: {url}"))
-            attempted_categories += 1
-
-            try:
-                resp = session.get(url, timeout=20)
-                resp.raise_for_status()
-            except Exception as exc:
-                failed_categories += 1
-                self.stderr.write(self.style.WARNING(f"  Skipped ({exc})"))
+            if path:
+                paths.append(path)
+
+        fetcher = FetchEngine.from_options(options)
+        try:
+            pages = list(zip(paths, fetcher.map(f"{base_url}/{path}" for path in paths)))
+        finally:
+            fetcher.close()
+        attempted_categories = fetcher.request_attempts
+        failed_categories = fetcher.request_failures
+        self.stdout.write(fetcher.summary())
+
+        for path, fetched in pages:
+            self.stdout.write(self.style.NOTICE(f"Fetched: {fetched.url}"))
+            if not fetched.ok:
+                self.stderr.write(self.style.WARNING(f"  Skipped ({fetched.error})"))
                 continue
 
-            soup = BeautifulSoup(resp.text, "html.parser")
+            soup = BeautifulSoup(fetched.text, "html.parser")
 
             # Try to detect a human-friendly main category label from the breadcrumb
             main_label = self._extract_main_label(soup) or path
@@ -17,43 +17,49 @@ This command:
     using the site's current page size (normally ?s=20, ?s=40, ...)
   - Also accepts the older sub_subcategories.json structure when passed with
     --input
-  - Fetches every discovered listing URL
+  - Fetches every discovered listing URL, several at a time (see
+    --concurrency, --rate and --retries)
   - Extracts product data from <li data-ga-product-id="..."> elements
-  - Follows each product detail page to scrape description / ingredients / other info
+  - Follows each product detail page to scrape description / ingredients / other info,
+    on a separate pool that overlaps with listing parsing. Products whose
+    listing data is unchanged reuse the details recorded in --state until
+    they are older than --detail-refresh-days
+  - Checkpoints progress every few listing pages, so a crashed run resumes
+    where it stopped (use --restart to start over)
+  - Keeps fetched pages in an on-disk cache (see --cache-dir, --offline and
+    --listing-max-age / --detail-max-age) so re-runs only download changes
   - Writes a flat list of product objects to a JSON file suitable for
     _product_management.management.commands.import_products_from_json
 """
 
+import hashlib
 import html
 import json
 import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Iterable, List, Tuple
 from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit, urlunsplit
 
-import requests
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand, CommandError
 
+from _product_management.fetching import FetchEngine, add_fetch_arguments
 
-BASE_URL = "https://www.bestwaywholesale.co.uk"
 
-# Simple browser-like headers to reduce blocking
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/124.0 Safari/537.36"
-    ),
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    "Accept-Language": "en-GB,en;q=0.9",
-    "Connection": "close",
-}
+BASE_URL = "https://www.bestwaywholesale.co.uk"
 
 
 class Command(BaseCommand):
     MAX_REQUEST_FAILURE_RATIO = 0.20
     MIN_OUTPUT_RETENTION_RATIO = 0.75
+    # Products waiting for their detail page before the listing stage pauses.
+    DETAIL_BACKLOG = 64
+    # Listing pages between checkpoints.
+    CHECKPOINT_PAGES = 25
+    DETAIL_FIELDS = ("description", "ingredients_nutrition", "other_info", "vat_rate")
 
     help = (
         "Discover and scrape all paginated Bestway category listings, then "
@@ -87,6 +93,31 @@ class Command(BaseCommand):
             default=BASE_URL,
             help="Base site URL (default: https://www.bestwaywholesale.co.uk).",
         )
+        parser.add_argument(
+            "--state",
+            type=str,
+            default=str(script_dir / "sub_subcategory_details.json"),
+            help=(
+                "Path of the per-product detail state: listing fingerprint, "
+                "detail fields and when they were scraped "
+                "(default: commands/sub_subcategory_details.json)."
+            ),
+        )
+        parser.add_argument(
+            "--detail-refresh-days",
+            type=float,
+            default=7,
+            help=(
+                "Re-scrape details of unchanged products older than this; "
+                "0 re-scrapes every product (default: 7)."
+            ),
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore an interrupted run's checkpoint and start over.",
+        )
+        add_fetch_arguments(parser)
 
     def handle(self, *args, **options):
         input_path = Path(options["input"])
@@ -110,24 +141,80 @@ class Command(BaseCommand):
                 f"Expected a JSON object in {input_path}, got {type(data).__name__}"
             )
 
-        session = requests.Session()
-        session.headers.update(HEADERS)
-        self.request_attempts = 0
-        self.request_failures = 0
+        if options["detail_refresh_days"] < 0:
+            raise CommandError("--detail-refresh-days must not be negative.")
+        self.state_path = Path(options["state"])
+        self.checkpoint_path = json_out_path.with_suffix(
+            json_out_path.suffix + ".checkpoint"
+        )
+        self.journal_path = self.state_path.with_suffix(
+            self.state_path.suffix + ".journal"
+        )
+        if options["restart"]:
+            self.checkpoint_path.unlink(missing_ok=True)
+        self.detail_state = self._read_json(self.state_path, {})
+        # Details recorded at checkpoints of a run that was killed outright;
+        # folded into the state file so the journal starts empty.
+        journal = self._read_ndjson(self.journal_path)
+        if journal:
+            self.detail_state.update(journal)
+            self._write_json(self.state_path, self.detail_state)
+        self.journal_path.unlink(missing_ok=True)
+        self.changed_details = set()
+        self.detail_refresh_seconds = options["detail_refresh_days"] * 86400
+        self.details_reused = 0
+
+        self.fetcher = FetchEngine.from_options(options)
+        try:
+            collected = self._scrape(data, base_url, input_path)
+        finally:
+            self.fetcher.close()
+            # Details scraped so far are kept even if the run failed.
+            self._write_json(self.state_path, self.detail_state)
+            self.journal_path.unlink(missing_ok=True)
+        self.request_attempts = self.fetcher.request_attempts
+        self.request_failures = self.fetcher.request_failures
+        self.stdout.write(self.fetcher.summary())
+        self.stdout.write(
+            f"Reused stored details for {self.details_reused:,} unchanged products."
+        )
+
+        try:
+            self._validate_scrape_result(data, collected, json_out_path)
+        except CommandError:
+            # Resuming would only reproduce the same incomplete result.
+            self.checkpoint_path.unlink(missing_ok=True)
+            raise
+
+        self._write_json(json_out_path, collected, indent=2)
+        self.checkpoint_path.unlink(missing_ok=True)
+        current_ids = {row["ga_product_id"] for row in collected}
+        self._write_json(
+            self.state_path,
+            {
+                ga_id: entry
+                for ga_id, entry in self.detail_state.items()
+                if ga_id in current_ids
+            },
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nScraped {len(collected):,} unique products and wrote them to {json_out_path}"
+            )
+        )
 
+    def _scrape(self, data, base_url, input_path):
         seeds = list(self._expand_urls(data))
         self.stdout.write(
             f"Found {len(seeds):,} category listing roots in {input_path.name}."
         )
-        sources = self._discover_listing_urls(session, seeds, base_url)
+        sources = self._discover_listing_urls(seeds, base_url)
         self.stdout.write(
             f"Discovered {len(sources):,} paginated listing URLs to scrape."
         )
 
-        collected: List[Dict] = []
-        seen_ids = set()
-        list_position = 0
-
+        pages = []
         for main_cat, sub_cat, sub_subcat, url in sources:
             page_url = url.strip()
             if not page_url:
@@ -137,26 +224,235 @@ class Command(BaseCommand):
                 if not page_url.startswith("/"):
                     page_url = "/" + page_url
                 page_url = f"{base_url}{page_url}"
+            pages.append((main_cat, sub_cat, sub_subcat, page_url))
 
+        collected: List[Dict] = []
+        start = 0
+        pages_digest = hashlib.sha256(
+            json.dumps(pages, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        checkpoint = self._read_checkpoint()
+        if checkpoint is not None and checkpoint["pages"] == pages_digest:
+            start = checkpoint["next_page"]
+            collected = checkpoint["rows"]
+            self.fetcher.request_attempts += checkpoint["request_attempts"]
+            self.fetcher.request_failures += checkpoint["request_failures"]
             self.stdout.write(
                 self.style.NOTICE(
-                    f"→ Fetching: {page_url} "
-                    f"({main_cat} -> {sub_cat} -> {sub_subcat})"
+                    f"Resuming from checkpoint: {start:,} of {len(pages):,} "
+                    f"listing pages done, {len(collected):,} products."
                 )
             )
+        elif checkpoint is not None:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Listing pages changed since the last checkpoint; starting over."
+                )
+            )
+        # The first checkpoint rewrites the file (dropping any torn line of
+        # an interrupted write); later ones append the rows found since.
+        self.checkpointed_rows = None
+
+        # Detail pages are fetched on their own pool while later listing pages
+        # are still being parsed. The backlog is bounded, so the listing stage
+        # waits for the oldest detail page rather than queueing thousands.
+        pending = deque()
+        with ThreadPoolExecutor(
+            max_workers=self.fetcher.concurrency,
+            thread_name_prefix="scrape-detail",
+        ) as detail_pool:
+
+            def queue_details(row):
+                fingerprint = self._listing_fingerprint(row)
+                if not self._reuse_details(row, fingerprint):
+                    pending.append(
+                        (
+                            row,
+                            fingerprint,
+                            detail_pool.submit(self._scrape_product_details, row["url"]),
+                        )
+                    )
+                    if len(pending) >= self.DETAIL_BACKLOG:
+                        self._apply_details(*pending.popleft())
+
+            for row in collected:
+                queue_details(row)
 
+            seen_ids = {row["ga_product_id"] for row in collected}
+            page_rows = self._listing_page_rows(pages[start:], base_url, seen_ids)
             try:
-                self.request_attempts += 1
-                response = session.get(page_url, timeout=20)
-                response.raise_for_status()
-            except Exception as exc:
-                self.request_failures += 1
-                self.stderr.write(self.style.WARNING(f"  skipped ({exc})"))
+                for done, rows in enumerate(page_rows, start=start + 1):
+                    for row in rows:
+                        collected.append(row)
+                        queue_details(row)
+                    if done % self.CHECKPOINT_PAGES == 0 and done < len(pages):
+                        self._write_checkpoint(pages_digest, done, collected)
+            except BaseException:
+                # Record the details that did arrive, so resuming skips them.
+                for row, fingerprint, future in pending:
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        self._apply_details(row, fingerprint, future)
+                raise
+            while pending:
+                self._apply_details(*pending.popleft())
+
+        return collected
+
+    @staticmethod
+    def _listing_fingerprint(row):
+        """Digest of the listing fields that signal a changed product page."""
+        fields = [row.get(key) for key in ("name", "price", "variant", "url", "sku")]
+        return hashlib.sha1(
+            json.dumps(fields, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def _reuse_details(self, row, fingerprint):
+        """Fill ``row`` from the stored details when they are still current."""
+        entry = self.detail_state.get(row["ga_product_id"])
+        if (
+            not entry
+            or entry.get("fingerprint") != fingerprint
+            or time.time() - entry.get("scraped_at", 0) >= self.detail_refresh_seconds
+        ):
+            return False
+        for field in self.DETAIL_FIELDS:
+            row[field] = entry.get(field)
+        self.details_reused += 1
+        return True
+
+    def _apply_details(self, row, fingerprint, future):
+        details = future.result()
+        if details is None:
+            # Keep the last known details rather than blanking the product.
+            previous = self.detail_state.get(row["ga_product_id"]) or {}
+            for field in self.DETAIL_FIELDS:
+                row[field] = previous.get(field)
+            return
+        row.update(zip(self.DETAIL_FIELDS, details))
+        self.changed_details.add(row["ga_product_id"])
+        self.detail_state[row["ga_product_id"]] = {
+            "fingerprint": fingerprint,
+            "scraped_at": time.time(),
+            **{field: row[field] for field in self.DETAIL_FIELDS},
+        }
+
+    def _read_checkpoint(self):
+        """
+        The interrupted run's checkpoint: a header line with the listing
+        pages digest, then one line per checkpoint with the rows found since
+        the previous one. A torn last line is ignored.
+        """
+        lines = iter(self._read_ndjson(self.checkpoint_path))
+        header = next(lines, None)
+        if not isinstance(header, dict) or "pages" not in header:
+            return None
+        checkpoint = {
+            "pages": header["pages"],
+            "next_page": 0,
+            "rows": [],
+            "request_attempts": 0,
+            "request_failures": 0,
+        }
+        for batch in lines:
+            checkpoint["rows"].extend(batch["rows"])
+            checkpoint.update(
+                (key, batch[key])
+                for key in ("next_page", "request_attempts", "request_failures")
+            )
+        return checkpoint
+
+    def _write_checkpoint(self, pages_digest, next_page, collected):
+        # Appends only what is new since the last checkpoint, so a long run
+        # writes each row and each detail entry once rather than every time.
+        lines = []
+        first = self.checkpointed_rows is None
+        if first:
+            lines.append({"pages": pages_digest})
+            self.checkpointed_rows = 0
+        lines.append(
+            {
+                "next_page": next_page,
+                "rows": collected[self.checkpointed_rows:],
+                "request_attempts": self.fetcher.request_attempts,
+                "request_failures": self.fetcher.request_failures,
+            }
+        )
+        self._append_ndjson(self.checkpoint_path, lines, truncate=first)
+        self.checkpointed_rows = len(collected)
+
+        changed = sorted(self.changed_details)
+        self._append_ndjson(
+            self.journal_path,
+            ([ga_id, self.detail_state[ga_id]] for ga_id in changed),
+        )
+        self.changed_details.clear()
+
+    @staticmethod
+    def _read_ndjson(path):
+        """Parsed lines of ``path`` up to the first incomplete one."""
+        try:
+            fh = path.open(encoding="utf-8")
+        except OSError:
+            return []
+        values = []
+        with fh:
+            for line in fh:
+                try:
+                    values.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return values
+
+    @staticmethod
+    def _append_ndjson(path, values, *, truncate=False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w" if truncate else "a", encoding="utf-8") as fh:
+            for value in values:
+                fh.write(json.dumps(value, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _read_json(path, default):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return default
+
+    @staticmethod
+    def _write_json(path, data, **kwargs):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, **kwargs)
+        tmp_path.replace(path)
+
+    def _listing_page_rows(self, pages, base_url, seen_ids):
+        """
+        Yield, for each listing page in ``pages``, the rows of products not in
+        ``seen_ids`` (updated as they are found), in listing order. Detail
+        fields are left as None for the detail stage.
+        """
+        list_position = len(seen_ids)
+
+        # Listing pages are fetched ahead on the pool but handled in order,
+        # so list_position and de-duplication match a sequential run.
+        responses = self.fetcher.map(page_url for *_, page_url in pages)
+        for (main_cat, sub_cat, sub_subcat, page_url), fetched in zip(pages, responses):
+            self.stdout.write(
+                self.style.NOTICE(
+                    f"→ Fetched: {page_url} "
+                    f"({main_cat} -> {sub_cat} -> {sub_subcat})"
+                )
+            )
+
+            if not fetched.ok:
+                self.stderr.write(self.style.WARNING(f"  skipped ({fetched.error})"))
+                yield []
                 continue
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            soup = BeautifulSoup(fetched.text, "html.parser")
             items = soup.select("li[data-ga-product-id]")
             self.stdout.write(f"  found {len(items)} products")
+            page_rows = []
 
             for li in items:
                 ga_id = (li.get("data-ga-product-id") or "").strip()
@@ -309,10 +605,6 @@ class Command(BaseCommand):
                     if "multibuy" in item_text.lower():
                         multi_buy = True
 
-                desc_text, ingr_text, other_info_text, vat_rate_code = (
-                    self._scrape_product_details(product_url)
-                )
-
                 row = {
                     "ga_product_id": ga_id,
                     "name": name,
@@ -329,31 +621,19 @@ class Command(BaseCommand):
                     "promotion_end_date": promotion_end_date,
                     "multi_buy": multi_buy,
                     "retail_EAN": retail_ean,
-                    "description": desc_text,
-                    "ingredients_nutrition": ingr_text,
-                    "other_info": other_info_text,
+                    "description": None,
+                    "ingredients_nutrition": None,
+                    "other_info": None,
                     # Do not hard-default here; keep whatever we could
                     # infer from the product page (or None). The
                     # import_products_from_json command will fall back
                     # to "standard" if this is falsy.
-                    "vat_rate": vat_rate_code,
+                    "vat_rate": None,
                 }
 
-                collected.append(row)
-
-        self._validate_scrape_result(data, collected, json_out_path)
-
-        json_out_path.parent.mkdir(parents=True, exist_ok=True)
-        tmp_path = json_out_path.with_suffix(json_out_path.suffix + ".tmp")
-        with tmp_path.open("w", encoding="utf-8") as jf:
-            json.dump(collected, jf, ensure_ascii=False, indent=2)
-        tmp_path.replace(json_out_path)
+                page_rows.append(row)
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"\nScraped {len(collected):,} unique products and wrote them to {json_out_path}"
-            )
-        )
+            yield page_rows
 
     @staticmethod
     def _expand_urls(data: Dict) -> Iterable[Tuple[str, str, str, str]]:
@@ -448,12 +728,13 @@ class Command(BaseCommand):
                         "was preserved."
                     )
 
-    def _discover_listing_urls(self, session, seeds, base_url):
+    def _discover_listing_urls(self, seeds, base_url):
         """
         Replace stale, pre-generated pagination with URLs calculated from each
         live category page's "1 to N of Total Products" summary.
         """
         discovered = []
+        roots = []
         seen_roots = set()
 
         for main_cat, sub_cat, sub_subcat, raw_url in seeds:
@@ -461,7 +742,10 @@ class Command(BaseCommand):
             if not root_url or root_url in seen_roots:
                 continue
             seen_roots.add(root_url)
+            roots.append((main_cat, sub_cat, sub_subcat, root_url))
 
+        responses = self.fetcher.map(root_url for *_, root_url in roots)
+        for (main_cat, sub_cat, sub_subcat, root_url), fetched in zip(roots, responses):
             self.stdout.write(
                 self.style.NOTICE(
                     f"Inspecting pagination: {root_url} "
@@ -469,21 +753,16 @@ class Command(BaseCommand):
                 )
             )
 
-            try:
-                self.request_attempts += 1
-                response = session.get(root_url, timeout=20)
-                response.raise_for_status()
-            except Exception as exc:
-                self.request_failures += 1
+            if not fetched.ok:
                 self.stderr.write(
                     self.style.WARNING(
-                        f"  Could not inspect pagination ({exc}); "
+                        f"  Could not inspect pagination ({fetched.error}); "
                         "the first page will still be attempted."
                     )
                 )
                 page_urls = [root_url]
             else:
-                soup = BeautifulSoup(response.text, "html.parser")
+                soup = BeautifulSoup(fetched.text, "html.parser")
                 page_urls = self._listing_page_urls(root_url, soup)
 
             self.stdout.write(f"  discovered {len(page_urls)} page(s)")
@@ -573,19 +852,16 @@ class Command(BaseCommand):
         - VAT rate (mapped to model-style codes)
 
         Returns a 4-tuple (each may be None):
-        (description, ingredients_nutrition, other_info, vat_rate_code)
+        (description, ingredients_nutrition, other_info, vat_rate_code),
+        or None when there is no page or it could not be fetched.
         """
         if not url:
-            return None, None, None, None
-        try:
-            self.request_attempts += 1
-            r = requests.get(url, headers=HEADERS, timeout=20)
-            r.raise_for_status()
-        except Exception:
-            self.request_failures += 1
-            return None, None, None, None
-
-        soup = BeautifulSoup(r.text, "html.parser")
+            return None
+        fetched = self.fetcher.get(url, kind="detail")
+        if not fetched.ok:
+            return None
+
+        soup = BeautifulSoup(fetched.text, "html.parser")
 
         description: List[str] = []
         ingredients_nutrition: List[str] = []
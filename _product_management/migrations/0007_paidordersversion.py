@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('_product_management', '0006_basketpricingsettings_rsp_multiplier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaidOrdersVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Paid orders version',
+                'verbose_name_plural': 'Paid orders version',
+            },
+        ),
+    ]
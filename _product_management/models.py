@@ -173,3 +173,34 @@ class BasketPricingSettings(models.Model):
     def get_solo(cls):
         obj, _ = cls.objects.get_or_create(pk=1)
         return obj
+
+
+class PaidOrdersVersion(models.Model):
+    """Counter bumped whenever paid orders, their items or product pricing change.
+
+    Reports over paid demand (items to order) cache their results per version.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Paid orders version"
+        verbose_name_plural = "Paid orders version"
+
+    def __str__(self):
+        return f"Paid orders version {self.version}"
+
+    @classmethod
+    def get_solo(cls):
+        obj, _ = cls.objects.get_or_create(pk=1)
+        return obj
+
+    @classmethod
+    def current(cls):
+        return cls.get_solo().version
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=models.F("version") + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(pk=1, defaults={"version": 1})
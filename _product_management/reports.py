@@ -0,0 +1,118 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Round
+
+from _catalog.models import All_Products
+from _orders.models import OrderItem
+
+from .models import PaidOrdersVersion
+from .rsp import get_rsp_multiplier
+
+
+ITEMS_TO_ORDER_STATUSES = ('paid',)
+ITEMS_TO_ORDER_CACHE_TIMEOUT = 60 * 60
+STANDARD_VAT_FACTOR = Decimal('1.20')
+
+_MONEY = DecimalField(max_digits=16, decimal_places=4)
+
+
+def _money(expression):
+    return ExpressionWrapper(expression, output_field=_MONEY)
+
+
+def vat_factor_expression(prefix='product__'):
+    """Supplier cost VAT factor: 1.20 for standard-rated products, otherwise 1.00."""
+    return Case(
+        When(**{f'{prefix}vat_rate': 'standard'}, then=Value(STANDARD_VAT_FACTOR)),
+        default=Value(Decimal('1.00')),
+        output_field=_MONEY,
+    )
+
+
+def display_rsp_expression(prefix='product__', *, multiplier=None):
+    """Stored RSP, or cost x RSP multiplier when the product has no usable RSP."""
+    multiplier = multiplier if multiplier is not None else get_rsp_multiplier()
+    derived = Round(_money(F(f'{prefix}price') * Value(multiplier)), 2)
+    return Case(
+        When(Q(**{f'{prefix}rsp__isnull': True}) | Q(**{f'{prefix}rsp': 0}), then=derived),
+        default=F(f'{prefix}rsp'),
+        output_field=_MONEY,
+    )
+
+
+def _rsp_net(gross):
+    # RSP is VAT inclusive at 20%; net = gross * 5 / 6.
+    return _money(gross * Value(Decimal('5')) / Value(Decimal('6')))
+
+
+def paid_order_items(statuses=ITEMS_TO_ORDER_STATUSES):
+    return OrderItem.objects.filter(order__status__in=statuses)
+
+
+def _build_items_to_order_report(multiplier):
+    display_rsp = display_rsp_expression(multiplier=multiplier)
+    vat_factor = vat_factor_expression()
+    price = F('product__price')
+    quantity = F('quantity')
+
+    rows = (
+        paid_order_items()
+        .values(
+            'product_id',
+            'product__name',
+            'product__sku',
+            'product__ga_product_id',
+            'product__variant',
+            'product__price',
+            'product__rsp',
+            'product__vat_rate',
+        )
+        .annotate(
+            total_qty=Sum('quantity'),
+            orders_count=Count('order', distinct=True),
+            display_rsp=display_rsp,
+            gross_price=_money(price * vat_factor),
+            rsp_net=_rsp_net(display_rsp),
+            net_profit=_money(_rsp_net(display_rsp) - price),
+            net_profit_total=_money((_rsp_net(display_rsp) - price) * Sum('quantity')),
+        )
+        .order_by('product__name')
+    )
+
+    vat_labels = dict(All_Products.VAT_RATE_CHOICES)
+    items = []
+    for row in rows:
+        row['vat_rate_display'] = vat_labels.get(row['product__vat_rate'], row['product__vat_rate'])
+        items.append(row)
+
+    zero = Value(Decimal('0'), output_field=_MONEY)
+    totals = paid_order_items().aggregate(
+        sum_cost_net=Coalesce(Sum(_money(price * quantity)), zero),
+        sum_cost_gross=Coalesce(Sum(_money(price * quantity * vat_factor)), zero),
+        sum_rsp_gross=Coalesce(Sum(_money(display_rsp * quantity)), zero),
+        sum_rsp_net=Coalesce(Sum(_rsp_net(display_rsp * quantity)), zero),
+        grand_qty=Coalesce(Sum('quantity'), 0),
+    )
+    totals['sum_net_profit'] = totals['sum_rsp_net'] - totals['sum_cost_net']
+    return {'items': items, 'totals': totals}
+
+
+def items_to_order_cache_key(version, multiplier):
+    return f'_product_management:items_to_order:{version}:{multiplier}'
+
+
+def build_items_to_order_report():
+    """
+    Aggregate paid demand per product with pricing, VAT and profit columns
+    computed in SQL. Results are cached per paid orders version and RSP
+    multiplier, so any order, item or product change yields a fresh report.
+    """
+    multiplier = get_rsp_multiplier()
+    key = items_to_order_cache_key(PaidOrdersVersion.current(), multiplier)
+    report = cache.get(key)
+    if report is None:
+        report = _build_items_to_order_report(multiplier)
+        cache.set(key, report, ITEMS_TO_ORDER_CACHE_TIMEOUT)
+    return report
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from _catalog.models import All_Products
+from _orders.models import Order, OrderItem
+
+from .models import PaidOrdersVersion
+from .reports import ITEMS_TO_ORDER_STATUSES
+
+
+# Product fields shown or priced by the paid-demand reports.
+REPORT_PRODUCT_FIELDS = frozenset({
+    'name', 'sku', 'ga_product_id', 'variant', 'price', 'rsp', 'vat_rate',
+})
+
+
+def _bump_after_commit():
+    # After commit, so checkouts and imports never wait on the counter row
+    # and a failed bump cannot abort the caller's transaction.
+    transaction.on_commit(PaidOrdersVersion.bump)
+
+
+def _is_paid(status):
+    return status in ITEMS_TO_ORDER_STATUSES
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & fields)
+
+
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    # __dict__ lookup so deferred status fields are not loaded.
+    instance._paid_demand_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not _touches(update_fields, {'status'}):
+        return
+    previous = None if created else getattr(instance, '_paid_demand_status', None)
+    if _is_paid(previous) != _is_paid(instance.status):
+        _bump_after_commit()
+    instance._paid_demand_status = instance.status
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    if _is_paid(instance.status):
+        _bump_after_commit()
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    if Order.objects.filter(pk=instance.order_id, status__in=ITEMS_TO_ORDER_STATUSES).exists():
+        _bump_after_commit()
+
+
+@receiver([post_save, post_delete], sender=All_Products)
+def product_changed(sender, instance, update_fields=None, **kwargs):
+    if kwargs.get('created') or not _touches(update_fields, REPORT_PRODUCT_FIELDS):
+        return
+    in_paid_demand = OrderItem.objects.filter(
+        product_id=instance.pk,
+        order__status__in=ITEMS_TO_ORDER_STATUSES,
+    ).exists()
+    if in_paid_demand:
+        _bump_after_commit()
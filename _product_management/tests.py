@@ -1,10 +1,18 @@
+import json
+import threading
+import time
 from collections import defaultdict
 from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest import mock
 
 from bs4 import BeautifulSoup
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
@@ -23,7 +31,10 @@ from _product_management.management.commands.scrape_subcategories import (
 from _product_management.management.commands.scraper_for_sub_subcategory import (
     Command as ProductScraperCommand,
 )
-from _product_management.models import BasketPricingSettings
+from _orders.models import Order, OrderItem
+from _product_management.fetching import FetchEngine, PageCache, TokenBucket
+from _product_management.models import BasketPricingSettings, PaidOrdersVersion
+from _product_management.reports import build_items_to_order_report
 
 
 class ProductScraperPaginationTests(SimpleTestCase):
@@ -216,6 +227,509 @@ class CategoryScrapeSafetyTests(SimpleTestCase):
                 )
 
 
+class FixtureSite(BaseHTTPRequestHandler):
+    """
+    Local HTTP/1.1 site for scraper tests. ``pages`` maps a path to its body,
+    ``statuses`` to a list of status codes served (and consumed) before it.
+    """
+
+    protocol_version = "HTTP/1.1"
+    pages = {}
+    statuses = {}
+    etags = {}
+    delay = 0.0
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    hits = defaultdict(int)
+    client_ports = set()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.hits[self.path] += 1
+            cls.client_ports.add(self.client_address[1])
+            queued = cls.statuses.get(self.path) or []
+            status = queued.pop(0) if queued else (200 if self.path in cls.pages else 404)
+            etag = cls.etags.get(self.path)
+            if status == 200 and etag and self.headers.get("If-None-Match") == etag:
+                status = 304
+        try:
+            if cls.delay:
+                time.sleep(cls.delay)
+            body = cls.pages.get(self.path, "").encode() if status == 200 else b"error"
+            if status == 304:
+                body = b""
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureSiteTestCase(SimpleTestCase):
+    def setUp(self):
+        FixtureSite.pages = {}
+        FixtureSite.statuses = {}
+        FixtureSite.etags = {}
+        FixtureSite.delay = 0.0
+        FixtureSite.in_flight = FixtureSite.max_in_flight = 0
+        FixtureSite.hits = defaultdict(int)
+        FixtureSite.client_ports = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureSite)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+
+    def engine(self, **kwargs):
+        kwargs.setdefault("rate", 0)
+        kwargs.setdefault("backoff", 0)
+        engine = FetchEngine(**kwargs)
+        self.addCleanup(engine.close)
+        return engine
+
+
+class FetchEngineTests(FixtureSiteTestCase):
+    def test_retries_throttled_and_failing_responses(self):
+        FixtureSite.pages = {"/flaky": "ok"}
+        FixtureSite.statuses = {"/flaky": [429, 503]}
+        engine = self.engine(retries=3)
+
+        result = engine.get(f"{self.base_url}/flaky")
+
+        self.assertTrue(result.ok)
+        self.assertEqual(result.text, "ok")
+        self.assertEqual(result.attempts, 3)
+        self.assertEqual(
+            (engine.request_attempts, engine.request_failures, engine.retried),
+            (1, 0, 2),
+        )
+
+    def test_failures_are_counted_once_per_url(self):
+        FixtureSite.statuses = {"/down": [503, 503, 503]}
+        engine = self.engine(retries=2)
+
+        down = engine.get(f"{self.base_url}/down")
+        missing = engine.get(f"{self.base_url}/missing")
+
+        self.assertFalse(down.ok)
+        self.assertEqual(down.attempts, 3)
+        # A 404 is not worth retrying.
+        self.assertFalse(missing.ok)
+        self.assertEqual(missing.attempts, 1)
+        self.assertEqual((engine.request_attempts, engine.request_failures), (2, 2))
+
+    def test_map_keeps_input_order_within_the_host_cap(self):
+        FixtureSite.pages = {f"/page/{n}": str(n) for n in range(12)}
+        FixtureSite.delay = 0.02
+        engine = self.engine(concurrency=6, per_host=3)
+
+        results = list(
+            engine.map(f"{self.base_url}/page/{n}" for n in range(12))
+        )
+
+        self.assertEqual([r.text for r in results], [str(n) for n in range(12)])
+        self.assertGreater(FixtureSite.max_in_flight, 1)
+        self.assertLessEqual(FixtureSite.max_in_flight, 3)
+
+    def test_connections_are_kept_alive(self):
+        FixtureSite.pages = {"/a": "a", "/b": "b"}
+        engine = self.engine(concurrency=1)
+
+        for _ in range(3):
+            engine.get(f"{self.base_url}/a")
+            engine.get(f"{self.base_url}/b")
+
+        self.assertEqual(len(FixtureSite.client_ports), 1)
+
+    def test_cached_pages_are_revalidated_or_reused_by_age(self):
+        FixtureSite.pages = {"/listing": "v1"}
+        FixtureSite.etags = {"/listing": '"v1"'}
+        cache = PageCache(self.cache_dir, max_age={"listing": 0, "detail": 3600})
+        url = f"{self.base_url}/listing"
+
+        first = self.engine(cache=cache).get(url)
+        revalidated = self.engine(cache=cache).get(url)
+        engine = self.engine(cache=cache)
+        reused = engine.get(url, kind="detail")
+
+        self.assertFalse(first.from_cache)
+        self.assertEqual(revalidated.response.status_code, 304)
+        self.assertEqual((revalidated.text, revalidated.from_cache), ("v1", True))
+        self.assertEqual((reused.text, reused.response), ("v1", None))
+        self.assertEqual(FixtureSite.hits["/listing"], 2)
+        self.assertEqual(
+            (engine.request_attempts, engine.detail_attempts, engine.cache_hits),
+            (0, 1, 1),
+        )
+
+    def test_cache_write_errors_still_return_the_page(self):
+        FixtureSite.pages = {"/listing": "v1", "/other": "v2"}
+        FixtureSite.etags = {"/listing": '"v1"'}
+        cache = PageCache(self.cache_dir)
+        url = f"{self.base_url}/listing"
+        self.engine(cache=cache).get(url)
+        engine = self.engine(cache=cache)
+
+        disk_full = mock.patch.object(PageCache, "_write", side_effect=OSError("disk full"))
+        with disk_full, self.assertLogs("_product_management.fetching", "WARNING") as logs:
+            revalidated = engine.get(url)
+            fetched = engine.get(f"{self.base_url}/other")
+
+        self.assertEqual((revalidated.text, revalidated.response.status_code), ("v1", 304))
+        self.assertEqual((fetched.text, fetched.response.status_code), ("v2", 200))
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual((engine.request_attempts, engine.request_failures), (2, 0))
+
+    def test_offline_mode_replays_the_cache_only(self):
+        FixtureSite.pages = {"/a": "a"}
+        cache = PageCache(self.cache_dir)
+        self.engine(cache=cache).get(f"{self.base_url}/a")
+        engine = self.engine(cache=cache, offline=True)
+
+        cached = engine.get(f"{self.base_url}/a")
+        uncached = engine.get(f"{self.base_url}/b")
+
+        self.assertEqual(cached.text, "a")
+        self.assertFalse(uncached.ok)
+        self.assertEqual(dict(FixtureSite.hits), {"/a": 1})
+        self.assertEqual((engine.request_attempts, engine.request_failures), (2, 1))
+
+    def test_token_bucket_spaces_requests_after_the_burst(self):
+        now = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(2, burst=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+
+        self.assertEqual(waits, [0.5, 0.5])
+
+
+class CategoryScrapeFetchTests(FixtureSiteTestCase):
+    def test_subcategory_scrape_retries_and_writes_all_categories(self):
+        nav = (
+            '<div class="prodnav"><ul class="breadcrumb"><li><a href="/{0}">{1}</a>'
+            '</li></ul></div><ul class="caps chevron"><li><a href="/{0}/1">{1} One</a>'
+            "</li></ul>"
+        )
+        FixtureSite.pages = {
+            "/bread": nav.format("bread", "Bread"),
+            "/beer": nav.format("beer", "Beer"),
+        }
+        FixtureSite.statuses = {"/beer": [502]}
+
+        with TemporaryDirectory() as temp_dir:
+            input_path = Path(temp_dir) / "main_urls.json"
+            output_path = Path(temp_dir) / "subcategories.json"
+            input_path.write_text(json.dumps(["bread", "beer"]), encoding="utf-8")
+
+            call_command(
+                "scrape_subcategories",
+                input=str(input_path),
+                output=str(output_path),
+                base_url=self.base_url,
+                rate=0,
+                cache_dir=self.cache_dir,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+
+            self.assertEqual(
+                json.loads(output_path.read_text(encoding="utf-8")),
+                {
+                    "Bread": {"Bread One": f"{self.base_url}/bread/1"},
+                    "Beer": {"Beer One": f"{self.base_url}/beer/1"},
+                },
+            )
+        self.assertEqual(FixtureSite.hits["/beer"], 2)
+
+    def test_sub_subcategory_scrape_expands_live_pagination(self):
+        FixtureSite.pages = {
+            "/grocery/11": (
+                '<a href="/grocery/11/1">Chocolate</a>'
+                '<a href="/grocery/11/2">Luxury</a>'
+                '<a href="/bakery/9">Elsewhere</a>'
+            ),
+            "/grocery/11/1": "<p>1 to 20 of 45 Products</p>",
+            "/grocery/11/2": "<p>1 to 3 of 3 Products</p>",
+        }
+        FixtureSite.statuses = {"/grocery/11/1": [503]}
+
+        with TemporaryDirectory() as temp_dir:
+            input_path = Path(temp_dir) / "subcategories.json"
+            output_path = Path(temp_dir) / "sub_subcategories.json"
+            input_path.write_text(
+                json.dumps({"Grocery": {"Biscuits": f"{self.base_url}/grocery/11"}}),
+                encoding="utf-8",
+            )
+
+            call_command(
+                "scrape_sub_subcategories",
+                input=str(input_path),
+                output=str(output_path),
+                base_url=self.base_url,
+                rate=0,
+                cache_dir=self.cache_dir,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+
+            chocolate = f"{self.base_url}/grocery/11/1"
+            self.assertEqual(
+                json.loads(output_path.read_text(encoding="utf-8")),
+                {
+                    "Grocery": {
+                        "Biscuits": {
+                            "Chocolate": [chocolate, f"{chocolate}?s=20", f"{chocolate}?s=40"],
+                            "Luxury": f"{self.base_url}/grocery/11/2",
+                        }
+                    }
+                },
+            )
+
+
+class ProductScrapeFetchTests(FixtureSiteTestCase):
+    LISTING = (
+        "<p>{first} to {last} of {total} Products</p><ul>{items}</ul>"
+    )
+    ITEM = (
+        '<li data-ga-product-id="{pid}" data-ga-product-name="Biscuit {pid}" '
+        'data-ga-product-price="1.50" data-ga-product-category="Grocery&gt;Biscuits" '
+        'data-ga-product-url="/product/{pid}"></li>'
+    )
+    DETAIL = (
+        '<div class="accordionButton">Description</div>'
+        '<div class="accordionContent prodtabcontents">About {pid}</div>'
+        '<table class="prodtable"><tr><th>Vat Rate</th><td>Zero</td></tr></table>'
+    )
+
+    def setUp(self):
+        super().setUp()
+        work_dir = TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.work_dir = Path(work_dir.name)
+        self.output_path = self.work_dir / "products.json"
+
+    def scrape(self, **options):
+        input_path = self.work_dir / "subcategories.json"
+        input_path.write_text(
+            json.dumps({"Grocery": {"Biscuits": f"{self.base_url}/cat/1"}}),
+            encoding="utf-8",
+        )
+        options.setdefault("no_cache", not options.get("offline"))
+        options.setdefault("stdout", StringIO())
+        call_command(
+            "scraper_for_sub_subcategory",
+            input=str(input_path),
+            json_out=str(self.output_path),
+            state=str(self.work_dir / "details.json"),
+            base_url=self.base_url,
+            rate=0,
+            cache_dir=self.cache_dir,
+            stderr=StringIO(),
+            **options,
+        )
+        return json.loads(self.output_path.read_text(encoding="utf-8"))
+
+    def test_details_are_fetched_alongside_listings_in_listing_order(self):
+        item = self.ITEM.format
+        FixtureSite.pages = {
+            "/cat/1": self.LISTING.format(first=1, last=2, total=3, items=item(pid=1) + item(pid=2)),
+            "/cat/1?s=2": self.LISTING.format(first=3, last=3, total=3, items=item(pid=2) + item(pid=3)),
+            **{f"/product/{pid}": self.DETAIL.format(pid=pid) for pid in (1, 2, 3)},
+        }
+        FixtureSite.statuses = {"/product/2": [503]}
+
+        with mock.patch.object(ProductScraperCommand, "DETAIL_BACKLOG", 1):
+            rows = self.scrape()
+
+        self.assertEqual([row["ga_product_id"] for row in rows], ["1", "2", "3"])
+        self.assertEqual([row["list_position"] for row in rows], [1, 2, 3])
+        self.assertEqual(
+            [(row["description"], row["vat_rate"]) for row in rows],
+            [("About 1", "zero"), ("About 2", "zero"), ("About 3", "zero")],
+        )
+        # The repeated product on the second page is not fetched again.
+        self.assertEqual(FixtureSite.hits["/product/2"], 2)
+        self.assertEqual(FixtureSite.hits["/product/3"], 1)
+
+    def test_missing_detail_page_keeps_the_listing_row(self):
+        items = "".join(self.ITEM.format(pid=pid) for pid in range(1, 6))
+        FixtureSite.pages = {
+            "/cat/1": self.LISTING.format(first=1, last=3, total=3, items=items),
+            **{f"/product/{pid}": self.DETAIL.format(pid=pid) for pid in range(2, 6)},
+        }
+
+        rows = self.scrape()
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["name"], "Biscuit 1")
+        self.assertIsNone(rows[0]["description"])
+        self.assertIsNone(rows[0]["vat_rate"])
+        self.assertEqual(rows[1]["description"], "About 2")
+
+    def test_missing_detail_pages_do_not_count_against_the_failure_rate(self):
+        items = "".join(self.ITEM.format(pid=pid) for pid in range(1, 6))
+        FixtureSite.pages = {"/cat/1": self.LISTING.format(first=1, last=5, total=5, items=items)}
+        stdout = StringIO()
+
+        rows = self.scrape(stdout=stdout)
+
+        self.assertEqual(len(rows), 5)
+        self.assertIn("5 detail pages, 5 failed", stdout.getvalue())
+
+    def test_offline_rerun_replays_the_previous_scrape(self):
+        items = "".join(self.ITEM.format(pid=pid) for pid in (1, 2))
+        FixtureSite.pages = {
+            "/cat/1": self.LISTING.format(first=1, last=2, total=2, items=items),
+            **{f"/product/{pid}": self.DETAIL.format(pid=pid) for pid in (1, 2)},
+        }
+        online = self.scrape(no_cache=False, detail_refresh_days=0)
+        FixtureSite.pages = {}
+        requests_made = sum(FixtureSite.hits.values())
+
+        offline = self.scrape(offline=True, detail_refresh_days=0)
+
+        self.assertEqual(offline, online)
+        self.assertEqual(sum(FixtureSite.hits.values()), requests_made)
+
+    def three_pages(self):
+        item = self.ITEM.format
+        FixtureSite.pages = {
+            "/cat/1": self.LISTING.format(first=1, last=2, total=5, items=item(pid=1) + item(pid=2)),
+            "/cat/1?s=2": self.LISTING.format(first=3, last=4, total=5, items=item(pid=3) + item(pid=4)),
+            "/cat/1?s=4": self.LISTING.format(first=5, last=5, total=5, items=item(pid=5)),
+            **{f"/product/{pid}": self.DETAIL.format(pid=pid) for pid in range(1, 6)},
+        }
+
+    def detail_hits(self):
+        return {pid: FixtureSite.hits[f"/product/{pid}"] for pid in range(1, 6)}
+
+    def test_unchanged_products_reuse_stored_details(self):
+        self.three_pages()
+        first = self.scrape()
+        FixtureSite.pages["/product/1"] = self.DETAIL.format(pid="one")
+        FixtureSite.pages["/cat/1"] = FixtureSite.pages["/cat/1"].replace(
+            'data-ga-product-id="2" data-ga-product-name="Biscuit 2" '
+            'data-ga-product-price="1.50"',
+            'data-ga-product-id="2" data-ga-product-name="Biscuit 2" '
+            'data-ga-product-price="1.75"',
+        )
+
+        second = self.scrape()
+
+        self.assertEqual(self.detail_hits(), {1: 1, 2: 2, 3: 1, 4: 1, 5: 1})
+        # Product 1's page changed, but its listing did not: details are kept.
+        self.assertEqual(second[0]["description"], "About 1")
+        self.assertEqual(second[1]["price"], 1.75)
+        self.assertEqual(
+            [row["description"] for row in second],
+            [row["description"] for row in first],
+        )
+        state = json.loads((self.work_dir / "details.json").read_text(encoding="utf-8"))
+        self.assertEqual(sorted(state), ["1", "2", "3", "4", "5"])
+
+    def test_details_are_refreshed_after_the_refresh_age(self):
+        self.three_pages()
+        self.scrape()
+
+        self.scrape(detail_refresh_days=0)
+
+        self.assertEqual(self.detail_hits(), {pid: 2 for pid in range(1, 6)})
+
+    def test_interrupted_run_resumes_from_its_checkpoint(self):
+        self.three_pages()
+        write_checkpoint = ProductScraperCommand._write_checkpoint
+
+        def crash_after_first_checkpoint(command, *args):
+            write_checkpoint(command, *args)
+            raise KeyboardInterrupt
+
+        with mock.patch.object(ProductScraperCommand, "CHECKPOINT_PAGES", 1):
+            with mock.patch.object(
+                ProductScraperCommand, "_write_checkpoint", crash_after_first_checkpoint
+            ):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.scrape()
+            self.assertFalse(self.output_path.exists())
+            stdout = StringIO()
+            rows = self.scrape(stdout=stdout)
+
+        self.assertIn("Resuming from checkpoint: 1 of 3 listing pages done", stdout.getvalue())
+        self.assertEqual([row["ga_product_id"] for row in rows], ["1", "2", "3", "4", "5"])
+        self.assertEqual([row["list_position"] for row in rows], [1, 2, 3, 4, 5])
+        self.assertTrue(all(row["description"] for row in rows))
+        # The first listing page was only re-read for pagination discovery.
+        self.assertEqual(FixtureSite.hits["/cat/1"], 3)
+        self.assertFalse(self.output_path.with_suffix(".json.checkpoint").exists())
+
+
+    def test_checkpoints_append_only_new_rows_and_details(self):
+        self.three_pages()
+        checkpoint_path = self.output_path.with_suffix(".json.checkpoint")
+        journal_path = self.work_dir / "details.json.journal"
+        write_checkpoint = ProductScraperCommand._write_checkpoint
+        snapshots = []
+
+        def crash_after_second_checkpoint(command, *args):
+            write_checkpoint(command, *args)
+            snapshots.append(
+                (
+                    [json.loads(line) for line in checkpoint_path.read_text(encoding="utf-8").splitlines()],
+                    [json.loads(line)[0] for line in journal_path.read_text(encoding="utf-8").splitlines()],
+                )
+            )
+            if len(snapshots) == 2:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(ProductScraperCommand, "CHECKPOINT_PAGES", 1), mock.patch.object(
+            ProductScraperCommand, "DETAIL_BACKLOG", 1
+        ), mock.patch.object(ProductScraperCommand, "_write_checkpoint", crash_after_second_checkpoint):
+            with self.assertRaises(KeyboardInterrupt):
+                self.scrape()
+
+        lines, journal = snapshots[-1]
+        self.assertEqual(lines[0], {"pages": mock.ANY})
+        self.assertEqual(
+            [[row["ga_product_id"] for row in line["rows"]] for line in lines[1:]],
+            [["1", "2"], ["3", "4"]],
+        )
+        # Each detail entry is journalled once, not the whole state every time.
+        self.assertEqual(len(journal), len(set(journal)))
+        self.assertFalse(journal_path.exists())
+
+        with mock.patch.object(ProductScraperCommand, "CHECKPOINT_PAGES", 1):
+            stdout = StringIO()
+            rows = self.scrape(stdout=stdout)
+        self.assertIn("Resuming from checkpoint: 2 of 3 listing pages done, 4 products", stdout.getvalue())
+        self.assertEqual([row["ga_product_id"] for row in rows], ["1", "2", "3", "4", "5"])
+        self.assertTrue(all(row["description"] for row in rows))
+
+
 class BasketPricingSettingsTests(TestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(
@@ -256,3 +770,120 @@ class BasketPricingSettingsTests(TestCase):
         )
 
         self.assertEqual(display_rsp(product), Decimal('3.50'))
+
+
+class ItemsToOrderReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='buyer',
+            password='test-pass-123',
+            is_staff=True,
+        )
+        self.client.force_login(self.user)
+        self.standard = All_Products.objects.create(
+            ga_product_id='ga-ito-1',
+            name='A Standard Product',
+            price=Decimal('10.00'),
+            rsp=Decimal('18.00'),
+            vat_rate='standard',
+            list_position=1,
+            url='https://example.com/products/ito-1',
+        )
+        self.zero_rated = All_Products.objects.create(
+            ga_product_id='ga-ito-2',
+            name='B Zero Rated Product',
+            price=Decimal('2.00'),
+            rsp=None,
+            vat_rate='zero',
+            list_position=2,
+            url='https://example.com/products/ito-2',
+        )
+        for quantity in (1, 2):
+            order = Order.objects.create(user=self.user, status='paid')
+            OrderItem.objects.create(order=order, product=self.standard, quantity=quantity, price=Decimal('18.00'))
+            OrderItem.objects.create(order=order, product=self.zero_rated, quantity=3, price=Decimal('2.60'))
+        pending = Order.objects.create(user=self.user, status='pending')
+        OrderItem.objects.create(order=pending, product=self.standard, quantity=50, price=Decimal('18.00'))
+
+    def test_report_computes_rows_and_totals_in_sql(self):
+        report = build_items_to_order_report()
+        standard_row, zero_row = report['items']
+
+        self.assertEqual(standard_row['total_qty'], 3)
+        self.assertEqual(standard_row['orders_count'], 2)
+        self.assertEqual(standard_row['gross_price'], Decimal('12.00'))
+        self.assertEqual(standard_row['rsp_net'], Decimal('15.00'))
+        self.assertEqual(standard_row['net_profit_total'], Decimal('15.00'))
+        self.assertEqual(standard_row['vat_rate_display'], 'Standard')
+        self.assertEqual(zero_row['display_rsp'], Decimal('2.60'))
+        self.assertEqual(zero_row['gross_price'], Decimal('2.00'))
+
+        totals = report['totals']
+        self.assertEqual(totals['grand_qty'], 9)
+        self.assertEqual(totals['sum_cost_net'], Decimal('42.00'))
+        self.assertEqual(totals['sum_cost_gross'], Decimal('48.00'))
+        self.assertEqual(totals['sum_rsp_gross'], Decimal('69.60'))
+
+    def test_report_is_cached_until_paid_orders_change(self):
+        build_items_to_order_report()
+        with self.assertNumQueries(2):
+            build_items_to_order_report()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.user, status='paid')
+            OrderItem.objects.create(order=order, product=self.standard, quantity=4, price=Decimal('18.00'))
+
+        report = build_items_to_order_report()
+        self.assertEqual(report['items'][0]['total_qty'], 7)
+
+    def test_version_only_moves_when_paid_demand_changes(self):
+        version = PaidOrdersVersion.current()
+        unordered = All_Products.objects.create(
+            ga_product_id='ga-ito-3',
+            name='C Unordered Product',
+            price=Decimal('1.00'),
+            list_position=3,
+            url='https://example.com/products/ito-3',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            cart = Order.objects.create(user=self.user, status='pending')
+            OrderItem.objects.create(order=cart, product=self.standard, quantity=1, price=Decimal('18.00'))
+            unordered.price = Decimal('1.50')
+            unordered.save()
+            self.standard.list_position = 9
+            self.standard.save(update_fields=['list_position'])
+        self.assertEqual(PaidOrdersVersion.current(), version)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            cart.status = 'paid'
+            cart.save()
+        self.assertEqual(callbacks.count(PaidOrdersVersion.bump), 1)
+        self.assertEqual(PaidOrdersVersion.current(), version + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.standard.price = Decimal('11.00')
+            self.standard.save()
+        self.assertEqual(PaidOrdersVersion.current(), version + 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cart.status = 'delivered'
+            cart.save(update_fields=['status'])
+            cart.save(update_fields=['status'])
+        self.assertEqual(PaidOrdersVersion.current(), version + 3)
+
+    def test_bulk_completion_bumps_the_version_after_commit(self):
+        version = PaidOrdersVersion.current()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('_product_management:mark_all_orders_completed'))
+            self.assertEqual(PaidOrdersVersion.current(), version)
+        self.assertIn(PaidOrdersVersion.bump, callbacks)
+
+    def test_items_to_order_view_paginates_orders(self):
+        response = self.client.get(reverse('_product_management:items_to_order'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['grand_qty'], 9)
+        self.assertEqual(len(response.context['items_grouped_by_order']), 2)
+        self.assertEqual(response.context['items_grouped_by_order'][0]['total_qty'], 5)
+        self.assertFalse(response.context['is_paginated'])
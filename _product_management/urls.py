@@ -27,6 +27,10 @@ urlpatterns = [
     path("orders/<int:order_id>/process/", views.mark_order_processed, name="mark_order_processed"),
     path("items-to-order/", views.items_to_order, name="items_to_order"),
     path("items-to-order.pdf", views.items_to_order_pdf, name="items_to_order_pdf"),
+    path("purchase-orders/", views.purchase_orders, name="purchase_orders"),
+    path("purchase-orders/generate/", views.generate_purchase_orders_view, name="generate_purchase_orders"),
+    path("purchase-orders/<int:po_id>.csv", views.purchase_order_csv, name="purchase_order_csv"),
+    path("purchase-orders/<int:po_id>.pdf", views.purchase_order_pdf, name="purchase_order_pdf"),
     path("orders/<int:order_id>/delivery/", views.set_delivery_slot, name="set_delivery_slot"),
     path("delivery-slot-settings/", views.delivery_slot_settings, name="delivery_slot_settings"),
     path("basket-pricing-settings/", views.basket_pricing_settings, name="basket_pricing_settings"),
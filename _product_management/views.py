@@ -10,19 +10,29 @@ from django.conf import settings
 from django.contrib.staticfiles import finders
 from xhtml2pdf import pisa
 from django.contrib.auth.decorators import user_passes_test
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import transaction
 from django.db.models import Count, Sum, F, DecimalField, Value, ExpressionWrapper, Q, Max, Case, When, Prefetch
 from django.db.models.functions import Coalesce, Cast
 from datetime import date, timedelta
 from decimal import Decimal
 from django.views.decorators.http import require_http_methods, require_POST
 import threading
-from _analytics.tracking import track_event
+from _analytics.tracking import track_events_bulk
 from _catalog.models import All_Products, HomeCategoryTile, HomeValuePillar, CategoryNodeSetting
-from .models import LeafletCopy, SubcategoryPipelineRun, DeliverySlotSettings, BasketPricingSettings
+from .models import LeafletCopy, SubcategoryPipelineRun, DeliverySlotSettings, BasketPricingSettings, PaidOrdersVersion
 from .constants import LEAFLET_TEXT_DEFAULTS
 from .rsp import build_rsp_expression, calculate_rsp_from_cost
+from .reports import ITEMS_TO_ORDER_STATUSES, build_items_to_order_report
 from _orders.models import Order, OrderItem
 from _orders.notifications import send_paid_order_notification
+from _suppliers.models import PurchaseOrder
+from _suppliers.purchasing import (
+    PURCHASE_DEMAND_STATUSES,
+    generate_purchase_orders,
+    purchase_order_lines,
+    write_purchase_order_csv,
+)
 from django.contrib import messages
 
 import ipaddress
@@ -884,6 +894,7 @@ def mark_all_orders_completed(request):
     qs = Order.objects.filter(status='paid')
     updated = qs.update(status='delivered')
     if updated:
+        transaction.on_commit(PaidOrdersVersion.bump)
         messages.success(request, f'Marked {updated} order(s) as completed.')
     else:
         messages.info(request, 'No active orders to complete.')
@@ -924,34 +935,35 @@ def mark_order_paid(request, order_id: int):
     if order.status in ('pending', 'processed'):
         order.status = 'paid'
         order.save(update_fields=['status'])
-        track_event(
-            request,
-            'paid_order',
-            value=order.total,
-            properties={
-                'order_id': order.id,
-                'source': 'staff_mark_paid',
-            },
-            path=request.path,
-        )
-        for item in order.items.select_related('product'):
-            track_event(
-                request,
-                'order_item_paid',
-                label=item.product.name,
-                value=item.quantity,
-                properties={
+        paid_events = [
+            {
+                'event_type': 'paid_order',
+                'value': order.total,
+                'properties': {
                     'order_id': order.id,
-                    'product_id': item.product_id,
-                    'quantity': item.quantity,
-                    'line_total': str(item.price * item.quantity),
-                    'main_category': item.product.main_category,
-                    'sub_category': item.product.sub_category,
-                    'sub_subcategory': item.product.sub_subcategory,
                     'source': 'staff_mark_paid',
                 },
-                path=request.path,
+            }
+        ]
+        for item in order.items.select_related('product'):
+            paid_events.append(
+                {
+                    'event_type': 'order_item_paid',
+                    'label': item.product.name,
+                    'value': item.quantity,
+                    'properties': {
+                        'order_id': order.id,
+                        'product_id': item.product_id,
+                        'quantity': item.quantity,
+                        'line_total': str(item.price * item.quantity),
+                        'main_category': item.product.main_category,
+                        'sub_category': item.product.sub_category,
+                        'sub_subcategory': item.product.sub_subcategory,
+                        'source': 'staff_mark_paid',
+                    },
+                }
             )
+        track_events_bulk(request, paid_events, path=request.path)
         send_paid_order_notification(order)
         messages.success(request, f'Order #{order.id} moved back to Paid.')
     else:
@@ -994,167 +1006,37 @@ def mark_order_processed(request, order_id: int):
 
 @staff_or_superuser_required
 def items_to_order(request):
-    active_statuses = ('paid',)
-    items_qs = (
-        OrderItem.objects
-        .filter(order__status__in=active_statuses)
-        .values(
-            'product_id',
-            'product__name',
-            'product__sku',
-            'product__ga_product_id',
-            'product__variant',
-            'product__price',
-            'product__rsp',
-            'product__vat_rate',
-        )
-        .annotate(
-            total_qty=Sum('quantity'),
-            orders_count=Count('order', distinct=True),
-        )
-        .order_by('product__name')
-    )
-    # Enrich items to expose the displayed RSP used across reporting.
-    items = list(items_qs)
-    if items:
-        prod_ids = [it['product_id'] for it in items]
-        products_map = {p.id: p for p in All_Products.objects.filter(id__in=prod_ids)}
-        # Ensure each product has an RSP when DB did not provide it (None or 0)
-        try:
-            for _p in products_map.values():
-                try:
-                    cur = getattr(_p, 'rsp', None)
-                    if cur is None or Decimal(str(cur)) == Decimal('0'):
-                        price = getattr(_p, 'price', None)
-                        if price is not None:
-                            _p.rsp = calculate_rsp_from_cost(price)
-                except Exception:
-                    continue
-        except Exception:
-            pass
-        # Running totals built from the same logic used for per-row display
-        sum_cost_net = Decimal('0')
-        sum_cost_gross = Decimal('0')
-        sum_rsp_gross = Decimal('0')
-        sum_rsp_net = Decimal('0')
-        sum_net_profit = Decimal('0')
-
-        for it in items:
-            p = products_map.get(it['product_id'])
-            display_rsp = None
-            if p and p.rsp is not None:
-                try:
-                    display_rsp = p.bulk_total_price if p.is_bulk else p.rsp
-                except Exception:
-                    display_rsp = p.rsp
-            it['display_rsp'] = display_rsp
-            if p:
-                try:
-                    it['vat_rate_display'] = p.get_vat_rate_display()
-                except Exception:
-                    it['vat_rate_display'] = it.get('product__vat_rate')
-            # Compute per-item gross supplier cost (price incl. VAT when standard)
-            try:
-                if p and p.price is not None:
-                    factor = Decimal('1.20') if getattr(p, 'vat_rate', None) == 'standard' else Decimal('1.00')
-                    it['gross_price'] = p.price * factor
-                else:
-                    it['gross_price'] = None
-            except Exception:
-                it['gross_price'] = None
-            # Compute RSP Net = RSP * 5/6 (remove 20% VAT); respect bulk display_rsp when present
-            try:
-                gross_rsp = display_rsp if display_rsp is not None else (p.rsp if p and p.rsp is not None else None)
-                if gross_rsp is not None:
-                    it['rsp_net'] = (gross_rsp * Decimal('5')) / Decimal('6')
-                else:
-                    it['rsp_net'] = None
-            except Exception:
-                it['rsp_net'] = None
-            # Compute Net Profit per item = RSP Net - Cost (price)
-            try:
-                if p and p.price is not None and it.get('rsp_net') is not None:
-                    it['net_profit'] = it['rsp_net'] - p.price
-                else:
-                    it['net_profit'] = None
-            except Exception:
-                it['net_profit'] = None
+    report = build_items_to_order_report()
+    items = report['items']
+    totals_map = report['totals']
 
-            # Accumulate totals using the stored per-product pricing.
-            try:
-                qty = int(it.get('total_qty') or 0)
-            except Exception:
-                qty = 0
-            # Per-row displayed net profit should reflect quantity
-            try:
-                if it.get('net_profit') is not None and qty:
-                    # Displayed net profit multiplied by total qty (per requirements)
-                    it['net_profit_total'] = it['net_profit'] * Decimal(qty)
-                else:
-                    it['net_profit_total'] = it.get('net_profit')
-            except Exception:
-                it['net_profit_total'] = it.get('net_profit')
-            # Cost (net) per ordered product line
-            price_net = p.price if (p and p.price is not None) else Decimal('0')
-            cost_net_line = price_net * Decimal(qty)
-
-            # Cost (gross) adds VAT for 'standard' only
-            if p and getattr(p, 'vat_rate', None) == 'standard':
-                cost_gross_line = cost_net_line * Decimal('1.20')
-            else:
-                cost_gross_line = cost_net_line
-
-            # RSP gross per displayed logic
-            rsp_gross_unit = None
-            if display_rsp is not None:
-                rsp_gross_unit = Decimal(display_rsp)
-            elif p and p.rsp is not None:
-                rsp_gross_unit = Decimal(p.rsp)
-            else:
-                rsp_gross_unit = Decimal('0')
-            rsp_gross_line = rsp_gross_unit * Decimal(qty)
-            rsp_net_line = (rsp_gross_line * Decimal('5')) / Decimal('6') if rsp_gross_line else Decimal('0')
-            net_profit_line = rsp_net_line - cost_net_line
-
-            sum_cost_net += cost_net_line
-            sum_cost_gross += cost_gross_line
-            sum_rsp_gross += rsp_gross_line
-            sum_rsp_net += rsp_net_line
-            sum_net_profit += net_profit_line
-
-        # Stash totals on request cycle
-        request._ito_totals = {
-            'sum_cost_net': sum_cost_net,
-            'sum_cost_gross': sum_cost_gross,
-            'sum_rsp_gross': sum_rsp_gross,
-            'sum_rsp_net': sum_rsp_net,
-            'sum_net_profit': sum_net_profit,
-        }
-    # Compute aggregate totals using the sums above
     VAT_RATE = Decimal('0.20')
-    totals_map = getattr(request, '_ito_totals', None) or {}
-    total_purchase = totals_map.get('sum_cost_net') or Decimal('0')
-    total_price = totals_map.get('sum_cost_gross') or Decimal('0')
-    total_rsp = totals_map.get('sum_rsp_gross') or Decimal('0')
-    total_rsp_net = totals_map.get('sum_rsp_net') or Decimal('0')
-    total_net_profit = totals_map.get('sum_net_profit') or Decimal('0')
-    # VAT contents from gross
-    def vat_content(gross):
-        try:
-            gross = gross or Decimal('0')
-            return (gross * VAT_RATE / (Decimal('1.00') + VAT_RATE))
-        except Exception:
-            return Decimal('0')
+    total_purchase = totals_map['sum_cost_net']
+    total_price = totals_map['sum_cost_gross']
+    total_rsp = totals_map['sum_rsp_gross']
+    total_rsp_net = totals_map['sum_rsp_net']
+    total_net_profit = totals_map['sum_net_profit']
     # Purchase VAT content only for standard-rated items approximated from difference gross - net
     vat_purchase = total_price - total_purchase
-    vat_sale = vat_content(total_rsp)
+    vat_sale = total_rsp * VAT_RATE / (Decimal('1.00') + VAT_RATE)
     gross_profit = total_rsp - total_purchase
     net_profit = total_net_profit
-    grand_qty = sum(int(it.get('total_qty') or 0) for it in items) if items else 0
-    # Additional section data: items grouped by each paid order
+    grand_qty = totals_map['grand_qty']
+
+    # Additional section data: items grouped by each paid order, one page at a time
+    dec = DecimalField(max_digits=12, decimal_places=2)
     paid_orders = (
         Order.objects
-        .filter(status__in=active_statuses)
+        .filter(status__in=ITEMS_TO_ORDER_STATUSES)
+        .annotate(
+            items_count=Count('items'),
+            total_qty=Coalesce(Sum('items__quantity'), 0),
+            total_amount=Coalesce(
+                Sum(F('items__price') * Cast('items__quantity', output_field=dec)),
+                Value(0, output_field=dec),
+            ),
+        )
+        .filter(items_count__gt=0)
         .select_related('user')
         .prefetch_related(
             Prefetch(
@@ -1164,17 +1046,21 @@ def items_to_order(request):
         )
         .order_by('-created_at', '-id')
     )
+    paginator = Paginator(paid_orders, 25)
+    page = request.GET.get('page')
+    try:
+        page_obj = paginator.page(page)
+    except PageNotAnInteger:
+        page_obj = paginator.page(1)
+    except EmptyPage:
+        page_obj = paginator.page(paginator.num_pages)
+
     items_grouped_by_order = []
-    for order in paid_orders:
+    for order in page_obj.object_list:
         rows = []
-        total_qty = 0
-        total_amount = Decimal('0')
         for oi in order.items.all():
             qty = int(oi.quantity or 0)
             unit_price = oi.price if oi.price is not None else Decimal('0')
-            line_total = unit_price * qty
-            total_qty += qty
-            total_amount += line_total
             p = oi.product
             rows.append({
                 'product_name': p.name,
@@ -1183,15 +1069,14 @@ def items_to_order(request):
                 'ga_product_id': p.ga_product_id or '-',
                 'qty': qty,
                 'unit_price': unit_price,
-                'line_total': line_total,
-            })
-        if rows:
-            items_grouped_by_order.append({
-                'order': order,
-                'rows': rows,
-                'total_qty': total_qty,
-                'total_amount': total_amount,
+                'line_total': unit_price * qty,
             })
+        items_grouped_by_order.append({
+            'order': order,
+            'rows': rows,
+            'total_qty': order.total_qty,
+            'total_amount': order.total_amount,
+        })
 
     context = {
         'items': items,
@@ -1207,6 +1092,9 @@ def items_to_order(request):
         'total_net_profit': total_net_profit,
         'grand_qty': grand_qty,
         'items_grouped_by_order': items_grouped_by_order,
+        'page_obj': page_obj,
+        'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
     }
     return render(request, '_product_management/items_to_order.html', context)
 
@@ -1251,6 +1139,95 @@ def items_to_order_pdf(request):
     return resp
 
 
+@staff_or_superuser_required
+def purchase_orders(request):
+    orders = (
+        PurchaseOrder.objects
+        .select_related('supplier', 'created_by')
+        .annotate(
+            lines_count=Count('lines', distinct=True),
+            total_qty=Coalesce(Sum('lines__quantity'), 0),
+        )
+        .order_by('-created_at', '-id')
+    )
+    paginator = Paginator(orders, 25)
+    page = request.GET.get('page')
+    try:
+        page_obj = paginator.page(page)
+    except PageNotAnInteger:
+        page_obj = paginator.page(1)
+    except EmptyPage:
+        page_obj = paginator.page(paginator.num_pages)
+    unmapped_items = (
+        OrderItem.objects
+        .filter(
+            order__status__in=PURCHASE_DEMAND_STATUSES,
+            supplier_completed=False,
+            product__supplier_link__isnull=True,
+        )
+        .values('product_id')
+        .distinct()
+        .count()
+    )
+    ctx = {
+        'purchase_orders': page_obj.object_list,
+        'page_obj': page_obj,
+        'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
+        'unmapped_products_count': unmapped_items,
+    }
+    return render(request, '_product_management/purchase_orders.html', ctx)
+
+
+@staff_or_superuser_required
+@require_POST
+def generate_purchase_orders_view(request):
+    created = generate_purchase_orders(user=request.user)
+    if created:
+        messages.success(request, f'Created {len(created)} purchase order(s).')
+    else:
+        messages.info(request, 'No open paid demand with a mapped supplier.')
+    return redirect('_product_management:purchase_orders')
+
+
+@staff_or_superuser_required
+def purchase_order_csv(request, po_id: int):
+    purchase_order = get_object_or_404(PurchaseOrder, id=po_id)
+    resp = HttpResponse(content_type='text/csv')
+    resp['Content-Disposition'] = f'attachment; filename=purchase-order-{purchase_order.id}.csv'
+    write_purchase_order_csv(purchase_order, resp)
+    return resp
+
+
+@staff_or_superuser_required
+def purchase_order_pdf(request, po_id: int):
+    purchase_order = get_object_or_404(PurchaseOrder.objects.select_related('supplier'), id=po_id)
+    lines = list(purchase_order_lines(purchase_order))
+    template = get_template('_product_management/purchase_order_pdf.html')
+    html = template.render({
+        'purchase_order': purchase_order,
+        'lines': lines,
+        'total_qty': sum(line.quantity for line in lines),
+        'total_cost': sum((line.line_total for line in lines), Decimal('0.00')),
+    })
+    filename = f'purchase-order-{purchase_order.id}.pdf'
+
+    if _choose_renderer() == 'playwright':
+        try:
+            pdf_bytes = _render_pdf_playwright(html, request)
+            resp = HttpResponse(pdf_bytes, content_type='application/pdf')
+            resp['Content-Disposition'] = f'attachment; filename={filename}'
+            return resp
+        except Exception:
+            pass
+
+    out = BytesIO()
+    pisa.CreatePDF(html, dest=out, link_callback=_static_link_callback)
+    resp = HttpResponse(out.getvalue(), content_type='application/pdf')
+    resp['Content-Disposition'] = f'attachment; filename={filename}'
+    return resp
+
+
 @staff_or_superuser_required
 def set_delivery_slot(request, order_id: int):
     order = get_object_or_404(Order.objects.select_related('user'), id=order_id)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Supplier
+from .models import Supplier, SupplierProduct, PurchaseOrder, PurchaseOrderLine
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
@@ -15,4 +15,29 @@ class SupplierAdmin(admin.ModelAdmin):
     )
     list_filter = ('is_active', 'city')
     search_fields = ('company_name', 'company_id', 'contact_person', 'email', 'phone')
-    ordering = ('company_name',)
\ No newline at end of file
+    ordering = ('company_name',)
+
+
+@admin.register(SupplierProduct)
+class SupplierProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'supplier', 'supplier_sku')
+    list_filter = ('supplier',)
+    search_fields = ('product__name', 'product__sku', 'supplier_sku', 'supplier__company_name')
+    raw_id_fields = ('product',)
+    list_select_related = ('product', 'supplier')
+
+
+class PurchaseOrderLineInline(admin.TabularInline):
+    model = PurchaseOrderLine
+    extra = 0
+    raw_id_fields = ('product',)
+    readonly_fields = ('orders_count',)
+
+
+@admin.register(PurchaseOrder)
+class PurchaseOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'supplier', 'status', 'created_by', 'created_at')
+    list_filter = ('status', 'supplier')
+    search_fields = ('supplier__company_name', 'notes')
+    list_select_related = ('supplier', 'created_by')
+    inlines = [PurchaseOrderLineInline]
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.db import models
 
+from _catalog.models import All_Products
+
+
 class Supplier(models.Model):
     company_name = models.CharField(max_length=255)
     company_id = models.CharField(max_length=100, unique=True)
@@ -22,6 +26,64 @@ class Supplier(models.Model):
 
     def __str__(self):
         return self.company_name
-    
 
 
+class SupplierProduct(models.Model):
+    """Which supplier a catalog product is bought from."""
+
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='products')
+    product = models.OneToOneField(
+        All_Products,
+        on_delete=models.CASCADE,
+        related_name='supplier_link',
+    )
+    supplier_sku = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return f"{self.product} <- {self.supplier}"
+
+
+class PurchaseOrder(models.Model):
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('sent', 'Sent'),
+        ('received', 'Received'),
+        ('canceled', 'Canceled'),
+    ]
+
+    supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT, related_name='purchase_orders')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', db_index=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='purchase_orders',
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    notes = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ('-created_at', '-id')
+
+    def __str__(self):
+        return f"PO #{self.pk} ({self.supplier})"
+
+
+class PurchaseOrderLine(models.Model):
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(All_Products, on_delete=models.PROTECT, related_name='purchase_order_lines')
+    supplier_sku = models.CharField(max_length=100, blank=True)
+    quantity = models.PositiveIntegerField()
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    orders_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('product__name',)
+
+    @property
+    def line_total(self):
+        return self.unit_cost * self.quantity
+
+    def __str__(self):
+        return f"PO #{self.purchase_order_id} | {self.product} x {self.quantity}"
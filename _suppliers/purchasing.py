@@ -0,0 +1,135 @@
+import csv
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from _orders.models import Order, OrderItem
+from _product_management.models import PaidOrdersVersion
+
+from .models import PurchaseOrder, PurchaseOrderLine
+
+
+PURCHASE_DEMAND_STATUSES = ('paid',)
+
+
+def _locked_open_demand(statuses):
+    return list(
+        OrderItem.objects
+        .select_for_update(of=('self',))
+        .filter(
+            order__status__in=statuses,
+            supplier_completed=False,
+            product__supplier_link__isnull=False,
+        )
+        .order_by('pk')
+        .values_list(
+            'pk',
+            'order_id',
+            'product_id',
+            'quantity',
+            'product__price',
+            'product__supplier_link__supplier_id',
+            'product__supplier_link__supplier_sku',
+        )
+    )
+
+
+def generate_purchase_orders(*, user=None, statuses=PURCHASE_DEMAND_STATUSES):
+    """
+    Turn open paid demand into one draft purchase order per supplier.
+
+    Items are read once under a row lock, grouped per supplier and product,
+    written with bulk inserts, then marked supplier_completed with one UPDATE
+    per supplier so the per-item post_save handlers do not fire. Orders whose
+    items are now all completed move to processed, matching what the
+    post_save handler does for single items. Products without a supplier
+    mapping are left untouched.
+    """
+    with transaction.atomic():
+        demand = _locked_open_demand(statuses)
+        if not demand:
+            return []
+
+        # supplier_id -> product_id -> aggregated line
+        by_supplier = defaultdict(dict)
+        item_ids_by_supplier = defaultdict(list)
+        order_ids = set()
+        for item_id, order_id, product_id, quantity, cost, supplier_id, supplier_sku in demand:
+            line = by_supplier[supplier_id].setdefault(
+                product_id,
+                {
+                    'quantity': 0,
+                    'unit_cost': cost if cost is not None else Decimal('0.00'),
+                    'supplier_sku': supplier_sku or '',
+                    'order_ids': set(),
+                },
+            )
+            line['quantity'] += int(quantity or 0)
+            line['order_ids'].add(order_id)
+            item_ids_by_supplier[supplier_id].append(item_id)
+            order_ids.add(order_id)
+
+        supplier_ids = sorted(by_supplier)
+        purchase_orders = PurchaseOrder.objects.bulk_create(
+            [PurchaseOrder(supplier_id=supplier_id, created_by=user) for supplier_id in supplier_ids]
+        )
+        po_by_supplier = dict(zip(supplier_ids, purchase_orders))
+
+        PurchaseOrderLine.objects.bulk_create(
+            [
+                PurchaseOrderLine(
+                    purchase_order=po_by_supplier[supplier_id],
+                    product_id=product_id,
+                    supplier_sku=line['supplier_sku'],
+                    quantity=line['quantity'],
+                    unit_cost=line['unit_cost'],
+                    orders_count=len(line['order_ids']),
+                )
+                for supplier_id in supplier_ids
+                for product_id, line in by_supplier[supplier_id].items()
+            ]
+        )
+
+        for supplier_id, item_ids in item_ids_by_supplier.items():
+            OrderItem.objects.filter(pk__in=item_ids).update(
+                supplier_completed=True,
+                purchase_order=po_by_supplier[supplier_id],
+            )
+
+        (
+            Order.objects
+            .filter(pk__in=order_ids)
+            .exclude(status='processed')
+            .exclude(items__supplier_completed=False)
+            .update(status='processed')
+        )
+
+        transaction.on_commit(PaidOrdersVersion.bump)
+
+    return purchase_orders
+
+
+PURCHASE_ORDER_CSV_HEADER = ['Product', 'Variant', 'SKU', 'Supplier SKU', 'GA Product ID', 'Quantity', 'Unit Cost', 'Line Total', 'Orders']
+
+
+def purchase_order_lines(purchase_order):
+    return purchase_order.lines.select_related('product').order_by('product__name')
+
+
+def write_purchase_order_csv(purchase_order, stream):
+    writer = csv.writer(stream)
+    writer.writerow(PURCHASE_ORDER_CSV_HEADER)
+    for line in purchase_order_lines(purchase_order):
+        product = line.product
+        writer.writerow([
+            product.name,
+            product.variant or '',
+            product.sku or '',
+            line.supplier_sku,
+            product.ga_product_id,
+            line.quantity,
+            f"{line.unit_cost:.2f}",
+            f"{line.line_total:.2f}",
+            line.orders_count,
+        ])
@@ -1,3 +1,139 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+
+from _catalog.models import All_Products
+from _orders.models import Order, OrderItem
+from _product_management.models import PaidOrdersVersion
+
+from .models import PurchaseOrder, Supplier, SupplierProduct
+from .purchasing import generate_purchase_orders, write_purchase_order_csv
+
+
+def _supplier(company_id, name):
+    return Supplier.objects.create(
+        company_name=name,
+        company_id=company_id,
+        email=f'{company_id}@example.com',
+        phone='0123456789',
+        house_number='1',
+        street_name1='High Street',
+        city='London',
+        postal_code='E1 1AA',
+        bank_name='Bank',
+        bank_account='12345678',
+        sort_code='123456',
+        VAT_number='GB123',
+    )
+
+
+def _product(ga_id, name, price):
+    return All_Products.objects.create(
+        ga_product_id=ga_id,
+        name=name,
+        price=Decimal(price),
+        list_position=1,
+        url=f'https://example.com/products/{ga_id}',
+    )
+
+
+class GeneratePurchaseOrdersTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='buyer',
+            password='test-pass-123',
+            is_staff=True,
+        )
+        self.bestway = _supplier('bw', 'Bestway')
+        self.booker = _supplier('bk', 'Booker')
+        self.milk = _product('ga-po-1', 'Milk', '1.10')
+        self.bread = _product('ga-po-2', 'Bread', '0.90')
+        self.eggs = _product('ga-po-3', 'Eggs', '2.00')
+        self.unmapped = _product('ga-po-4', 'Unmapped', '3.00')
+        SupplierProduct.objects.create(supplier=self.bestway, product=self.milk, supplier_sku='BW-MILK')
+        SupplierProduct.objects.create(supplier=self.bestway, product=self.bread, supplier_sku='BW-BREAD')
+        SupplierProduct.objects.create(supplier=self.booker, product=self.eggs, supplier_sku='BK-EGGS')
+
+        # Run the paid-demand version bumps, as a committed checkout would.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = Order.objects.create(user=self.user, status='paid')
+            OrderItem.objects.create(order=self.first, product=self.milk, quantity=2, price=Decimal('1.50'))
+            OrderItem.objects.create(order=self.first, product=self.eggs, quantity=1, price=Decimal('2.80'))
+            self.second = Order.objects.create(user=self.user, status='paid')
+            OrderItem.objects.create(order=self.second, product=self.milk, quantity=3, price=Decimal('1.50'))
+            OrderItem.objects.create(order=self.second, product=self.bread, quantity=1, price=Decimal('1.20'))
+            OrderItem.objects.create(order=self.second, product=self.unmapped, quantity=1, price=Decimal('4.00'))
+            pending = Order.objects.create(user=self.user, status='pending')
+            OrderItem.objects.create(order=pending, product=self.milk, quantity=10, price=Decimal('1.50'))
+
+    def test_groups_demand_per_supplier_and_product(self):
+        purchase_orders = generate_purchase_orders(user=self.user)
+
+        self.assertEqual(len(purchase_orders), 2)
+        bestway_po = PurchaseOrder.objects.get(supplier=self.bestway)
+        lines = {line.product_id: line for line in bestway_po.lines.all()}
+        self.assertEqual(set(lines), {self.milk.id, self.bread.id})
+        self.assertEqual(lines[self.milk.id].quantity, 5)
+        self.assertEqual(lines[self.milk.id].orders_count, 2)
+        self.assertEqual(lines[self.milk.id].unit_cost, Decimal('1.10'))
+        self.assertEqual(lines[self.milk.id].supplier_sku, 'BW-MILK')
+        self.assertEqual(bestway_po.created_by, self.user)
+        self.assertEqual(PurchaseOrder.objects.get(supplier=self.booker).lines.get().quantity, 1)
+
+    def test_marks_items_and_moves_fully_sourced_orders(self):
+        generate_purchase_orders(user=self.user)
+
+        first_items = OrderItem.objects.filter(order=self.first)
+        self.assertTrue(all(item.supplier_completed for item in first_items))
+        self.assertTrue(all(item.purchase_order_id for item in first_items))
+        self.assertFalse(OrderItem.objects.get(product=self.unmapped).supplier_completed)
+        self.assertFalse(OrderItem.objects.get(order__status='pending').supplier_completed)
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.status, 'processed')
+        self.assertEqual(self.second.status, 'paid')
+
+    def test_second_run_does_not_duplicate_demand(self):
+        generate_purchase_orders(user=self.user)
+        self.assertEqual(generate_purchase_orders(user=self.user), [])
+        self.assertEqual(PurchaseOrder.objects.count(), 2)
+
+    def test_report_version_moves_only_after_commit(self):
+        version = PaidOrdersVersion.current()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            generate_purchase_orders(user=self.user)
+            self.assertEqual(PaidOrdersVersion.current(), version)
+        self.assertIn(PaidOrdersVersion.bump, callbacks)
+        self.assertGreater(PaidOrdersVersion.current(), version)
+
+    def test_query_count_does_not_grow_with_items(self):
+        # The paid-orders version bump runs on commit, outside this count.
+        with self.assertNumQueries(8):
+            generate_purchase_orders(user=self.user)
+
+    def test_csv_export_lists_lines(self):
+        generate_purchase_orders(user=self.user)
+        stream = StringIO()
+        write_purchase_order_csv(PurchaseOrder.objects.get(supplier=self.bestway), stream)
+        rows = stream.getvalue().splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertIn('BW-BREAD', rows[1])
+        self.assertIn('5.50', rows[2])
+
+    def test_staff_views_generate_and_download(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('_product_management:generate_purchase_orders'))
+        self.assertRedirects(response, reverse('_product_management:purchase_orders'))
+
+        response = self.client.get(reverse('_product_management:purchase_orders'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['unmapped_products_count'], 1)
 
-# Create your tests here.
+        po = PurchaseOrder.objects.get(supplier=self.booker)
+        response = self.client.get(reverse('_product_management:purchase_order_csv', args=[po.id]))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(b'BK-EGGS', response.content)